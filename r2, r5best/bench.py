@@ -0,0 +1,455 @@
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import struct
+import zipfile
+import argparse
+import platform
+import subprocess
+import statistics
+import tempfile
+from datetime import datetime
+
+from scan_engine import Scanner, check_file_integrity, detect_type
+from recovery_engine import recover_files
+from duplicates import find_duplicates
+
+# Kinds of sample files the generator writes, with their relative weight
+SAMPLE_KINDS = {
+    "jpg": 3,
+    "png": 3,
+    "zip": 1,
+    "pdf": 2,
+    "txt": 3,
+    "bin": 2,
+}
+
+STAGES = ["walk", "validate", "detect", "scan", "duplicates", "recover", "startup"]
+
+# Stages that need the synthetic tree
+TREE_STAGES = STAGES[:-1]
+
+# A stage is a regression once it runs this much slower than the baseline
+DEFAULT_TOLERANCE = 0.25
+
+# Stages faster than this are too noisy to compare against a baseline
+MIN_COMPARABLE_SECONDS = 0.05
+
+# Seconds from launch until the main window is drawn, starting cold
+STARTUP_BUDGET = 1.0
+
+# Run in a fresh interpreter: import the GUI, then build and draw the main window once
+STARTUP_PROBE = """
+import json, sys, time
+import r5
+imported = time.time()
+ready = None
+try:
+    import tkinter as tk
+    root = tk.Tk()
+    app = r5.DataRescueProX(root)
+    root.update()
+    ready = time.time()
+    app.drive_monitor.stop()
+    root.destroy()
+except Exception as e:
+    print(f"No window: {e}", file=sys.stderr)
+print(json.dumps({"imported": imported, "ready": ready}))
+"""
+
+
+def png_bytes(width, height, rng):
+    """A valid RGB PNG of random pixels, built without PIL"""
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 6))
+            + chunk(b"IEND", b""))
+
+
+def jpeg_bytes(width, height, rng):
+    """A real JPEG when PIL is installed, else a signature-only stand-in"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xFF\xD8\xFF\xE0" + rng.randbytes(width * height) + b"\xFF\xD9"
+    img = Image.frombytes("RGB", (width, height), rng.randbytes(width * height * 3))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def zip_bytes(size, rng):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("data.bin", rng.randbytes(size // 2))
+        archive.writestr("notes.txt", "sample " * (size // 14))
+    return out.getvalue()
+
+
+def pdf_bytes(size, rng):
+    text = " ".join(rng.choice(("data", "rescue", "sector", "cluster", "inode")) for _ in range(size // 7))
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    return (b"%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+            b"2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n"
+            b"3 0 obj << /Type /Page /Parent 2 0 R /Contents 4 0 R >> endobj\n"
+            + f"4 0 obj << /Length {len(stream)} >> stream\n".encode() + stream
+            + b"\nendstream endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n")
+
+
+def corrupt(data, rng):
+    """Damage a sample the way failing media does: a bad header or a cut-off tail"""
+    if rng.random() < 0.5:
+        return bytes(rng.randrange(256) for _ in range(8)) + data[8:]
+    return data[:max(1, len(data) // 3)]
+
+
+def sample(kind, size, rng):
+    if kind in ("jpg", "png"):
+        # Roughly `size` bytes of pixels, capped to keep generation quick
+        side = max(8, min(512, int((size / 3) ** 0.5)))
+        return (jpeg_bytes if kind == "jpg" else png_bytes)(side, side, rng)
+    if kind == "zip":
+        return zip_bytes(size, rng)
+    if kind == "pdf":
+        return pdf_bytes(size, rng)
+    if kind == "txt":
+        return ("recoverable text line\n" * (size // 22 + 1)).encode()[:size]
+    return rng.randbytes(size)
+
+
+def generate_tree(root, files=2000, depth=4, fanout=4, median_size=16 * 1024,
+                  size_sigma=1.5, max_size=8 * 1024 * 1024, corrupt_ratio=0.1,
+                  duplicate_ratio=0.05, seed=1):
+    """Write a reproducible synthetic tree and return a description of it
+
+    Directories form a `fanout`-ary tree `depth` levels deep. File sizes are
+    log-normal around `median_size`, and the same seed always gives the same
+    tree. A share of samples is corrupted and another share is byte-identical
+    copies, so every stage has real work to do.
+    """
+    rng = random.Random(seed)
+    directories = [root]
+    level = [root]
+    for d in range(depth):
+        level = [os.path.join(parent, f"d{d}_{i}") for parent in level for i in range(fanout)]
+        directories.extend(level)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    kinds = list(SAMPLE_KINDS)
+    weights = list(SAMPLE_KINDS.values())
+    written = []
+    total_bytes = 0
+    corrupted = 0
+    for i in range(files):
+        if written and rng.random() < duplicate_ratio:
+            kind, data = rng.choice(written)
+        else:
+            kind = rng.choices(kinds, weights)[0]
+            size = min(max_size, max(16, int(rng.lognormvariate(0, size_sigma) * median_size)))
+            data = sample(kind, size, rng)
+            if rng.random() < corrupt_ratio:
+                data = corrupt(data, rng)
+                corrupted += 1
+            written.append((kind, data))
+            if len(written) > 64:
+                written.pop(0)
+
+        path = os.path.join(rng.choice(directories), f"f{i:06d}.{kind}")
+        with open(path, "wb") as f:
+            f.write(data)
+        total_bytes += len(data)
+
+    return {
+        "root": root,
+        "files": files,
+        "directories": len(directories),
+        "bytes": total_bytes,
+        "corrupted": corrupted,
+        "seed": seed,
+    }
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def walk_paths(root):
+    return [os.path.join(folder, name) for folder, _, names in os.walk(root) for name in names]
+
+
+def run_stages(root, dest, stages, algorithm="sha256"):
+    """Time each requested stage once; returns {stage: (seconds, files, bytes)}"""
+    timings = {}
+    paths = walk_paths(root)
+    results = None
+
+    if "walk" in stages:
+        scanner = Scanner(root, max_file_size=None, check_integrity=False,
+                          detect_types=False, perceptual_hash=False)
+        seconds, found = timed(scanner.run)
+        timings["walk"] = (seconds, len(found), scanner.stats["scanned_bytes"])
+
+    if "validate" in stages:
+        def validate():
+            return [check_file_integrity(p, os.path.splitext(p)[1].lower(), perceptual_hash=False)
+                    for p in paths]
+        seconds, statuses = timed(validate)
+        timings["validate"] = (seconds, len(statuses), None)
+
+    if "detect" in stages:
+        seconds, types = timed(lambda: [detect_type(p) for p in paths])
+        timings["detect"] = (seconds, len(types), None)
+
+    if "scan" in stages or "duplicates" in stages or "recover" in stages:
+        scanner = Scanner(root, max_file_size=None)
+        seconds, results = timed(scanner.run)
+        if "scan" in stages:
+            timings["scan"] = (seconds, len(results), scanner.stats["scanned_bytes"])
+
+    if "duplicates" in stages:
+        seconds, groups = timed(lambda: find_duplicates(results))
+        timings["duplicates"] = (seconds, len(results), sum(r["size"] for r in results))
+
+    if "recover" in stages:
+        shutil.rmtree(dest, ignore_errors=True)
+        os.makedirs(dest)
+        seconds, summary = timed(lambda: recover_files(
+            results, dest, scan_root=root, algorithm=algorithm, verify=True,
+            confirm=lambda record: True
+        ))
+        timings["recover"] = (seconds, summary["success"], sum(r["size"] for r in results))
+
+    return timings
+
+
+def parse_importtime(output):
+    """(module, self seconds, cumulative seconds, depth) for each -X importtime line"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(fields[0]) / 1e6, int(fields[1]) / 1e6, depth))
+    return rows
+
+
+def direct_imports(rows, module):
+    """Rows for what `module` imports itself; children are listed just before their parent"""
+    children = []
+    for name, self_seconds, cumulative, depth in rows:
+        if depth == 0:
+            if name == module:
+                return children
+            children = []
+        elif depth == 1:
+            children.append((name, self_seconds, cumulative))
+    return []
+
+
+def measure_startup():
+    """Launch the GUI with an empty bytecode cache and time it until the window is drawn
+
+    Without a display only the imports are timed. The import audit lists
+    the modules r5 imports directly, slowest first.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory(prefix="drx-pycache-") as cache:
+        # Every module is compiled from source, as on a first launch
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        started = time.time()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP_PROBE],
+            cwd=here, env=env, capture_output=True, text=True
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Startup probe failed: {proc.stderr.strip().splitlines()[-1]}")
+    probe = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    rows = parse_importtime(proc.stderr)
+    imports = sorted(direct_imports(rows, "r5"), key=lambda row: -row[2])
+    audit = {
+        "measured": "window" if probe["ready"] else "import",
+        "import_seconds": round(probe["imported"] - started, 6),
+        "window_seconds": round(probe["ready"] - started, 6) if probe["ready"] else None,
+        "modules_imported": len(rows),
+        "slowest_imports": [
+            {"module": name, "self_ms": round(own * 1000, 2), "cumulative_ms": round(total * 1000, 2)}
+            for name, own, total in imports[:10]
+        ],
+    }
+    return (probe["ready"] or probe["imported"]) - started, audit
+
+
+def summarise(runs):
+    """Median and best time per stage across repeated runs, with throughput"""
+    stages = {}
+    for stage in runs[0]:
+        seconds = [run[stage][0] for run in runs]
+        _, files, size = runs[0][stage]
+        median = statistics.median(seconds)
+        entry = {
+            "seconds": round(median, 6),
+            "best_seconds": round(min(seconds), 6),
+            "runs": [round(s, 6) for s in seconds],
+            "files": files,
+            "files_per_sec": round(files / median, 1) if median and files is not None else None,
+        }
+        if size is not None:
+            entry["bytes"] = size
+            entry["mb_per_sec"] = round(size / median / (1024 * 1024), 2) if median else None
+        stages[stage] = entry
+    return stages
+
+
+def compare(stages, baseline, tolerance):
+    """List stages that got slower than the baseline by more than `tolerance`
+
+    A baseline may carry a "thresholds" map of per-stage tolerances that
+    override the command line for noisy stages.
+    """
+    thresholds = baseline.get("thresholds", {})
+    regressions = []
+    for stage, entry in stages.items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before or before["seconds"] < MIN_COMPARABLE_SECONDS:
+            continue
+        allowed = thresholds.get(stage, tolerance)
+        ratio = entry["seconds"] / before["seconds"]
+        entry["baseline_seconds"] = before["seconds"]
+        entry["ratio"] = round(ratio, 3)
+        if ratio > 1 + allowed:
+            regressions.append({"stage": stage, "ratio": round(ratio, 3), "allowed": allowed})
+    return regressions
+
+
+def environment():
+    try:
+        import PIL
+        pillow = PIL.__version__
+    except ImportError:
+        pillow = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pillow": pillow,
+    }
+
+
+def default_workdir():
+    # tmpfs keeps the disk itself out of the numbers unless asked for
+    shm = "/dev/shm"
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        return tempfile.mkdtemp(prefix="drx-bench-", dir=shm)
+    return tempfile.mkdtemp(prefix="drx-bench-")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="bench",
+        description="Time scan, validate, detect, duplicate and recover stages on a synthetic tree, "
+                    "and the cold start of the GUI"
+    )
+    parser.add_argument("--workdir", help="where to build the tree; point it at a mounted loop "
+                                          "image to include a real filesystem (default: tmpfs)")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--median-size", type=int, default=16 * 1024, help="bytes")
+    parser.add_argument("--size-sigma", type=float, default=1.5, help="log-normal spread of file sizes")
+    parser.add_argument("--corrupt-ratio", type=float, default=0.1)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the median is reported")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown as a fraction, e.g. 0.25 for 25%%")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET,
+                        help="seconds the main window may take to appear from a cold start")
+    parser.add_argument("-o", "--output", help="write results JSON here as well as to stdout")
+    parser.add_argument("--keep", action="store_true", help="leave the generated tree in place")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        build_parser().error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    workdir = args.workdir or default_workdir()
+    root = os.path.join(workdir, "tree")
+    dest = os.path.join(workdir, "recovered")
+    try:
+        tree = None
+        runs = [{} for _ in range(args.repeat)]
+        tree_stages = [s for s in stages if s in TREE_STAGES]
+        if tree_stages:
+            seconds, tree = timed(lambda: generate_tree(
+                root, args.files, args.depth, args.fanout, args.median_size, args.size_sigma,
+                corrupt_ratio=args.corrupt_ratio, duplicate_ratio=args.duplicate_ratio, seed=args.seed
+            ))
+            tree["generate_seconds"] = round(seconds, 3)
+            runs = [run_stages(root, dest, tree_stages) for _ in range(args.repeat)]
+
+        startup = None
+        if "startup" in stages:
+            for run in runs:
+                seconds, startup = measure_startup()
+                run["startup"] = (seconds, None, None)
+
+        results = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "environment": environment(),
+            "tree": tree,
+            "stages": summarise(runs),
+        }
+        if startup:
+            # The audit of the last launch; the timing above is the median
+            startup["budget_seconds"] = args.startup_budget
+            results["startup"] = startup
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results["stages"], json.load(f), args.tolerance)
+        results["regressions"] = regressions
+
+    startup_seconds = results["stages"].get("startup", {}).get("seconds")
+    if startup_seconds is not None and startup_seconds > args.startup_budget:
+        regressions.append({"stage": "startup", "seconds": startup_seconds, "budget": args.startup_budget})
+        results["regressions"] = regressions
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
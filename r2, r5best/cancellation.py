@@ -0,0 +1,188 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class Cancelled(Exception):
+    """Raised by a supervised operation when its job is cancelled"""
+
+
+class OperationTimeout(TimeoutError):
+    """Raised when a supervised operation misses its deadline"""
+
+
+class CancelToken:
+    """Pause, resume and cancel one job from any thread
+
+    Calling the token is the `stop()` check the engines already take: it
+    blocks while the job is paused and returns True once it is cancelled.
+    Both waits are on events, so resume() and cancel() take effect at once
+    instead of on the next poll, and cancel() also wakes every supervised
+    operation that is still waiting on a read.
+    """
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.running = threading.Event()
+        self.running.set()
+        # Reentrant so cancel() is safe from a signal handler
+        self.lock = threading.RLock()
+        self.waiters = set()
+
+    def cancel(self):
+        self.cancelled.set()
+        # Wake paused workers so they see the cancellation
+        self.running.set()
+        with self.lock:
+            waiters = list(self.waiters)
+        for waiter in waiters:
+            waiter.set()
+
+    def pause(self):
+        if not self.cancelled.is_set():
+            self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+    def is_paused(self):
+        return not self.running.is_set()
+
+    def __call__(self):
+        """Block while paused, then say whether the job was cancelled"""
+        self.running.wait()
+        return self.cancelled.is_set()
+
+    def add_waiter(self, event):
+        """Have cancel() set `event` too, or set it now if already cancelled"""
+        with self.lock:
+            self.waiters.add(event)
+        if self.cancelled.is_set():
+            event.set()
+
+    def remove_waiter(self, event):
+        with self.lock:
+            self.waiters.discard(event)
+
+
+def wait_for(future, timeout=None, stop=None):
+    """Result of `future` once it finishes, unless the deadline or a cancel comes first"""
+    done = threading.Event()
+    future.add_done_callback(lambda f: done.set())
+    token = stop if isinstance(stop, CancelToken) else None
+    if token is not None:
+        token.add_waiter(done)
+    try:
+        done.wait(timeout)
+    finally:
+        if token is not None:
+            token.remove_waiter(done)
+
+    if future.done():
+        return future.result()
+    if token is not None and token.is_cancelled():
+        raise Cancelled()
+    raise OperationTimeout(f"Operation did not finish within {timeout} seconds")
+
+
+class Supervisor:
+    """Run blocking calls on daemon worker threads that a caller can walk away from
+
+    A read stuck on a failing disk cannot be interrupted from Python, so
+    when call() gives up on one, the worker running it is retired (it
+    exits if the read ever returns) and a fresh worker takes its place.
+    The job carries on and the stuck thread never holds up shutdown.
+    """
+
+    def __init__(self, workers=1, name="supervised"):
+        self.name = name
+        self.tasks = queue.Queue()
+        self.lock = threading.Lock()
+        self.running = {}
+        self.retired = set()
+        self.spawned = 0
+        self.live = 0
+        for _ in range(workers):
+            self.spawn()
+
+    def spawn(self):
+        with self.lock:
+            self.spawned += 1
+            self.live += 1
+            number = self.spawned
+        threading.Thread(target=self.work, name=f"{self.name}-{number}", daemon=True).start()
+
+    def work(self):
+        me = threading.current_thread()
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            future, func, args = task
+            # Registered first, so abandon() always finds a started call
+            with self.lock:
+                self.running[future] = me
+            if not future.set_running_or_notify_cancel():
+                with self.lock:
+                    self.running.pop(future, None)
+                continue
+            try:
+                result = func(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            with self.lock:
+                self.running.pop(future, None)
+                if me in self.retired:
+                    self.retired.discard(me)
+                    self.live -= 1
+                    return
+        with self.lock:
+            self.live -= 1
+
+    def submit(self, func, *args):
+        future = Future()
+        self.tasks.put((future, func, args))
+        return future
+
+    def call(self, func, *args, timeout=None, stop=None):
+        """Run func(*args) on a worker and wait for it, the deadline or a cancel"""
+        if isinstance(stop, CancelToken) and stop.is_cancelled():
+            raise Cancelled()
+        future = self.submit(func, *args)
+        try:
+            return wait_for(future, timeout, stop)
+        except (OperationTimeout, Cancelled):
+            self.abandon(future)
+            raise
+
+    def stats(self):
+        """Calls waiting for a worker, calls being run and live workers"""
+        with self.lock:
+            return {
+                "queued": self.tasks.qsize(),
+                "in_flight": len(self.running),
+                "workers": self.live
+            }
+
+    def abandon(self, future):
+        """Give up on a call, replacing the worker that is stuck in it"""
+        if future.cancel():
+            return
+        with self.lock:
+            worker = self.running.get(future)
+            if worker is None:
+                return
+            self.retired.add(worker)
+        self.spawn()
+
+    def shutdown(self):
+        """Let idle workers exit; workers stuck in a call are left to the OS"""
+        with self.lock:
+            live = self.live
+        for _ in range(live):
+            self.tasks.put(None)
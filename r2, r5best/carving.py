@@ -0,0 +1,246 @@
+import os
+import re
+import logging
+from datetime import datetime
+
+from recovery_io import ExtentReader
+from cancellation import Cancelled, OperationTimeout
+
+logger = logging.getLogger(__name__)
+
+SECTOR_SIZE = 512
+
+# Free space is read in chunks this large; a multiple of the sector size
+CARVE_READ = 16 * 1024 * 1024
+FOOTER_READ = 1024 * 1024
+
+# (extension, mime type, header, footer, bytes after footer, maximum size)
+CARVE_SIGNATURES = [
+    ("jpg", "image/jpeg", b'\xFF\xD8\xFF', b'\xFF\xD9', 0, 32 * 1024 * 1024),
+    ("png", "image/png", b'\x89PNG\r\n\x1A\n', b'IEND\xAE\x42\x60\x82', 0, 64 * 1024 * 1024),
+    ("gif", "image/gif", b'GIF89a', b'\x00\x3B', 0, 16 * 1024 * 1024),
+    ("pdf", "application/pdf", b'%PDF-', b'%%EOF', 0, 256 * 1024 * 1024),
+    ("zip", "application/zip", b'PK\x03\x04', b'PK\x05\x06', 18, 256 * 1024 * 1024),
+    ("7z", "application/x-7z-compressed", b'7z\xBC\xAF\x27\x1C', None, 0, 64 * 1024 * 1024),
+    ("rar", "application/vnd.rar", b'Rar!\x1A\x07', None, 0, 64 * 1024 * 1024),
+    ("doc", "application/msword", b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1', None, 0, 32 * 1024 * 1024),
+    ("sqlite", "application/vnd.sqlite3", b'SQLite format 3\x00', None, 0, 256 * 1024 * 1024),
+]
+
+# translate() tables turning any non-zero byte into a single set bit
+BIT_TABLES = [bytes(1 << bit if b else 0 for b in range(256)) for bit in range(8)]
+
+
+def _byte_free_runs(byte):
+    runs = []
+    for bit in range(8):
+        if byte & (1 << bit):
+            continue
+        if runs and runs[-1][1] == bit:
+            runs[-1][1] = bit + 1
+        else:
+            runs.append([bit, bit + 1])
+    return [tuple(run) for run in runs]
+
+
+# Free (first_bit, end_bit) runs inside each possible bitmap byte
+BYTE_FREE_RUNS = [_byte_free_runs(byte) for byte in range(256)]
+
+
+class AllocationMap:
+    """Compact bitarray of the allocated clusters or blocks of a volume
+
+    Bit n is set when unit n, which starts at `base_offset + n * unit_size`
+    on disk, belongs to a live file or to filesystem metadata.
+    """
+
+    def __init__(self, unit_size, count, bitmap, base_offset=0):
+        self.unit_size = unit_size
+        self.count = count
+        self.bitmap = bytes(bitmap[:-(-count // 8)])
+        self.base_offset = base_offset
+
+    @classmethod
+    def from_flags(cls, unit_size, flags, base_offset=0):
+        """Pack one byte per unit, non-zero meaning allocated, into a bitmap"""
+        count = len(flags)
+        flags = bytes(flags) + bytes(-count % 8)
+        packed = 0
+        for bit in range(8):
+            packed |= int.from_bytes(flags[bit::8].translate(BIT_TABLES[bit]), 'little')
+        return cls(unit_size, count, packed.to_bytes(len(flags) // 8, 'little'), base_offset)
+
+    def allocated(self, unit):
+        if unit < 0 or unit >= self.count:
+            return True
+        return bool(self.bitmap[unit >> 3] & (1 << (unit & 7)))
+
+    def free_runs(self):
+        """Yield (first_unit, end_unit) for every run of free units"""
+        start = end = None
+        # Whole zero bytes are matched in C; only mixed bytes are split by bit
+        for match in re.finditer(rb'\x00+|[^\x00\xFF]', self.bitmap):
+            if match.end() - match.start() > 1 or self.bitmap[match.start()] == 0:
+                pieces = [(match.start() * 8, match.end() * 8)]
+            else:
+                base = match.start() * 8
+                pieces = [
+                    (base + first, base + last)
+                    for first, last in BYTE_FREE_RUNS[self.bitmap[match.start()]]
+                ]
+
+            for first, last in pieces:
+                if start is not None and first == end:
+                    end = last
+                    continue
+                if start is not None:
+                    yield start, min(end, self.count)
+                start, end = first, last
+
+        if start is not None and start < self.count:
+            yield start, min(end, self.count)
+
+    def unallocated_extents(self):
+        """Return free space as (disk_offset, length) extents"""
+        return [
+            (self.base_offset + first * self.unit_size, (end - first) * self.unit_size)
+            for first, end in self.free_runs()
+            if end > first
+        ]
+
+    def free_bytes(self):
+        return sum(length for _, length in self.unallocated_extents())
+
+
+def sqlite_size(header):
+    """Database size from the page size and page count in its header"""
+    if len(header) < 32:
+        return None
+    page_size = int.from_bytes(header[16:18], 'big')
+    if page_size == 1:
+        page_size = 65536
+    return page_size * int.from_bytes(header[28:32], 'big') or None
+
+
+def carve(device_path, allocation=None, mount_root="", stop=None, progress=None):
+    """Carve files by signature out of free space on a device or image
+
+    With an AllocationMap only unallocated runs are read; without one the
+    whole device is scanned. Headers are only accepted on sector boundaries,
+    and carved files never extend past the free run they start in.
+    """
+    reader = ExtentReader(device_path, stop)
+    try:
+        if allocation is not None:
+            extents = allocation.unallocated_extents()
+        else:
+            extents = [(0, reader.size())]
+        return _carve_extents(reader, extents, mount_root, stop, progress)
+    finally:
+        reader.close()
+
+
+def _carve_extents(reader, extents, mount_root, stop, progress):
+    signatures = {sig[2]: sig for sig in CARVE_SIGNATURES}
+    pattern = re.compile(b'|'.join(re.escape(header) for header in signatures))
+    total = sum(length for _, length in extents)
+    done = 0
+    records = []
+
+    for run_start, run_length in extents:
+        run_end = run_start + run_length
+        position = run_start
+        while position < run_end:
+            if stop and stop():
+                return records
+            length = min(CARVE_READ, run_end - position)
+            try:
+                chunk = reader.pread(length, position)
+            except Cancelled:
+                return records
+            except OperationTimeout:
+                # Unreadable area on failing media; carry on past it
+                logger.warning(f"Read of {length} bytes at {position} timed out, skipping")
+                done += length
+                position += length
+                continue
+            next_position = position + len(chunk)
+            skip_until = position
+
+            for match in pattern.finditer(chunk):
+                offset = position + match.start()
+                if offset % SECTOR_SIZE or offset < skip_until:
+                    continue
+                sig = signatures[match.group()]
+                try:
+                    carved = _carved_size(reader, chunk, position, offset, run_end, sig)
+                except Cancelled:
+                    return records
+                except OperationTimeout:
+                    logger.warning(f"Footer search for the file at {offset} timed out, skipping")
+                    continue
+                if not carved:
+                    continue
+                records.append(_carved_record(reader.device_path, mount_root, offset, carved, sig))
+                # Skip over the carved file so embedded thumbnails are not split out
+                skip_until = offset + carved[0]
+                if skip_until >= next_position:
+                    next_position = skip_until
+                    break
+
+            done += next_position - position
+            position = next_position
+            if progress:
+                progress(min(done, total), total)
+
+    logger.info(
+        f"Carved {len(records)} files from {total} bytes of free space on {reader.device_path}"
+    )
+    return records
+
+
+def _carved_size(reader, chunk, chunk_offset, offset, run_end, sig):
+    """Return (size, footer_found) for a carved file starting at `offset`"""
+    ext, mime, header, footer, extra, max_size = sig
+    limit = min(max_size, run_end - offset)
+
+    if ext == "sqlite":
+        size = sqlite_size(chunk[offset - chunk_offset:offset - chunk_offset + 32])
+        return (size, True) if size and size <= limit else None
+    if footer is None:
+        return limit, False
+
+    # Look for the footer in the chunk already read, then keep reading
+    search_from = offset + len(header)
+    buf = chunk[search_from - chunk_offset:]
+    buf_offset = search_from
+    while True:
+        index = buf.find(footer)
+        if index != -1:
+            end = buf_offset + index + len(footer) + extra
+            return (min(end, offset + limit) - offset, True)
+        next_offset = buf_offset + len(buf)
+        if next_offset >= offset + limit:
+            return limit, False
+        # Keep a few bytes so a footer split across reads is still found
+        tail = buf[-(len(footer) - 1):] if len(footer) > 1 else b''
+        buf = tail + reader.pread(min(FOOTER_READ, offset + limit - next_offset), next_offset)
+        buf_offset = next_offset - len(tail)
+
+
+def _carved_record(device_path, mount_root, offset, carved, sig):
+    size, footer_found = carved
+    name = f"carved_{offset:012x}.{sig[0]}"
+    folder = os.path.join(mount_root, "carved")
+    return {
+        "name": name,
+        "path": os.path.join(folder, name),
+        "size": size,
+        "status": "Deleted" if footer_found else "Damaged",
+        "type": sig[1],
+        "modified": datetime.fromtimestamp(0),
+        "folder": folder,
+        "source": device_path,
+        "extents": [(offset, size)],
+        "carved": True
+    }
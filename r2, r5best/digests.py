@@ -0,0 +1,112 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from recovery_io import journal_key, open_record
+
+logger = logging.getLogger(__name__)
+
+DIGEST_ALGORITHMS = ("md5", "sha1")
+DIGEST_BUFFER_SIZE = 4 * 1024 * 1024
+DIGEST_CACHE_ENTRIES = 1024
+
+
+class DigestCancelled(Exception):
+    pass
+
+
+def multi_digest(record, algorithms=DIGEST_ALGORITHMS, cancel=None):
+    """Compute several digests of a scanned file in a single read pass
+
+    Lost files are read from their extents on the source device, since
+    their rebuilt path does not exist.
+    """
+    hashers = [hashlib.new(algorithm) for algorithm in algorithms]
+    buf = bytearray(DIGEST_BUFFER_SIZE)
+    view = memoryview(buf)
+    with open_record(record) as f:
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise DigestCancelled(record["path"])
+            n = f.readinto(buf)
+            if not n:
+                break
+            for hasher in hashers:
+                hasher.update(view[:n])
+    return {algorithm: hasher.hexdigest() for algorithm, hasher in zip(algorithms, hashers)}
+
+
+class DigestService:
+    """Hash files on a background thread, one request at a time
+
+    A new request cancels the one before it. Finished digests are cached by
+    (device, inode, size, mtime), or for lost files by their place on the
+    source device, so revisiting a file is instant.
+    """
+
+    def __init__(self, algorithms=DIGEST_ALGORITHMS, max_entries=DIGEST_CACHE_ENTRIES):
+        self.algorithms = tuple(algorithms)
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.cancel_event = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="digest")
+
+    @staticmethod
+    def cache_key(record):
+        if record.get("extents") is not None:
+            return (journal_key(record), record["size"])
+        st = os.stat(record["path"])
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def cached(self, record):
+        """Return cached digests for a scanned file, or None"""
+        try:
+            key = self.cache_key(record)
+        except OSError:
+            return None
+        with self.lock:
+            digests = self.cache.get(key)
+            if digests is not None:
+                self.cache.move_to_end(key)
+            return digests
+
+    def request(self, record, callback):
+        """Hash a file in the background and call callback(record, digests, error)"""
+        event = threading.Event()
+        with self.lock:
+            if self.cancel_event is not None:
+                self.cancel_event.set()
+            self.cancel_event = event
+        return self.executor.submit(self.run, record, callback, event)
+
+    def run(self, record, callback, event):
+        if event.is_set():
+            return
+        try:
+            digests = self.cached(record)
+            if digests is None:
+                key = self.cache_key(record)
+                digests = multi_digest(record, self.algorithms, event)
+                with self.lock:
+                    self.cache[key] = digests
+                    while len(self.cache) > self.max_entries:
+                        self.cache.popitem(last=False)
+        except DigestCancelled:
+            return
+        except Exception as e:
+            callback(record, None, e)
+            return
+        callback(record, digests, None)
+
+    def cancel(self):
+        with self.lock:
+            if self.cancel_event is not None:
+                self.cancel_event.set()
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
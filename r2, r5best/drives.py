@@ -0,0 +1,220 @@
+import os
+import logging
+import threading
+from concurrent.futures import Future, wait
+
+try:
+    import select
+except ImportError:
+    select = None
+
+logger = logging.getLogger(__name__)
+
+# How long a mount may take to report its free space before it is listed as not responding
+USAGE_TIMEOUT = 2.0
+# Longest wait between two reads of the mount table
+HOTPLUG_INTERVAL = 2.0
+# Linux flags this file with POLLPRI whenever something is mounted or unmounted
+MOUNT_TABLE = "/proc/self/mounts"
+
+
+def list_partitions():
+    """Mounted partitions worth scanning, without optical drives or unformatted volumes"""
+    import psutil
+    return [
+        part for part in psutil.disk_partitions()
+        if 'cdrom' not in part.opts and part.fstype != ''
+    ]
+
+
+def free_space(mountpoint):
+    import psutil
+    return psutil.disk_usage(mountpoint).free
+
+
+class DriveMonitor:
+    """Find mounted drives off the UI thread and follow them as they come and go
+
+    on_drive(drive) is called for each new drive straight away with the
+    state "checking", then again once its free space is known ("ready"),
+    could not be read ("unknown") or has not arrived within `usage_timeout`
+    ("not responding"); a late answer still turns it "ready". Every mount
+    is asked on its own daemon thread, so a hung NFS or CIFS server holds
+    up only its own entry. on_removed(mountpoint) follows unmounts and
+    on_listed(mountpoints) each read of the mount table. Callbacks run on
+    the monitor's threads.
+
+    Where the mount table can be polled (Linux) a mount or unmount wakes
+    the monitor at once; elsewhere it is re-read every `interval` seconds.
+    """
+
+    def __init__(self, on_drive=None, on_removed=None, on_listed=None,
+                 usage_timeout=USAGE_TIMEOUT, interval=HOTPLUG_INTERVAL):
+        self.on_drive = on_drive
+        self.on_removed = on_removed
+        self.on_listed = on_listed
+        self.usage_timeout = usage_timeout
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.drives = {}
+        self.pending = {}
+        self.stopped = threading.Event()
+        self.watcher = MountTableWatcher()
+        self.thread = threading.Thread(target=self.run, name="drive-monitor", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def refresh(self):
+        """Forget every drive and list them all again"""
+        with self.lock:
+            self.drives = {}
+        self.watcher.wake()
+
+    def stop(self):
+        self.stopped.set()
+        self.watcher.wake()
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                try:
+                    self.scan()
+                except Exception as e:
+                    logger.error(f"Failed to list drives: {str(e)}")
+                self.watcher.wait(self.interval)
+        finally:
+            self.watcher.close()
+
+    def scan(self):
+        """Read the mount table and report what changed since the last read"""
+        partitions = {part.mountpoint: part for part in list_partitions()}
+        with self.lock:
+            removed = [mountpoint for mountpoint in self.drives if mountpoint not in partitions]
+            for mountpoint in removed:
+                del self.drives[mountpoint]
+
+            added = []
+            for mountpoint, part in partitions.items():
+                if mountpoint in self.drives:
+                    continue
+                drive = {
+                    "device": part.device,
+                    "mountpoint": mountpoint,
+                    "fstype": part.fstype,
+                    "free": None,
+                    "state": "checking"
+                }
+                self.drives[mountpoint] = drive
+                added.append(dict(drive))
+
+        for mountpoint in removed:
+            if self.on_removed:
+                self.on_removed(mountpoint)
+        for drive in added:
+            if self.on_drive:
+                self.on_drive(drive)
+        if self.on_listed:
+            self.on_listed(list(partitions))
+
+        # Lookups start after "checking" is out, so no answer can overtake it
+        lookups = {}
+        for drive in added:
+            mountpoint = drive["mountpoint"]
+            with self.lock:
+                # A lookup still stuck from an earlier read is waited on, not repeated
+                future = self.pending.get(mountpoint)
+            lookups[mountpoint] = future or self.lookup(mountpoint)
+
+        # Entries fill in as each answer arrives; stragglers are marked here
+        if lookups:
+            _, late = wait(lookups.values(), timeout=self.usage_timeout)
+            for mountpoint, future in lookups.items():
+                if future in late:
+                    logger.warning(f"{mountpoint} did not report its free space within {self.usage_timeout}s")
+                    self.update(mountpoint, state="not responding")
+
+    def lookup(self, mountpoint):
+        """Ask for the free space of a mount on a thread of its own"""
+        future = Future()
+        with self.lock:
+            self.pending[mountpoint] = future
+
+        def ask():
+            try:
+                future.set_result(free_space(mountpoint))
+            except Exception as e:
+                future.set_exception(e)
+
+        future.add_done_callback(lambda f: self.answered(mountpoint, f))
+        threading.Thread(target=ask, name=f"drive-usage {mountpoint}", daemon=True).start()
+        return future
+
+    def answered(self, mountpoint, future):
+        with self.lock:
+            self.pending.pop(mountpoint, None)
+        try:
+            self.update(mountpoint, free=future.result(), state="ready")
+        except Exception as e:
+            logger.warning(f"Cannot read free space of {mountpoint}: {str(e)}")
+            self.update(mountpoint, state="unknown")
+
+    def update(self, mountpoint, **changes):
+        with self.lock:
+            drive = self.drives.get(mountpoint)
+            if drive is None or drive["state"] == "ready":
+                return
+            drive.update(changes)
+            drive = dict(drive)
+        if self.on_drive:
+            self.on_drive(drive)
+
+
+class MountTableWatcher:
+    """Sleep until the mount table changes, wake() is called or time runs out"""
+
+    def __init__(self):
+        self.woken = threading.Event()
+        self.poller = None
+        self.mounts = None
+        self.wake_read = self.wake_write = None
+        if select is not None and hasattr(select, "poll") and os.path.exists(MOUNT_TABLE):
+            try:
+                self.mounts = open(MOUNT_TABLE, "rb")
+                # A pipe lets wake() interrupt the same poll that watches the table
+                self.wake_read, self.wake_write = os.pipe()
+                self.poller = select.poll()
+                self.poller.register(self.mounts, select.POLLPRI)
+                self.poller.register(self.wake_read, select.POLLIN)
+            except OSError as e:
+                logger.debug(f"Cannot watch {MOUNT_TABLE}: {str(e)}")
+                self.close()
+
+    def wake(self):
+        self.woken.set()
+        try:
+            if self.wake_write is not None:
+                os.write(self.wake_write, b"\0")
+        except OSError:
+            pass
+
+    def wait(self, timeout):
+        if self.poller is None:
+            self.woken.wait(timeout)
+        else:
+            # The kernel clears the table's change flag once a poll has reported it
+            for fd, _ in self.poller.poll(timeout * 1000):
+                if fd == self.wake_read:
+                    os.read(self.wake_read, 64)
+        self.woken.clear()
+
+    def close(self):
+        if self.mounts is not None:
+            self.mounts.close()
+        for fd in (self.wake_read, self.wake_write):
+            if fd is not None:
+                os.close(fd)
+        self.mounts = None
+        self.poller = None
+        self.wake_read = self.wake_write = None
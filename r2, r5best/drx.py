@@ -0,0 +1,425 @@
+import os
+import sys
+import csv
+import json
+import time
+import signal
+import logging
+import argparse
+from datetime import datetime
+
+from scan_engine import (
+    Scanner, ScanResult, FILE_CATEGORIES, DEFAULT_MAX_FILE_SIZE, file_types_for, find_parser,
+    carve_free_space, new_scan_stats, count_result, save_results, load_results,
+    FILE_IO_TIMEOUT, TIMED_OUT
+)
+from recovery_engine import RECOVERY_MODES, recover_files
+from metrics import ScanMetrics
+from profiling import PROFILE_MODES, profile_session
+from progress import ProgressEstimator
+from cancellation import CancelToken, Cancelled
+from recovery_io import ExtentReader, ARCHIVE_FORMATS, DEVICE_READ_TIMEOUT, available_hash_algorithms
+from imaging import image_device
+
+logger = logging.getLogger("drx")
+
+EXPORT_FIELDS = ["name", "path", "size", "status", "type", "modified", "folder", "source"]
+
+# Progress lines are throttled so a fast scan does not flood stderr
+PROGRESS_INTERVAL = 0.5
+
+
+class EventLog:
+    """Write progress and log events to stderr as one JSON object per line"""
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.last_progress = 0
+
+    def emit(self, event, **fields):
+        fields["event"] = event
+        fields["time"] = datetime.now().isoformat(timespec="milliseconds")
+        self.stream.write(json.dumps(fields, default=str) + "\n")
+        self.stream.flush()
+
+    def progress(self, stage, force=False, **fields):
+        now = time.monotonic()
+        if force or now - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = now
+            self.emit("progress", stage=stage, **fields)
+
+
+class EventLogHandler(logging.Handler):
+    """Route log records from the engine modules into the event stream"""
+
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def emit(self, record):
+        try:
+            self.events.emit("log", level=record.levelname.lower(), logger=record.name,
+                             message=record.getMessage())
+        except Exception:
+            self.handleError(record)
+
+
+class StopFlag(CancelToken):
+    """Cancel the job on SIGINT/SIGTERM so partial results are kept
+
+    Being a CancelToken, the signal also abandons a device read that is
+    stuck on a failing disk instead of waiting for it to return.
+    """
+
+    def __init__(self):
+        super().__init__()
+        signal.signal(signal.SIGINT, self.stop)
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, self.stop)
+
+    def stop(self, signum=None, frame=None):
+        if self.is_cancelled():
+            # A second interrupt means the user really wants out
+            raise KeyboardInterrupt
+        self.cancel()
+
+
+def setup_logging(events, verbose):
+    handler = EventLogHandler(events)
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(logging.DEBUG if verbose else logging.INFO)
+
+
+def write_summary(summary):
+    json.dump(summary, sys.stdout, default=str, indent=2)
+    sys.stdout.write("\n")
+
+
+def write_results(args, files, scan_stats, drive, events):
+    if args.output:
+        save_results(args.output, files, scan_stats, drive, {"max_file_size": args.max_size})
+        events.emit("saved", path=args.output, files=len(files))
+    return {
+        "drive": drive,
+        "output": args.output,
+        "total_files": scan_stats["total_files"],
+        "recoverable": scan_stats["recoverable"],
+        "damaged": scan_stats["damaged"],
+        "scanned_bytes": scan_stats["scanned_bytes"],
+        "seconds": (scan_stats["end_time"] - scan_stats["start_time"]).total_seconds()
+    }
+
+
+def estimate_fields(estimator):
+    estimate = estimator.estimate()
+    return {
+        "fraction": None if estimate["fraction"] is None else round(estimate["fraction"], 4),
+        "eta": estimate["eta"] and round(estimate["eta"], 1),
+        "eta_low": estimate["eta_low"] and round(estimate["eta_low"], 1),
+        "eta_high": estimate["eta_high"] and round(estimate["eta_high"], 1),
+    }
+
+
+def scanner_callbacks(events, root_path=None):
+    """Scanner callbacks that report through the event stream"""
+    found = 0
+    found_bytes = 0
+    directories = 0
+    walk_estimator = ProgressEstimator.for_volume(root_path) if root_path else None
+    carve_estimator = None
+
+    def on_result(result):
+        nonlocal found, found_bytes
+        found += 1
+        found_bytes += result["size"]
+
+    def on_directory(path, walked):
+        nonlocal directories
+        directories += 1
+        fields = {}
+        if walk_estimator:
+            walk_estimator.update(items=walked + directories, bytes_done=found_bytes)
+            fields = estimate_fields(walk_estimator)
+        events.progress("scan", directory=path, walked=walked, found=found, **fields)
+
+    def on_stage(stage, target):
+        events.emit("stage", stage=stage, device=target)
+
+    def on_carve(done, total):
+        nonlocal carve_estimator
+        if carve_estimator is None or carve_estimator.total_bytes != total:
+            carve_estimator = ProgressEstimator.for_bytes(total)
+        carve_estimator.update(bytes_done=done)
+        events.progress("carve", bytes_done=done, bytes_total=total, **estimate_fields(carve_estimator))
+
+    return dict(on_result=on_result, on_directory=on_directory, on_stage=on_stage, on_carve=on_carve)
+
+
+def scan_metrics(args):
+    return ScanMetrics() if args.metrics else None
+
+
+def run_scanner(args, scanner, drive, events, stop):
+    files = scanner.run()
+    summary = write_results(args, files, scanner.stats, drive, events)
+    summary["stopped"] = stop()
+    if scanner.metrics:
+        scanner.metrics.export(args.metrics)
+        summary["metrics"] = args.metrics
+        summary["bottleneck"] = scanner.metrics.snapshot()["bottleneck"]
+    return summary
+
+
+def cmd_scan(args, events, stop):
+    """Walk a mounted path, optionally searching its device for deleted files"""
+    # Saved results must still point at the right place from another directory
+    path = os.path.abspath(args.path)
+    scanner = Scanner(
+        path,
+        file_types=file_types_for(args.category),
+        max_file_size=args.max_size,
+        perceptual_hash=not args.no_phash,
+        io_timeout=args.io_timeout or None,
+        find_lost=args.lost,
+        device=args.device and os.path.abspath(args.device),
+        deep_scan=args.deep,
+        stop=stop,
+        metrics=scan_metrics(args),
+        **scanner_callbacks(events, path)
+    )
+    return run_scanner(args, scanner, path, events, stop)
+
+
+def cmd_search(args, events, stop):
+    """Search a disk image or raw device for deleted files"""
+    image = os.path.abspath(args.image)
+    scanner = Scanner.for_image(
+        image, args.deep, stop=stop, metrics=scan_metrics(args), **scanner_callbacks(events)
+    )
+    return run_scanner(args, scanner, image, events, stop)
+
+
+def cmd_image(args, events, stop):
+    """Copy a device into an image file, skipping sectors that cannot be read"""
+    estimator = None
+
+    def progress(done, total):
+        nonlocal estimator
+        if estimator is None:
+            estimator = ProgressEstimator.for_bytes(total)
+        estimator.update(bytes_done=done)
+        events.progress("image", bytes_done=done, bytes_total=total, force=done == total,
+                        **estimate_fields(estimator))
+
+    events.emit("stage", stage="image", device=args.device, image=args.output)
+    summary = image_device(args.device, args.output, stop, progress, timeout=args.io_timeout)
+    if summary["bad_ranges"]:
+        summary["errors"] = len(summary["bad_ranges"])
+    return summary
+
+
+def cmd_carve(args, events, stop):
+    """Carve a device for files by signature, skipping allocated space"""
+    device = os.path.abspath(args.device)
+    scan_stats = new_scan_stats()
+    scan_stats["start_time"] = datetime.now()
+
+    parser = None
+    if not args.all:
+        reader = ExtentReader(device, stop)
+        try:
+            parser = find_parser(reader)
+        finally:
+            reader.close()
+
+    on_carve = scanner_callbacks(events)["on_carve"]
+    files = [ScanResult(r) for r in carve_free_space(device, device, parser, [], stop, on_carve)]
+    for record in files:
+        count_result(scan_stats, record)
+    scan_stats["end_time"] = datetime.now()
+
+    summary = write_results(args, files, scan_stats, device, events)
+    summary["stopped"] = stop()
+    return summary
+
+
+def select_records(files, args):
+    """Filter loaded results by the --status and --type options"""
+    extensions = None
+    if args.type:
+        extensions = set()
+        for value in args.type:
+            if value in FILE_CATEGORIES:
+                extensions.update(file_types_for(value) or [])
+            else:
+                extensions.add(value.lower() if value.startswith('.') else f".{value.lower()}")
+
+    selected = []
+    for record in files:
+        if args.status and record["status"] not in args.status:
+            continue
+        if extensions is not None and os.path.splitext(record["name"])[1].lower() not in extensions:
+            continue
+        selected.append(record)
+    return selected
+
+
+def cmd_recover(args, events, stop):
+    """Recover files from a saved .dsr result set"""
+    data = load_results(args.results)
+    records = select_records(data["files"], args)
+    events.emit("stage", stage="recover", files=len(records), mode=args.mode)
+    os.makedirs(args.dest, exist_ok=True)
+
+    def progress(done, total, message):
+        events.progress("recover", done=done, total=total, message=message, force=done == total)
+
+    def confirm(record):
+        if not args.include_damaged:
+            logger.warning(f"Skipping {record['status'].lower()} file {record['path']}")
+        return args.include_damaged
+
+    summary = recover_files(
+        records,
+        args.dest,
+        mode=args.mode,
+        scan_root=data["drive"],
+        algorithm=args.hash,
+        verify=args.verify,
+        archive_format=args.archive_format,
+        compression_threads=os.cpu_count() or 1,
+        skip_duplicates=args.skip_duplicates,
+        confirm=confirm,
+        progress=progress,
+        stop=stop
+    )
+    summary["selected"] = len(records)
+    summary["stopped"] = stop()
+    return summary
+
+
+def cmd_export(args, events, stop):
+    """Write saved results as CSV, JSON or JSON lines"""
+    data = load_results(args.results)
+    files = data["files"]
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            for record in files:
+                writer.writerow(record)
+        elif args.format == "json":
+            json.dump(files, out, default=str, indent=2)
+            out.write("\n")
+        else:
+            for record in files:
+                out.write(json.dumps(record, default=str) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    # The export itself owns stdout unless it went to a file
+    if not args.output:
+        return None
+    return {"output": args.output, "files": len(files), "format": args.format}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="drx",
+        description="DataRescue Pro X without the GUI: scan, image, search, carve, recover and export"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="include debug log events")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="profile the command and write the profile and a Chrome trace to DIR")
+    parser.add_argument("--profiler", default="cprofile", choices=PROFILE_MODES)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", help="scan a mounted path")
+    scan.add_argument("path")
+    scan.add_argument("--category", default="[All Files]", choices=list(FILE_CATEGORIES))
+    scan.add_argument("--max-size", type=int, default=DEFAULT_MAX_FILE_SIZE, help="skip larger files (bytes)")
+    scan.add_argument("--lost", action="store_true", help="also parse the device for deleted files")
+    scan.add_argument("--device", help="device under PATH (found automatically when omitted)")
+    scan.add_argument("--deep", action="store_true", help="carve free space during the lost file search")
+    scan.add_argument("--no-phash", action="store_true", help="skip perceptual hashing of images")
+    scan.add_argument("--io-timeout", type=float, default=FILE_IO_TIMEOUT,
+                      help="seconds each file read may take before it is retried at the end (0 disables)")
+    scan.add_argument("-o", "--output", help="save results to a .dsr file")
+    scan.add_argument("--metrics", help="write scan metrics to a .prom textfile or .json file")
+    scan.set_defaults(func=cmd_scan)
+
+    image = commands.add_parser("image", help="copy a device into an image file")
+    image.add_argument("device")
+    image.add_argument("output", help="image file to write")
+    image.add_argument("--io-timeout", type=float, default=DEVICE_READ_TIMEOUT,
+                       help="seconds a read may take before its chunk is skipped")
+    image.set_defaults(func=cmd_image)
+
+    search = commands.add_parser("search", help="search a disk image or device for deleted files")
+    search.add_argument("image")
+    search.add_argument("--deep", action="store_true", help="carve free space as well")
+    search.add_argument("-o", "--output", help="save results to a .dsr file")
+    search.add_argument("--metrics", help="write scan metrics to a .prom textfile or .json file")
+    search.set_defaults(func=cmd_search, max_size=None)
+
+    carve = commands.add_parser("carve", help="carve a device or image by file signature")
+    carve.add_argument("device")
+    carve.add_argument("--all", action="store_true", help="carve allocated space too")
+    carve.add_argument("-o", "--output", help="save results to a .dsr file")
+    carve.set_defaults(func=cmd_carve, max_size=None)
+
+    recover = commands.add_parser("recover", help="recover files from saved results")
+    recover.add_argument("results", help=".dsr file written by scan, search or carve")
+    recover.add_argument("dest")
+    recover.add_argument("--mode", default=RECOVERY_MODES[0], choices=RECOVERY_MODES)
+    recover.add_argument("--status", action="append", choices=["Good", "Deleted", "Damaged", "Corrupted", TIMED_OUT],
+                         help="only recover files with this status (repeatable)")
+    recover.add_argument("--type", action="append",
+                         help="extension or category such as [Pictures] (repeatable)")
+    recover.add_argument("--hash", default="sha256", choices=available_hash_algorithms())
+    recover.add_argument("--verify", action="store_true", help="re-read and check every copy")
+    recover.add_argument("--archive-format", default="tar.gz", choices=list(ARCHIVE_FORMATS))
+    recover.add_argument("--skip-duplicates", action="store_true")
+    recover.add_argument("--include-damaged", action="store_true",
+                         help="attempt files that failed their integrity check")
+    recover.set_defaults(func=cmd_recover)
+
+    export = commands.add_parser("export", help="export saved results")
+    export.add_argument("results")
+    export.add_argument("-f", "--format", default="csv", choices=["csv", "json", "jsonl"])
+    export.add_argument("-o", "--output", help="write to a file instead of stdout")
+    export.set_defaults(func=cmd_export)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    events = EventLog()
+    setup_logging(events, args.verbose)
+    stop = StopFlag()
+
+    events.emit("start", command=args.command)
+    try:
+        with profile_session(args.command, args.profile, args.profiler):
+            summary = args.func(args, events, stop)
+    except (KeyboardInterrupt, Cancelled):
+        events.emit("error", message="interrupted")
+        return 130
+    except Exception as e:
+        events.emit("error", message=str(e))
+        return 1
+
+    if summary is not None:
+        write_summary(summary)
+    events.emit("done", command=args.command)
+    if stop():
+        return 130
+    return 1 if summary and summary.get("errors") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
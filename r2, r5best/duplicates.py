@@ -0,0 +1,160 @@
+import os
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from recovery_io import ExtentReader, available_hash_algorithms, new_hasher
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_HASH_BYTES = 64 * 1024
+FULL_HASH_BUFFER = 4 * 1024 * 1024
+
+# The fastest hash on hand is good enough to tell copies apart
+DUPLICATE_HASH = "xxhash" if "xxhash" in available_hash_algorithms() else "blake2b"
+
+STATUS_PREFERENCE = {"Good": 0, "Deleted": 1, "Damaged": 2, "Corrupted": 3, "Timed out": 4}
+
+
+class ContentReader:
+    """Read byte ranges of a result record, live file or extent-backed"""
+
+    def __init__(self):
+        self.readers = {}
+        self.lock = threading.Lock()
+
+    def extent_reader(self, source):
+        with self.lock:
+            reader = self.readers.get(source)
+            if reader is None:
+                reader = self.readers[source] = ExtentReader(source)
+            return reader
+
+    def read(self, record, offset, length):
+        """Read `length` bytes of the record's content starting at `offset`"""
+        extents = record.get("extents")
+        if extents is None:
+            with open(record["path"], 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+
+        reader = self.extent_reader(record["source"])
+        parts = []
+        position = 0
+        end = offset + length
+        for disk_offset, extent_length in extents:
+            extent_end = position + extent_length
+            if extent_end > offset and position < end:
+                start = max(offset, position)
+                stop = min(end, extent_end)
+                if disk_offset is None:
+                    parts.append(bytes(stop - start))
+                else:
+                    parts.append(reader.pread(stop - start, disk_offset + start - position))
+            if extent_end >= end:
+                break
+            position = extent_end
+        return b''.join(parts)
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+        self.readers.clear()
+
+
+def partial_digest(content, record):
+    """Hash the first and last 64 KB, which covers small files completely"""
+    size = record["size"]
+    hasher = new_hasher(DUPLICATE_HASH)
+    hasher.update(content.read(record, 0, min(size, PARTIAL_HASH_BYTES)))
+    if size > PARTIAL_HASH_BYTES:
+        tail = max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES)
+        hasher.update(content.read(record, tail, size - tail))
+    return hasher.hexdigest()
+
+
+def full_digest(content, record, stop=None):
+    hasher = new_hasher(DUPLICATE_HASH)
+    if record.get("extents") is None:
+        buf = bytearray(FULL_HASH_BUFFER)
+        view = memoryview(buf)
+        with open(record["path"], 'rb') as f:
+            while True:
+                if stop and stop():
+                    return None
+                n = f.readinto(buf)
+                if not n:
+                    break
+                hasher.update(view[:n])
+    else:
+        for offset in range(0, record["size"], FULL_HASH_BUFFER):
+            if stop and stop():
+                return None
+            hasher.update(content.read(record, offset, min(FULL_HASH_BUFFER, record["size"] - offset)))
+    return hasher.hexdigest()
+
+
+def _refine(groups, digest, records, executor):
+    """Split every candidate group by a digest, keeping groups of two or more"""
+    members = [index for group in groups for index in group]
+
+    def safe_digest(index):
+        try:
+            return digest(records[index])
+        except Exception as e:
+            logger.error(f"Cannot hash {records[index]['path']}: {str(e)}")
+            return None
+
+    digests = dict(zip(members, executor.map(safe_digest, members)))
+    refined = []
+    for group in groups:
+        buckets = defaultdict(list)
+        for index in group:
+            if digests[index] is not None:
+                buckets[digests[index]].append(index)
+        refined.extend(bucket for bucket in buckets.values() if len(bucket) > 1)
+    return refined
+
+
+def find_duplicates(records, workers=None, stop=None):
+    """Group byte-identical records: size, then first/last 64 KB, then full hash
+
+    Returns lists of indexes into `records`, best copy first: the healthiest
+    status wins, then the earliest in the list.
+    """
+    by_size = defaultdict(list)
+    for index, record in enumerate(records):
+        if record["size"] > 0:
+            by_size[record["size"]].append(index)
+    groups = [group for group in by_size.values() if len(group) > 1]
+    candidates = sum(len(group) for group in groups)
+
+    content = ContentReader()
+    workers = workers or min(8, (os.cpu_count() or 1) * 2)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="duplicates") as executor:
+            if groups and not (stop and stop()):
+                groups = _refine(groups, lambda r: partial_digest(content, r), records, executor)
+
+            # Files no bigger than both sampled ends are already fully hashed
+            small = [g for g in groups if records[g[0]]["size"] <= 2 * PARTIAL_HASH_BYTES]
+            large = [g for g in groups if records[g[0]]["size"] > 2 * PARTIAL_HASH_BYTES]
+            if large and not (stop and stop()):
+                large = _refine(large, lambda r: full_digest(content, r, stop), records, executor)
+            groups = small + large
+    finally:
+        content.close()
+
+    if stop and stop():
+        return []
+
+    for group in groups:
+        group.sort(key=lambda i: (STATUS_PREFERENCE.get(records[i]["status"], 4), i))
+    groups.sort(key=lambda group: group[0])
+
+    logger.info(
+        f"Duplicate search: {candidates} same-size candidates, "
+        f"{sum(len(g) - 1 for g in groups)} duplicates in {len(groups)} groups"
+    )
+    return groups
@@ -0,0 +1,430 @@
+import os
+import struct
+import logging
+from datetime import datetime
+
+from recovery_io import ExtentReader
+from carving import AllocationMap
+
+logger = logging.getLogger(__name__)
+
+EXT4_SUPER_MAGIC = 0xEF53
+EXTENT_MAGIC = 0xF30A
+EXTENTS_FL = 0x80000
+INCOMPAT_META_BG = 0x10
+INCOMPAT_64BIT = 0x80
+RO_COMPAT_GDT_CSUM = 0x10
+RO_COMPAT_METADATA_CSUM = 0x400
+BG_INODE_UNINIT = 0x1
+BG_BLOCK_UNINIT = 0x2
+
+S_IFMT = 0xF000
+S_IFREG = 0x8000
+S_IFDIR = 0x4000
+ROOT_INODE = 2
+MAX_EXTENT_DEPTH = 5
+# Uninitialised extents carry this bias in their length field
+EXTENT_INIT_MAX_LEN = 32768
+
+# Inode tables are read in chunks this large rather than inode by inode
+INODE_TABLE_READ = 4 * 1024 * 1024
+
+
+def probe(reader):
+    """Check whether a device or image holds an ext2/3/4 filesystem"""
+    superblock = reader.pread(1024, 1024)
+    return struct.unpack_from('<H', superblock, 0x38)[0] == EXT4_SUPER_MAGIC
+
+
+def align4(n):
+    return (n + 3) & ~3
+
+
+class Ext4Volume:
+    """Read-only ext2/3/4 parser over a raw device or image"""
+
+    def __init__(self, device_path, stop=None):
+        self.device_path = device_path
+        self.reader = ExtentReader(device_path, stop)
+        try:
+            self.read_superblock()
+            self.groups = self.read_group_descriptors()
+        except Exception:
+            self.reader.close()
+            raise
+
+    def read_superblock(self):
+        """Decode the fields of the primary superblock that the scan needs"""
+        sb = self.reader.pread(1024, 1024)
+        if struct.unpack_from('<H', sb, 0x38)[0] != EXT4_SUPER_MAGIC:
+            raise ValueError(f"{self.device_path} is not an ext2/3/4 filesystem")
+
+        self.inodes_count, blocks_lo = struct.unpack_from('<II', sb, 0x0)
+        self.first_data_block, log_block_size = struct.unpack_from('<II', sb, 0x14)
+        self.block_size = 1024 << log_block_size
+        self.blocks_per_group = struct.unpack_from('<I', sb, 0x20)[0]
+        self.inodes_per_group = struct.unpack_from('<I', sb, 0x28)[0]
+        rev_level = struct.unpack_from('<I', sb, 0x4C)[0]
+        self.inode_size = struct.unpack_from('<H', sb, 0x58)[0] if rev_level >= 1 else 128
+        self.feature_incompat, self.feature_ro_compat = struct.unpack_from('<II', sb, 0x60)
+
+        if self.feature_incompat & INCOMPAT_META_BG:
+            raise ValueError("ext4 meta_bg layouts are not supported")
+
+        is_64bit = bool(self.feature_incompat & INCOMPAT_64BIT)
+        blocks_hi = struct.unpack_from('<I', sb, 0x150)[0] if is_64bit else 0
+        self.blocks_count = blocks_lo | (blocks_hi << 32)
+        self.desc_size = (struct.unpack_from('<H', sb, 0xFE)[0] or 32) if is_64bit else 32
+        self.group_count = -(-(self.blocks_count - self.first_data_block) // self.blocks_per_group)
+        # bg_itable_unused is only maintained when group checksums are on
+        self.itable_unused_valid = bool(
+            self.feature_ro_compat & (RO_COMPAT_GDT_CSUM | RO_COMPAT_METADATA_CSUM)
+        )
+
+    def read_group_descriptors(self):
+        """Read the whole group descriptor table in one request"""
+        table_offset = (self.first_data_block + 1) * self.block_size
+        table = self.reader.pread(self.group_count * self.desc_size, table_offset)
+        wide = self.desc_size >= 64
+
+        groups = []
+        for g in range(self.group_count):
+            off = g * self.desc_size
+            block_bitmap, inode_bitmap, inode_table = struct.unpack_from('<III', table, off)
+            flags = struct.unpack_from('<H', table, off + 0x12)[0]
+            itable_unused = struct.unpack_from('<H', table, off + 0x1C)[0]
+            if wide:
+                bb_hi, ib_hi, it_hi = struct.unpack_from('<III', table, off + 0x20)
+                block_bitmap |= bb_hi << 32
+                inode_bitmap |= ib_hi << 32
+                inode_table |= it_hi << 32
+                itable_unused |= struct.unpack_from('<H', table, off + 0x32)[0] << 16
+            groups.append({
+                "block_bitmap": block_bitmap,
+                "inode_bitmap": inode_bitmap,
+                "inode_table": inode_table,
+                "flags": flags,
+                "itable_unused": itable_unused if self.itable_unused_valid else 0
+            })
+        return groups
+
+    def read_bitmaps(self, key, skip_flag):
+        """Read one bitmap block per group, coalesced into large reads"""
+        extents = []
+        for desc in self.groups:
+            if desc["flags"] & skip_flag or not desc[key]:
+                extents.append((None, self.block_size))
+            else:
+                extents.append((desc[key] * self.block_size, self.block_size))
+
+        bitmaps = [None] * len(self.groups)
+        for file_offset, data in self.reader.read_pieces(extents):
+            bitmaps[file_offset // self.block_size] = bytes(data)
+        return bitmaps
+
+    def block_in_use(self, block_bitmaps, block):
+        """Check a block against the allocation bitmaps"""
+        rel = block - self.first_data_block
+        group, index = divmod(rel, self.blocks_per_group)
+        if group < 0 or group >= len(block_bitmaps):
+            return True
+        bitmap = block_bitmaps[group]
+        if bitmap is None:
+            return False
+        return bool(bitmap[index >> 3] & (1 << (index & 7)))
+
+    def iter_inode_tables(self):
+        """Yield (group, first_inode, chunk) over every initialised inode table"""
+        for g, desc in enumerate(self.groups):
+            if desc["flags"] & BG_INODE_UNINIT:
+                continue
+            used = self.inodes_per_group - desc["itable_unused"]
+            table_offset = desc["inode_table"] * self.block_size
+            total = used * self.inode_size
+            chunk_size = INODE_TABLE_READ - INODE_TABLE_READ % self.inode_size
+
+            for start in range(0, total, chunk_size):
+                chunk = self.reader.pread(min(chunk_size, total - start), table_offset + start)
+                first_inode = g * self.inodes_per_group + start // self.inode_size + 1
+                yield g, first_inode, memoryview(chunk)
+
+    def leaf_extents(self, node, level=0):
+        """Walk an extent tree and return (logical, physical, length, initialised)"""
+        magic, entries, max_entries, depth = struct.unpack_from('<HHHH', node, 0)
+        if magic != EXTENT_MAGIC or entries > max_entries or level > MAX_EXTENT_DEPTH:
+            raise ValueError("Invalid extent header")
+
+        leaves = []
+        for k in range(entries):
+            off = 12 + 12 * k
+            if depth == 0:
+                logical, length, start_hi, start_lo = struct.unpack_from('<IHHI', node, off)
+                initialised = length <= EXTENT_INIT_MAX_LEN
+                if not initialised:
+                    length -= EXTENT_INIT_MAX_LEN
+                physical = (start_hi << 32) | start_lo
+                if physical + length > self.blocks_count:
+                    raise ValueError("Extent beyond end of filesystem")
+                leaves.append((logical, physical, length, initialised))
+            else:
+                _, leaf_lo, leaf_hi = struct.unpack_from('<IIH', node, off)
+                child = (leaf_hi << 32) | leaf_lo
+                if child >= self.blocks_count:
+                    raise ValueError("Extent index beyond end of filesystem")
+                leaves.extend(self.leaf_extents(
+                    self.reader.pread(self.block_size, child * self.block_size),
+                    level + 1
+                ))
+        return leaves
+
+    def mapped_blocks(self, i_block, block_count):
+        """Resolve classic ext2/3 block pointers into (logical, physical, 1, True)"""
+        pointers_per_block = self.block_size // 4
+        leaves = []
+
+        def walk(block, depth, logical):
+            if not block or block >= self.blocks_count or logical >= block_count:
+                return logical + pointers_per_block ** depth
+            if depth == 0:
+                leaves.append((logical, block, 1, True))
+                return logical + 1
+            data = self.reader.pread(self.block_size, block * self.block_size)
+            for pointer in struct.unpack_from(f'<{pointers_per_block}I', data):
+                logical = walk(pointer, depth - 1, logical)
+            return logical
+
+        direct = struct.unpack_from('<15I', i_block)
+        logical = 0
+        for pointer in direct[:12]:
+            logical = walk(pointer, 0, logical)
+        for depth, pointer in enumerate(direct[12:], 1):
+            logical = walk(pointer, depth, logical)
+        return leaves
+
+    def inode_leaves(self, raw):
+        """Return the block mapping of an inode, whichever format it uses"""
+        flags = struct.unpack_from('<I', raw, 0x20)[0]
+        i_block = bytes(raw[0x28:0x28 + 60])
+        if flags & EXTENTS_FL:
+            return self.leaf_extents(i_block)
+        size = self.inode_file_size(raw)
+        return self.mapped_blocks(i_block, -(-size // self.block_size))
+
+    def inode_file_size(self, raw):
+        size_lo = struct.unpack_from('<I', raw, 0x4)[0]
+        size_hi = struct.unpack_from('<I', raw, 0x6C)[0]
+        return size_lo | (size_hi << 32)
+
+    def byte_extents(self, leaves, size):
+        """Turn block extents into (disk_offset, length) pieces in file order"""
+        extents = []
+        position = 0
+        for logical, physical, length, initialised in sorted(leaves):
+            start = logical * self.block_size
+            if start >= size:
+                break
+            if start > position:
+                extents.append((None, start - position))
+            byte_length = min(length * self.block_size, size - start)
+            extents.append((physical * self.block_size if initialised else None, byte_length))
+            position = start + byte_length
+        if position < size:
+            extents.append((None, size - position))
+        return extents
+
+
+def parse_directory_block(block, inodes_count):
+    """Return live and deleted (inode, name) entries found in a directory block"""
+    block = bytes(block)
+    live = []
+    deleted = []
+    pos = 0
+    end = len(block)
+
+    while pos + 8 <= end:
+        ino, rec_len, name_len, file_type = struct.unpack_from('<IHBB', block, pos)
+        if rec_len < 8 or rec_len % 4 or pos + rec_len > end:
+            break
+
+        if ino and name_len and 8 + name_len <= rec_len:
+            live.append((ino, bytes(block[pos + 8:pos + 8 + name_len]), file_type))
+
+        # Deleting an entry folds it into its predecessor's rec_len, so the
+        # old header and name survive in the slack after the live name
+        slack = pos + align4(8 + name_len)
+        slack_end = pos + rec_len
+        if slack_end - slack >= 12 and block[slack:slack_end].count(0) != slack_end - slack:
+            while slack + 8 <= slack_end:
+                d_ino, d_rec_len, d_name_len, d_type = struct.unpack_from('<IHBB', block, slack)
+                name_end = slack + 8 + d_name_len
+                if (0 < d_ino <= inodes_count and d_name_len and 1 <= d_type <= 7
+                        and d_rec_len >= 8 + d_name_len and name_end <= slack_end):
+                    name = bytes(block[slack + 8:name_end])
+                    if b'\0' not in name and b'/' not in name:
+                        deleted.append((d_ino, name, d_type))
+                        slack += align4(8 + d_name_len)
+                        continue
+                slack += 4
+
+        pos += rec_len
+
+    return live, deleted
+
+
+def decode_name(raw_name):
+    return raw_name.decode('utf-8', errors='replace')
+
+
+def allocation_map(device_path, stop=None):
+    """Return an AllocationMap of the volume's blocks from its group bitmaps"""
+    volume = Ext4Volume(device_path, stop)
+    try:
+        bitmaps = volume.read_bitmaps("block_bitmap", BG_BLOCK_UNINIT)
+        group_bytes = volume.blocks_per_group // 8
+        bitmap = b''.join((bitmap or bytes(group_bytes))[:group_bytes] for bitmap in bitmaps)
+        return AllocationMap(
+            volume.block_size,
+            volume.blocks_count - volume.first_data_block,
+            bitmap,
+            volume.first_data_block * volume.block_size
+        )
+    finally:
+        volume.reader.close()
+
+
+def scan_deleted(device_path, mount_root="", stop=None):
+    """Find deleted regular files with intact extent trees on an ext volume
+
+    Returns records shaped like the scan results, with the extra keys
+    "source", "extents" and "inode" used by raw recovery.
+    """
+    volume = Ext4Volume(device_path, stop)
+    try:
+        return _scan_volume(volume, mount_root, stop)
+    finally:
+        volume.reader.close()
+
+
+def _scan_volume(volume, mount_root, stop):
+    inode_bitmaps = volume.read_bitmaps("inode_bitmap", BG_INODE_UNINIT)
+    block_bitmaps = volume.read_bitmaps("block_bitmap", BG_BLOCK_UNINIT)
+    isz = volume.inode_size
+
+    candidates = {}
+    directories = {}
+
+    for group, first_inode, chunk in volume.iter_inode_tables():
+        if stop and stop():
+            return []
+        bitmap = inode_bitmaps[group]
+        for index in range(len(chunk) // isz):
+            raw = chunk[index * isz:(index + 1) * isz]
+            mode = struct.unpack_from('<H', raw, 0)[0]
+            kind = mode & S_IFMT
+            if kind not in (S_IFREG, S_IFDIR):
+                continue
+
+            ino = first_inode + index
+            bit = (ino - 1) % volume.inodes_per_group
+            in_use = bitmap is not None and bitmap[bit >> 3] & (1 << (bit & 7))
+            dtime = struct.unpack_from('<I', raw, 0x14)[0]
+
+            if kind == S_IFDIR and in_use and not dtime:
+                directories[ino] = bytes(raw)
+            elif kind == S_IFREG and (not in_use or dtime):
+                size = volume.inode_file_size(raw)
+                flags = struct.unpack_from('<I', raw, 0x20)[0]
+                if size and flags & EXTENTS_FL:
+                    candidates[ino] = bytes(raw)
+
+    logger.info(
+        f"ext scan of {volume.device_path}: {len(candidates)} deleted inodes, "
+        f"{len(directories)} directories"
+    )
+
+    names, deleted_names = _read_directories(volume, directories, stop)
+
+    def build_path(ino, leaf_name):
+        parts = [leaf_name]
+        parent = (names.get(ino) or deleted_names.get(ino) or (None, None))[0]
+        seen = set()
+        while parent and parent != ROOT_INODE and parent not in seen:
+            seen.add(parent)
+            entry = names.get(parent)
+            if not entry:
+                parts.append(f"lost+found_{parent}")
+                break
+            parent, dir_name = entry
+            parts.append(dir_name)
+        if parent is None:
+            parts.append("lost+found")
+        return os.path.join(mount_root, *reversed(parts))
+
+    records = []
+    for ino, raw in candidates.items():
+        try:
+            leaves = volume.inode_leaves(raw)
+        except (ValueError, struct.error):
+            continue
+        if not leaves:
+            continue
+
+        size = volume.inode_file_size(raw)
+        # Blocks handed to another file since deletion mean overwritten data
+        overwritten = any(
+            volume.block_in_use(block_bitmaps, physical)
+            for _, physical, length, initialised in leaves
+            for physical in (physical, physical + length - 1)
+            if initialised
+        )
+        mtime = struct.unpack_from('<I', raw, 0x10)[0]
+        name = deleted_names.get(ino, (None, f"inode_{ino}"))[1]
+        path = build_path(ino, name)
+
+        records.append({
+            "name": name,
+            "path": path,
+            "size": size,
+            "status": "Damaged" if overwritten else "Deleted",
+            "type": None,
+            "modified": datetime.fromtimestamp(mtime),
+            "folder": os.path.dirname(path),
+            "source": volume.device_path,
+            "extents": volume.byte_extents(leaves, size),
+            "inode": ino
+        })
+
+    return records
+
+
+def _read_directories(volume, directories, stop):
+    """Map inodes to (parent, name) from live and deleted directory entries"""
+    extents = []
+    owners = []
+    for ino, raw in directories.items():
+        try:
+            leaves = volume.inode_leaves(raw)
+        except (ValueError, struct.error):
+            continue
+        for logical, physical, length, initialised in leaves:
+            if not initialised:
+                continue
+            for block in range(physical, physical + length):
+                extents.append((block * volume.block_size, volume.block_size))
+                owners.append(ino)
+
+    names = {}
+    deleted_names = {}
+    # One coalesced sweep reads every directory block in disk order
+    for file_offset, data in volume.reader.read_pieces(extents):
+        if stop and stop():
+            break
+        parent = owners[file_offset // volume.block_size]
+        live, deleted = parse_directory_block(data, volume.inodes_count)
+        for ino, raw_name, _ in live:
+            if raw_name not in (b'.', b'..'):
+                names[ino] = (parent, decode_name(raw_name))
+        for ino, raw_name, _ in deleted:
+            deleted_names.setdefault(ino, (parent, decode_name(raw_name)))
+
+    return names, deleted_names
@@ -0,0 +1,449 @@
+import os
+import struct
+import logging
+from array import array
+from datetime import datetime
+
+from recovery_io import ExtentReader
+from carving import AllocationMap
+
+logger = logging.getLogger(__name__)
+
+DELETED_MARKER = 0xE5
+ATTR_VOLUME_ID = 0x08
+ATTR_DIRECTORY = 0x10
+ATTR_LFN = 0x0F
+
+EXFAT_FILE = 0x85
+EXFAT_STREAM = 0xC0
+EXFAT_NAME = 0xC1
+EXFAT_BITMAP = 0x81
+EXFAT_IN_USE = 0x80
+EXFAT_ATTR_DIRECTORY = 0x10
+EXFAT_NO_FAT_CHAIN = 0x02
+
+# Deleted directories have no size; stop following them after this many clusters
+MAX_DELETED_DIR_CLUSTERS = 64
+MAX_DEPTH = 64
+
+# Clears the reserved top nibble of a FAT32 entry's high byte
+FAT32_RESERVED_MASK = bytes(b & 0x0F for b in range(256))
+
+
+def probe(reader):
+    """Check whether a device or image holds a FAT or exFAT filesystem"""
+    boot = reader.pread(512, 0)
+    if boot[3:11] == b'EXFAT   ':
+        return True
+    if boot[510:512] != b'\x55\xAA':
+        return False
+    bytes_per_sector, sectors_per_cluster = struct.unpack_from('<HB', boot, 0x0B)
+    return (bytes_per_sector in (512, 1024, 2048, 4096)
+            and sectors_per_cluster and not sectors_per_cluster & (sectors_per_cluster - 1)
+            and boot[0x10] in (1, 2))
+
+
+def dos_datetime(date, time_):
+    """Convert FAT date/time words, falling back to the epoch on garbage"""
+    try:
+        return datetime(
+            1980 + (date >> 9), (date >> 5) & 0x0F, date & 0x1F,
+            time_ >> 11, (time_ >> 5) & 0x3F, (time_ & 0x1F) * 2
+        )
+    except ValueError:
+        return datetime.fromtimestamp(0)
+
+
+def lfn_checksum(short_name):
+    """Checksum stored in LFN entries for their 8.3 short name"""
+    checksum = 0
+    for byte in short_name:
+        checksum = (((checksum & 1) << 7) + (checksum >> 1) + byte) & 0xFF
+    return checksum
+
+
+def short_name_text(raw):
+    base = raw[:8].decode('ascii', errors='replace').rstrip()
+    ext = raw[8:11].decode('ascii', errors='replace').rstrip()
+    return f"{base}.{ext}" if ext else base
+
+
+class FatVolume:
+    """Read-only FAT12/16/32 and exFAT parser over a raw device or image"""
+
+    def __init__(self, device_path, stop=None):
+        self.device_path = device_path
+        self.reader = ExtentReader(device_path, stop)
+        self.bitmap = None
+        try:
+            boot = self.reader.pread(512, 0)
+            if boot[3:11] == b'EXFAT   ':
+                self.read_exfat_boot(boot)
+            else:
+                self.read_fat_boot(boot)
+            self.fat = self.read_fat()
+        except Exception:
+            self.reader.close()
+            raise
+
+    def read_fat_boot(self, boot):
+        """Decode the BIOS parameter block of a FAT12/16/32 volume"""
+        self.exfat = False
+        bps, spc, reserved, nfats, root_entries, total16, _, fat16 = struct.unpack_from(
+            '<HBHBHHBH', boot, 0x0B
+        )
+        total32 = struct.unpack_from('<I', boot, 0x20)[0]
+        fat_sectors = fat16 or struct.unpack_from('<I', boot, 0x24)[0]
+        total_sectors = total16 or total32
+        root_dir_sectors = (root_entries * 32 + bps - 1) // bps
+
+        self.sector_size = bps
+        self.cluster_size = bps * spc
+        self.fat_offset = reserved * bps
+        self.fat_length = fat_sectors * bps
+        self.root_dir_offset = (reserved + nfats * fat_sectors) * bps
+        self.root_dir_length = root_dir_sectors * bps
+        self.data_offset = self.root_dir_offset + self.root_dir_length
+        self.cluster_count = (total_sectors - self.data_offset // bps) // spc
+
+        if self.cluster_count < 4085:
+            self.fat_bits = 12
+        elif self.cluster_count < 65525:
+            self.fat_bits = 16
+        else:
+            self.fat_bits = 32
+        self.root_cluster = struct.unpack_from('<I', boot, 0x2C)[0] if self.fat_bits == 32 else 0
+        # FAT32 entries are 28 bits wide; the top nibble is reserved
+        self.fat_mask = {12: 0xFFF, 16: 0xFFFF, 32: 0x0FFFFFFF}[self.fat_bits]
+        self.end_of_chain = {12: 0xFF8, 16: 0xFFF8, 32: 0x0FFFFFF8}[self.fat_bits]
+
+    def read_exfat_boot(self, boot):
+        """Decode the main boot region of an exFAT volume"""
+        self.exfat = True
+        self.fat_bits = 32
+        fat_offset, fat_length, heap_offset, cluster_count, root_cluster = struct.unpack_from(
+            '<IIIII', boot, 0x50
+        )
+        bps_shift, spc_shift = boot[0x6C], boot[0x6D]
+        self.sector_size = 1 << bps_shift
+        self.cluster_size = self.sector_size << spc_shift
+        self.fat_offset = fat_offset * self.sector_size
+        self.fat_length = fat_length * self.sector_size
+        self.data_offset = heap_offset * self.sector_size
+        self.cluster_count = cluster_count
+        self.root_cluster = root_cluster
+        self.root_dir_offset = self.root_dir_length = 0
+        self.fat_mask = 0xFFFFFFFF
+        self.end_of_chain = 0xFFFFFFF7
+
+    def read_fat(self):
+        """Load the first FAT into a compact array with one read"""
+        entries = self.cluster_count + 2
+        if self.fat_bits == 12:
+            raw = self.reader.pread((entries * 3 + 1) // 2, self.fat_offset)
+            fat = array('H', bytes(2 * entries))
+            raw += b'\0'
+            for n in range(entries):
+                value = struct.unpack_from('<H', raw, n + (n >> 1))[0]
+                fat[n] = value >> 4 if n & 1 else value & 0x0FFF
+            return fat
+
+        fat = array('H' if self.fat_bits == 16 else 'I')
+        fat.frombytes(self.reader.pread(entries * fat.itemsize, self.fat_offset))
+        return fat
+
+    def cluster_offset(self, cluster):
+        return self.data_offset + (cluster - 2) * self.cluster_size
+
+    def valid_cluster(self, cluster):
+        return 2 <= cluster < self.cluster_count + 2
+
+    def cluster_free(self, cluster):
+        """Check whether a cluster is unallocated right now"""
+        if self.exfat and self.bitmap is not None:
+            index = cluster - 2
+            return not self.bitmap[index >> 3] & (1 << (index & 7))
+        return self.fat[cluster] & self.fat_mask == 0
+
+    def chain(self, start, limit=None):
+        """Follow a live FAT chain and return its clusters"""
+        clusters = []
+        seen = set()
+        cluster = start
+        limit = limit or self.cluster_count
+        while self.valid_cluster(cluster) and cluster not in seen and len(clusters) < limit:
+            seen.add(cluster)
+            clusters.append(cluster)
+            cluster = self.fat[cluster] & self.fat_mask
+            if cluster >= self.end_of_chain:
+                break
+        return clusters
+
+    def cluster_runs(self, clusters, size=None):
+        """Collapse a cluster list into (disk_offset, length) runs in file order"""
+        extents = []
+        for cluster in clusters:
+            offset = self.cluster_offset(cluster)
+            if extents and extents[-1][0] + extents[-1][1] == offset:
+                extents[-1] = (extents[-1][0], extents[-1][1] + self.cluster_size)
+            else:
+                extents.append((offset, self.cluster_size))
+
+        if size is not None:
+            # Trim the slack of the last cluster
+            trimmed = []
+            remaining = size
+            for offset, length in extents:
+                if remaining <= 0:
+                    break
+                trimmed.append((offset, min(length, remaining)))
+                remaining -= length
+            extents = trimmed
+        return extents
+
+    def read_clusters(self, clusters):
+        """Read a directory's clusters, coalescing neighbouring ones"""
+        return b''.join(
+            bytes(data) for _, data in sorted(self.reader.read_pieces(self.cluster_runs(clusters)))
+        )
+
+    def load_bitmap(self, root):
+        """exFAT tracks free clusters in a bitmap rather than in the FAT"""
+        for pos in range(0, len(root) - 31, 32):
+            if root[pos] == EXFAT_BITMAP:
+                first_cluster, length = struct.unpack_from('<IQ', root, pos + 20)
+                clusters = -(-length // self.cluster_size)
+                self.bitmap = self.read_clusters(self.chain(first_cluster, clusters))[:length]
+                return
+
+    def allocation_map(self):
+        """Build an AllocationMap over the data area for the carver"""
+        if self.exfat:
+            if self.bitmap is None:
+                self.load_bitmap(self.read_clusters(self.chain(self.root_cluster)))
+            if self.bitmap is not None:
+                return AllocationMap(self.cluster_size, self.cluster_count, self.bitmap, self.data_offset)
+
+        # A cluster is allocated when any byte of its FAT entry is set
+        raw = self.fat[2:self.cluster_count + 2].tobytes()
+        width = self.fat.itemsize
+        top = raw[width - 1::width]
+        if self.fat_bits == 32:
+            top = top.translate(FAT32_RESERVED_MASK)
+        flags = int.from_bytes(top, 'little')
+        for byte in range(width - 1):
+            flags |= int.from_bytes(raw[byte::width], 'little')
+        return AllocationMap.from_flags(
+            self.cluster_size,
+            flags.to_bytes(self.cluster_count, 'little'),
+            self.data_offset
+        )
+
+
+def scan_deleted(device_path, mount_root="", stop=None):
+    """Find deleted files in FAT/exFAT directories and rebuild their clusters
+
+    Only the FAT and directory clusters are read, never the file data.
+    Deleted files are assumed contiguous from their first cluster, which is
+    how FAT and exFAT allocate unless the volume was fragmented.
+    """
+    volume = FatVolume(device_path, stop)
+    try:
+        if volume.exfat:
+            return _ExfatScan(volume, mount_root, stop).run()
+        return _FatScan(volume, mount_root, stop).run()
+    finally:
+        volume.reader.close()
+
+
+def allocation_map(device_path, stop=None):
+    """Return an AllocationMap of the volume's clusters"""
+    volume = FatVolume(device_path, stop)
+    try:
+        return volume.allocation_map()
+    finally:
+        volume.reader.close()
+
+
+class _FatScan:
+    def __init__(self, volume, mount_root, stop):
+        self.volume = volume
+        self.mount_root = mount_root
+        self.stop = stop
+        self.records = []
+        self.visited = set()
+
+    def run(self):
+        volume = self.volume
+        if volume.fat_bits == 32:
+            root = volume.read_clusters(volume.chain(volume.root_cluster))
+        else:
+            root = volume.reader.pread(volume.root_dir_length, volume.root_dir_offset)
+
+        pending = [(root, self.mount_root, 0)]
+        while pending:
+            if self.stop and self.stop():
+                break
+            data, path, depth = pending.pop()
+            pending.extend(self.parse_directory(data, path, depth))
+
+        logger.info(f"FAT scan of {volume.device_path}: {len(self.records)} deleted files")
+        return self.records
+
+    def parse_directory(self, data, path, depth):
+        """Record deleted files and return subdirectories still to visit"""
+        volume = self.volume
+        subdirs = []
+        lfn_parts = []
+
+        for pos in range(0, len(data) - 31, 32):
+            entry = data[pos:pos + 32]
+            first = entry[0]
+            if first == 0x00:
+                break
+            attr = entry[11]
+
+            if attr == ATTR_LFN:
+                chars = entry[1:11] + entry[14:26] + entry[28:32]
+                lfn_parts.append((entry[13], chars))
+                continue
+
+            parts, lfn_parts = lfn_parts, []
+            if attr & ATTR_VOLUME_ID or entry[:2] in (b'. ', b'..'):
+                continue
+
+            deleted = first == DELETED_MARKER
+            name = self.entry_name(entry, parts, deleted)
+            cluster = struct.unpack_from('<H', entry, 0x1A)[0]
+            if volume.fat_bits == 32:
+                cluster |= struct.unpack_from('<H', entry, 0x14)[0] << 16
+            size = struct.unpack_from('<I', entry, 0x1C)[0]
+            time_, date = struct.unpack_from('<HH', entry, 0x16)
+
+            if attr & ATTR_DIRECTORY:
+                if depth >= MAX_DEPTH or not volume.valid_cluster(cluster) or cluster in self.visited:
+                    continue
+                self.visited.add(cluster)
+                if deleted:
+                    clusters = self.contiguous(cluster, MAX_DELETED_DIR_CLUSTERS)
+                else:
+                    clusters = volume.chain(cluster)
+                subdirs.append((volume.read_clusters(clusters), os.path.join(path, name), depth + 1))
+                continue
+
+            if deleted and size and volume.valid_cluster(cluster):
+                self.add_record(name, path, cluster, size, dos_datetime(date, time_))
+
+        return subdirs
+
+    def entry_name(self, entry, parts, deleted):
+        """Prefer the long name; a deleted short name has lost its first byte"""
+        short = bytearray(entry[:11])
+        if parts:
+            text = b''.join(chars for _, chars in reversed(parts))
+            name = text.decode('utf-16-le', errors='replace').split('\x00')[0].rstrip('￿')
+            checksums = {checksum for checksum, _ in parts}
+            if not deleted and lfn_checksum(short) in checksums:
+                return name
+            if deleted and name:
+                short[0] = ord(name[0].upper()) if name[0].isascii() else short[0]
+                if lfn_checksum(short) in checksums:
+                    return name
+        if deleted:
+            short[0] = ord('_')
+        return short_name_text(bytes(short))
+
+    def contiguous(self, cluster, count):
+        """Rebuild a deleted file's chain as a contiguous cluster run"""
+        end = min(cluster + count, self.volume.cluster_count + 2)
+        return list(range(cluster, end))
+
+    def add_record(self, name, folder, cluster, size, modified):
+        volume = self.volume
+        count = -(-size // volume.cluster_size)
+        clusters = self.contiguous(cluster, count)
+        if len(clusters) < count:
+            return
+        overwritten = not all(volume.cluster_free(c) for c in clusters)
+        path = os.path.join(folder, name)
+        self.records.append({
+            "name": name,
+            "path": path,
+            "size": size,
+            "status": "Damaged" if overwritten else "Deleted",
+            "type": None,
+            "modified": modified,
+            "folder": folder,
+            "source": volume.device_path,
+            "extents": volume.cluster_runs(clusters, size),
+            "cluster": cluster
+        })
+
+
+class _ExfatScan(_FatScan):
+    def run(self):
+        volume = self.volume
+        root = volume.read_clusters(volume.chain(volume.root_cluster))
+        volume.load_bitmap(root)
+
+        pending = [(root, self.mount_root, 0)]
+        while pending:
+            if self.stop and self.stop():
+                break
+            data, path, depth = pending.pop()
+            pending.extend(self.parse_directory(data, path, depth))
+
+        logger.info(f"exFAT scan of {volume.device_path}: {len(self.records)} deleted files")
+        return self.records
+
+    def parse_directory(self, data, path, depth):
+        volume = self.volume
+        subdirs = []
+        pos = 0
+        end = len(data) - 31
+
+        while pos < end:
+            entry_type = data[pos]
+            if entry_type == 0x00:
+                break
+            # File entry sets start with 0x85, or 0x05 once deleted
+            if entry_type & 0x7F != EXFAT_FILE & 0x7F:
+                pos += 32
+                continue
+
+            deleted = not entry_type & EXFAT_IN_USE
+            secondary_count = data[pos + 1]
+            attributes = struct.unpack_from('<H', data, pos + 4)[0]
+            timestamp = struct.unpack_from('<I', data, pos + 12)[0]
+            stream_pos = pos + 32
+            set_end = pos + 32 * (secondary_count + 1)
+            if secondary_count < 2 or set_end > len(data) or data[stream_pos] & 0x7F != EXFAT_STREAM & 0x7F:
+                pos += 32
+                continue
+
+            flags, _, name_length = struct.unpack_from('<BBB', data, stream_pos + 1)
+            cluster, size = struct.unpack_from('<IQ', data, stream_pos + 20)
+            name = ''.join(
+                data[p + 2:p + 32].decode('utf-16-le', errors='replace')
+                for p in range(stream_pos + 32, set_end, 32)
+                if data[p] & 0x7F == EXFAT_NAME & 0x7F
+            )[:name_length]
+            modified = dos_datetime(timestamp >> 16, timestamp & 0xFFFF)
+            pos = set_end
+
+            if attributes & EXFAT_ATTR_DIRECTORY:
+                if depth >= MAX_DEPTH or not volume.valid_cluster(cluster) or cluster in self.visited:
+                    continue
+                self.visited.add(cluster)
+                count = -(-size // volume.cluster_size) or MAX_DELETED_DIR_CLUSTERS
+                if deleted or flags & EXFAT_NO_FAT_CHAIN:
+                    clusters = self.contiguous(cluster, count)
+                else:
+                    clusters = volume.chain(cluster)
+                subdirs.append((volume.read_clusters(clusters), os.path.join(path, name), depth + 1))
+                continue
+
+            if deleted and size and volume.valid_cluster(cluster):
+                self.add_record(name, path, cluster, size, modified)
+
+        return subdirs
@@ -0,0 +1,420 @@
+import os
+import bisect
+import struct
+import logging
+from datetime import datetime, timedelta, timezone
+
+from recovery_io import ExtentReader
+from carving import AllocationMap
+
+logger = logging.getLogger(__name__)
+
+MFT_RECORD_IN_USE = 0x01
+MFT_RECORD_IS_DIRECTORY = 0x02
+
+ATTR_STANDARD_INFORMATION = 0x10
+ATTR_FILE_NAME = 0x30
+ATTR_DATA = 0x80
+ATTR_END = 0xFFFFFFFF
+
+NAMESPACE_DOS = 2
+ROOT_RECORD = 5
+BITMAP_RECORD = 6
+# Update sequence fixups cover 512-byte strides whatever the sector size
+FIXUP_STRIDE = 512
+
+# The MFT is streamed in chunks this large
+MFT_READ = 16 * 1024 * 1024
+
+FILETIME_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+
+# Lookup tables used to pick interesting records out of a chunk in C
+SIGNATURE_MASK = bytes(1 if b == ord('F') else 0 for b in range(256))
+FLAGS_MASK = bytes(
+    1 if not b & MFT_RECORD_IN_USE or b & MFT_RECORD_IS_DIRECTORY else 0 for b in range(256)
+)
+
+
+def probe(reader):
+    """Check whether a device or image holds an NTFS filesystem"""
+    return reader.pread(8, 3) == b'NTFS    '
+
+
+def filetime_to_datetime(filetime):
+    """Local time of a FILETIME, naive like the other parsers' timestamps
+
+    FILETIMEs count from 1601 in UTC, so they are converted rather than
+    read as local time.
+    """
+    try:
+        utc = FILETIME_EPOCH + timedelta(microseconds=filetime // 10)
+        return utc.astimezone().replace(tzinfo=None)
+    except (OverflowError, OSError, ValueError):
+        return datetime.fromtimestamp(0)
+
+
+def decode_runlist(data, offset):
+    """Decode an NTFS data-run list into (lcn, cluster_count) pairs
+
+    Sparse runs come back with an lcn of None.
+    """
+    runs = []
+    lcn = 0
+    while offset < len(data):
+        header = data[offset]
+        if header == 0:
+            break
+        length_size = header & 0x0F
+        offset_size = header >> 4
+        offset += 1
+        count = int.from_bytes(data[offset:offset + length_size], 'little')
+        offset += length_size
+        if offset_size:
+            lcn += int.from_bytes(data[offset:offset + offset_size], 'little', signed=True)
+            runs.append((lcn, count))
+        else:
+            runs.append((None, count))
+        offset += offset_size
+    return runs
+
+
+def apply_fixups(record):
+    """Restore the sector-end bytes an MFT record stores in its update array
+
+    Returns the fixed record, or None if a sector was torn.
+    """
+    usa_offset, usa_count = struct.unpack_from('<HH', record, 4)
+    if usa_count < 2 or usa_offset + usa_count * 2 > len(record):
+        return None
+    fixed = bytearray(record)
+    usn = record[usa_offset:usa_offset + 2]
+    for i in range(1, usa_count):
+        end = i * FIXUP_STRIDE
+        if end > len(fixed):
+            break
+        if fixed[end - 2:end] != usn:
+            return None
+        fixed[end - 2:end] = record[usa_offset + i * 2:usa_offset + i * 2 + 2]
+    return fixed
+
+
+def iter_attributes(record):
+    """Yield (type, attribute_offset) for each attribute in a fixed-up record"""
+    offset = struct.unpack_from('<H', record, 0x14)[0]
+    while offset + 8 <= len(record):
+        attr_type, length = struct.unpack_from('<II', record, offset)
+        if attr_type == ATTR_END or length < 16 or offset + length > len(record):
+            break
+        yield attr_type, offset
+        offset += length
+
+
+class NtfsVolume:
+    """Read-only NTFS parser that bulk-decodes the MFT of a device or image"""
+
+    def __init__(self, device_path, stop=None):
+        self.device_path = device_path
+        self.reader = ExtentReader(device_path, stop)
+        try:
+            self.read_boot_sector()
+            self.mft_runs = self.read_mft_runs()
+        except Exception:
+            self.reader.close()
+            raise
+
+    def read_boot_sector(self):
+        """Decode cluster geometry and the location of $MFT"""
+        boot = self.reader.pread(512, 0)
+        if boot[3:11] != b'NTFS    ':
+            raise ValueError(f"{self.device_path} is not an NTFS filesystem")
+
+        bps, spc = struct.unpack_from('<HB', boot, 0x0B)
+        # Values above 0x80 encode 2^(256 - n) sectors on large-cluster volumes
+        sectors_per_cluster = 1 << (256 - spc) if spc > 0x80 else spc
+        self.sector_size = bps
+        self.cluster_size = bps * sectors_per_cluster
+        self.total_sectors, self.mft_lcn = struct.unpack_from('<QQ', boot, 0x28)
+        self.cluster_count = self.total_sectors * bps // self.cluster_size
+
+        clusters_per_record = struct.unpack_from('<b', boot, 0x40)[0]
+        if clusters_per_record < 0:
+            self.record_size = 1 << -clusters_per_record
+        else:
+            self.record_size = clusters_per_record * self.cluster_size
+
+    def read_mft_runs(self):
+        """Read $MFT's own record to find every fragment of the MFT"""
+        record = apply_fixups(self.reader.pread(self.record_size, self.mft_lcn * self.cluster_size))
+        if record is None or record[:4] != b'FILE':
+            raise ValueError("Unreadable $MFT record")
+
+        data_size, runs = self.data_runs(record)
+        if not runs:
+            raise ValueError("$MFT has no data runs")
+
+        # Map MFT byte positions to disk offsets for later lookups
+        self.mft_starts = []
+        self.mft_disk = []
+        position = 0
+        for lcn, count in runs:
+            self.mft_starts.append(position)
+            self.mft_disk.append(None if lcn is None else lcn * self.cluster_size)
+            position += count * self.cluster_size
+        self.mft_size = min(position, data_size)
+        return runs
+
+    def data_runs(self, record):
+        """Return the real size and run list of a record's unnamed $DATA"""
+        for attr_type, offset in iter_attributes(record):
+            if attr_type == ATTR_DATA and record[offset + 8] and not record[offset + 9]:
+                runlist_offset = struct.unpack_from('<H', record, offset + 32)[0]
+                size = struct.unpack_from('<Q', record, offset + 48)[0]
+                length = struct.unpack_from('<I', record, offset + 4)[0]
+                return size, decode_runlist(record[offset:offset + length], runlist_offset)
+        return 0, []
+
+    def mft_disk_offset(self, position):
+        """Translate a byte position inside the MFT to a disk offset"""
+        index = bisect.bisect_right(self.mft_starts, position) - 1
+        base = self.mft_disk[index]
+        return None if base is None else base + position - self.mft_starts[index]
+
+    def iter_mft_chunks(self):
+        """Stream the MFT fragment by fragment in large sequential reads"""
+        chunk_size = MFT_READ - MFT_READ % self.record_size
+        position = 0
+        for lcn, count in self.mft_runs:
+            run_bytes = count * self.cluster_size
+            start = 0
+            while start < run_bytes and position + start < self.mft_size:
+                length = min(chunk_size, run_bytes - start, self.mft_size - position - start)
+                length -= length % self.record_size
+                if length <= 0:
+                    break
+                if lcn is None:
+                    data = bytes(length)
+                else:
+                    data = self.reader.pread(length, lcn * self.cluster_size + start)
+                yield position + start, data
+                start += length
+            position += run_bytes
+
+    def read_bitmap(self):
+        """Load the volume's $Bitmap so reused clusters can be detected"""
+        position = BITMAP_RECORD * self.record_size
+        disk_offset = self.mft_disk_offset(position)
+        if disk_offset is None:
+            return None
+        record = apply_fixups(self.reader.pread(self.record_size, disk_offset))
+        if record is None:
+            return None
+        _, runs = self.data_runs(record)
+        size = -(-self.cluster_count // 8)
+        extents = [
+            (None if lcn is None else lcn * self.cluster_size, count * self.cluster_size)
+            for lcn, count in runs
+        ]
+        bitmap = bytearray(sum(length for _, length in extents))
+        for file_offset, data in self.reader.read_pieces(extents):
+            bitmap[file_offset:file_offset + len(data)] = data
+        return bytes(bitmap[:size])
+
+    def resident_extents(self, position, content_offset, length):
+        """Map resident attribute bytes back onto the raw MFT record on disk
+
+        The last two bytes of every 512-byte stride live in the record's
+        update sequence array on disk, so those pieces point there instead.
+        """
+        record_disk = [
+            self.mft_disk_offset(position + s)
+            for s in range(0, self.record_size, FIXUP_STRIDE)
+        ]
+        if None in record_disk:
+            return None
+        usa_offset = struct.unpack_from(
+            '<H', self.reader.pread(2, record_disk[0] + 4)
+        )[0]
+
+        extents = []
+        pos = content_offset
+        end = content_offset + length
+        while pos < end:
+            sector, within = divmod(pos, FIXUP_STRIDE)
+            fixup_start = FIXUP_STRIDE - 2
+            if within < fixup_start:
+                piece = min(end - pos, fixup_start - within)
+                extents.append((record_disk[sector] + within, piece))
+            else:
+                piece = min(end - pos, FIXUP_STRIDE - within)
+                usa_entry = usa_offset + 2 * (sector + 1) + within - fixup_start
+                extents.append((record_disk[0] + usa_entry, piece))
+            pos += piece
+        return extents
+
+
+def parse_record(record):
+    """Pull names, timestamps and the unnamed $DATA attribute out of a record"""
+    info = {"names": [], "modified": None, "data": None}
+    for attr_type, offset in iter_attributes(record):
+        non_resident = record[offset + 8]
+        name_length = record[offset + 9]
+
+        if attr_type == ATTR_STANDARD_INFORMATION and not non_resident:
+            content = offset + struct.unpack_from('<H', record, offset + 20)[0]
+            info["modified"] = struct.unpack_from('<Q', record, content + 8)[0]
+
+        elif attr_type == ATTR_FILE_NAME and not non_resident:
+            content = offset + struct.unpack_from('<H', record, offset + 20)[0]
+            parent_ref = struct.unpack_from('<Q', record, content)[0]
+            chars, namespace = record[content + 0x40], record[content + 0x41]
+            name = bytes(record[content + 0x42:content + 0x42 + chars * 2]).decode(
+                'utf-16-le', errors='replace'
+            )
+            info["names"].append((namespace, parent_ref & 0xFFFFFFFFFFFF, parent_ref >> 48, name))
+
+        elif attr_type == ATTR_DATA and not name_length:
+            if non_resident:
+                if struct.unpack_from('<Q', record, offset + 16)[0]:
+                    # Only the first fragment of $DATA lives here
+                    continue
+                runlist_offset = struct.unpack_from('<H', record, offset + 32)[0]
+                size = struct.unpack_from('<Q', record, offset + 48)[0]
+                length = struct.unpack_from('<I', record, offset + 4)[0]
+                info["data"] = ("runs", size, decode_runlist(record[offset:offset + length], runlist_offset))
+            else:
+                size = struct.unpack_from('<I', record, offset + 16)[0]
+                content = offset + struct.unpack_from('<H', record, offset + 20)[0]
+                info["data"] = ("resident", size, content)
+    return info
+
+
+def best_name(names):
+    """Prefer Win32/POSIX names over the 8.3 DOS alias"""
+    if not names:
+        return None
+    return sorted(names, key=lambda n: n[0] == NAMESPACE_DOS)[0]
+
+
+def allocation_map(device_path, stop=None):
+    """Return an AllocationMap of the volume's clusters from $Bitmap"""
+    volume = NtfsVolume(device_path, stop)
+    try:
+        bitmap = volume.read_bitmap()
+        if bitmap is None:
+            return None
+        return AllocationMap(volume.cluster_size, volume.cluster_count, bitmap)
+    finally:
+        volume.reader.close()
+
+
+def scan_deleted(device_path, mount_root="", stop=None):
+    """Enumerate deleted files from the MFT with reconstructed paths"""
+    volume = NtfsVolume(device_path, stop)
+    try:
+        return _scan_volume(volume, mount_root, stop)
+    finally:
+        volume.reader.close()
+
+
+def _scan_volume(volume, mount_root, stop):
+    rs = volume.record_size
+    directories = {}
+    deleted = []
+
+    for position, chunk in volume.iter_mft_chunks():
+        if stop and stop():
+            return []
+
+        # Pick records that are FILE records and either free or directories
+        # using whole-chunk byte ops rather than a Python test per record
+        count = len(chunk) // rs
+        signatures = chunk[0::rs].translate(SIGNATURE_MASK)[:count]
+        flags = chunk[0x16::rs].translate(FLAGS_MASK)[:count]
+        wanted = (int.from_bytes(signatures, 'big') & int.from_bytes(flags, 'big')).to_bytes(count, 'big')
+
+        index = wanted.find(1)
+        while index != -1:
+            record = apply_fixups(chunk[index * rs:(index + 1) * rs])
+            if record is not None and record[:4] == b'FILE' and not any(record[0x20:0x26]):
+                number = (position // rs) + index
+                sequence = struct.unpack_from('<H', record, 0x10)[0]
+                record_flags = struct.unpack_from('<H', record, 0x16)[0]
+                info = parse_record(record)
+                name = best_name(info["names"])
+
+                if record_flags & MFT_RECORD_IS_DIRECTORY:
+                    if name and record_flags & MFT_RECORD_IN_USE:
+                        directories[number] = (name[1], name[2], name[3], sequence)
+                elif name and info["data"]:
+                    deleted.append((number, position + index * rs, name, info))
+            index = wanted.find(1, index + 1)
+
+    logger.info(
+        f"NTFS scan of {volume.device_path}: {len(deleted)} deleted files, "
+        f"{len(directories)} directories"
+    )
+
+    bitmap = volume.read_bitmap()
+
+    def cluster_in_use(lcn):
+        if bitmap is None or lcn >= volume.cluster_count:
+            return False
+        return bool(bitmap[lcn >> 3] & (1 << (lcn & 7)))
+
+    def build_path(parent, parent_sequence, leaf):
+        parts = [leaf]
+        seen = set()
+        while parent != ROOT_RECORD:
+            entry = directories.get(parent)
+            # A changed sequence number means the parent slot was reused
+            if entry is None or entry[3] != parent_sequence or parent in seen:
+                parts.append(f"lost+found_{parent}")
+                break
+            seen.add(parent)
+            parent, parent_sequence, dir_name = entry[0], entry[1], entry[2]
+            parts.append(dir_name)
+        return os.path.join(mount_root, *reversed(parts))
+
+    records = []
+    for number, position, name, info in deleted:
+        kind, size, payload = info["data"]
+        if kind == "resident":
+            # An empty file has no bytes to map; it is recovered as empty
+            extents = volume.resident_extents(position, payload, size) if size else []
+            if extents is None:
+                continue
+            overwritten = False
+        else:
+            extents = []
+            remaining = size
+            overwritten = False
+            for lcn, count in payload:
+                if remaining <= 0:
+                    break
+                length = min(count * volume.cluster_size, remaining)
+                if lcn is None:
+                    extents.append((None, length))
+                else:
+                    if lcn + count > volume.cluster_count:
+                        break
+                    extents.append((lcn * volume.cluster_size, length))
+                    overwritten = overwritten or cluster_in_use(lcn) or cluster_in_use(lcn + count - 1)
+                remaining -= length
+            if remaining > 0 or not size:
+                continue
+
+        path = build_path(name[1], name[2], name[3])
+        records.append({
+            "name": name[3],
+            "path": path,
+            "size": size,
+            "status": "Damaged" if overwritten else "Deleted",
+            "type": None,
+            "modified": filetime_to_datetime(info["modified"] or 0),
+            "folder": os.path.dirname(path),
+            "source": volume.device_path,
+            "extents": extents,
+            "mft_record": number
+        })
+
+    return records
@@ -0,0 +1,88 @@
+import time
+import logging
+
+from recovery_io import ExtentReader, DEVICE_READ_TIMEOUT
+from cancellation import Cancelled, OperationTimeout
+
+logger = logging.getLogger(__name__)
+
+SECTOR_SIZE = 512
+
+# The device is copied in chunks this large; a multiple of the sector size
+IMAGE_READ = 1024 * 1024
+
+
+def image_device(device_path, output_path, stop=None, progress=None,
+                 chunk_size=IMAGE_READ, timeout=DEVICE_READ_TIMEOUT):
+    """Copy a device or image into `output_path`, skipping what cannot be read
+
+    A chunk that fails with an I/O error is re-read sector by sector so
+    only the bad sectors are lost; a chunk that times out is skipped
+    whole, since every sector of it would likely hang as well. Unread
+    ranges are zero-filled in the image and listed in the summary.
+    `progress(done, total)` reports bytes copied against the device size.
+    """
+    reader = ExtentReader(device_path, stop, timeout)
+    started = time.monotonic()
+    bad_ranges = []
+    total = done = 0
+    stopped = False
+    try:
+        total = reader.size()
+        with open(output_path, 'wb') as out:
+            while done < total:
+                if stop and stop():
+                    stopped = True
+                    break
+                length = min(chunk_size, total - done)
+                try:
+                    data = reader.pread(length, done)
+                except OperationTimeout:
+                    logger.warning(f"Read at byte {done} of {device_path} timed out, skipping {length} bytes")
+                    data = bytes(length)
+                    add_bad_range(bad_ranges, done, length)
+                except OSError as e:
+                    logger.warning(f"Read error at byte {done} of {device_path}: {str(e)}")
+                    data = read_sectors(reader, done, length, bad_ranges)
+                out.write(data)
+                done += length
+                if progress:
+                    progress(done, total)
+    except Cancelled:
+        stopped = True
+    finally:
+        reader.close()
+
+    for offset, length in bad_ranges:
+        logger.error(f"Unreadable: {length} bytes at byte {offset} of {device_path}")
+
+    return {
+        "device": device_path,
+        "image": output_path,
+        "bytes_total": total,
+        "bytes_copied": done,
+        "bad_bytes": sum(length for _, length in bad_ranges),
+        "bad_ranges": bad_ranges,
+        "seconds": round(time.monotonic() - started, 3),
+        "stopped": stopped
+    }
+
+
+def read_sectors(reader, offset, length, bad_ranges):
+    """Re-read a failed chunk one sector at a time, zero-filling bad sectors"""
+    data = bytearray(length)
+    for start in range(0, length, SECTOR_SIZE):
+        size = min(SECTOR_SIZE, length - start)
+        try:
+            data[start:start + size] = reader.pread(size, offset + start)
+        except (OSError, OperationTimeout):
+            add_bad_range(bad_ranges, offset + start, size)
+    return bytes(data)
+
+
+def add_bad_range(bad_ranges, offset, length):
+    """Append an unreadable range, merging it with the previous one if adjacent"""
+    if bad_ranges and bad_ranges[-1][0] + bad_ranges[-1][1] == offset:
+        bad_ranges[-1] = (bad_ranges[-1][0], bad_ranges[-1][1] + length)
+    else:
+        bad_ranges.append((offset, length))
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import bisect
+import threading
+
+# Latency bucket upper bounds in seconds, 1-2.5-5 steps from 1 us to 10 s
+LATENCY_BUCKETS = [
+    base * scale
+    for scale in (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1)
+    for base in (1, 2.5, 5)
+] + [10.0]
+
+# Which kind of work each timed operation stands for
+OPERATION_KINDS = {
+    "listdir": "metadata",
+    "stat": "metadata",
+    "header": "reads",
+    "magic": "cpu",
+    "verify": "cpu",
+    "phash": "cpu",
+}
+
+METRIC_PREFIX = "datarescue_scan"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with Prometheus-style cumulative output"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+            "buckets": list(zip([f"{b:g}" for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class ScanMetrics:
+    """Counters, latency histograms and queue gauges for one scan
+
+    The scanning thread calls count() and observe(); any other thread may
+    call snapshot() or the exporters at the same time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.monotonic()
+            self.counters = {}
+            self.histograms = {}
+            self.gauges = {}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """A plain-dict copy of everything, with rates and the likely bottleneck"""
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            counters = dict(self.counters)
+            histograms = {name: h.snapshot() for name, h in self.histograms.items()}
+            gauges = dict(self.gauges)
+
+        rates = {
+            f"{name}_per_sec": value / elapsed if elapsed else 0.0
+            for name, value in counters.items()
+        }
+
+        # Time spent per kind of work shows what the scan is waiting on
+        bound = {}
+        for name, histogram in histograms.items():
+            kind = OPERATION_KINDS.get(name, "other")
+            bound[kind] = bound.get(kind, 0.0) + histogram["sum"]
+        bottleneck = max(bound, key=bound.get) if bound else None
+
+        return {
+            "elapsed": elapsed,
+            "counters": counters,
+            "rates": rates,
+            "latency": histograms,
+            "gauges": gauges,
+            "time_by_kind": bound,
+            "bottleneck": bottleneck,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Render the snapshot in the Prometheus text exposition format"""
+        snap = self.snapshot()
+        lines = [
+            f"# TYPE {METRIC_PREFIX}_elapsed_seconds gauge",
+            f"{METRIC_PREFIX}_elapsed_seconds {snap['elapsed']:.6f}",
+        ]
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+            lines.append(f"{METRIC_PREFIX}_{name}_total {value}")
+        for name, value in sorted(snap["gauges"].items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+            lines.append(f"{METRIC_PREFIX}_{name} {value}")
+        for name, histogram in sorted(snap["latency"].items()):
+            metric = f"{METRIC_PREFIX}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in histogram["buckets"]:
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum {histogram['sum']:.9f}")
+            lines.append(f"{metric}_count {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write a .prom textfile or, for any other extension, JSON
+
+        The file is replaced atomically so a node_exporter textfile
+        collector never reads half of it.
+        """
+        content = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
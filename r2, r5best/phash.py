@@ -0,0 +1,130 @@
+import logging
+from itertools import combinations, compress
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# dHash distance at or below which two images count as the same picture
+NEAR_DUPLICATE_DISTANCE = 3
+
+
+def dhash(img, hash_size=HASH_SIZE):
+    """Difference hash: one bit per horizontally adjacent brightness step"""
+    from PIL import Image
+    if img.format == 'JPEG':
+        # Let the decoder scale down instead of decoding every pixel
+        img.draft('L', (hash_size * 8, hash_size * 8))
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def image_dhash(path):
+    from PIL import Image
+    with Image.open(path) as img:
+        return dhash(img)
+
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(value):
+        return bin(value).count('1')
+
+
+def hamming(a, b):
+    return popcount(a ^ b)
+
+
+class MultiIndexHash:
+    """Find hash pairs within a Hamming radius without comparing all pairs
+
+    Hashes are cut into radius + 2 slices. Two hashes within the radius
+    differ in at most `radius` slices, so they agree exactly on at least
+    two. Every pair of slices forms one index key, and only hashes that
+    share a key somewhere are compared bit by bit.
+    """
+
+    def __init__(self, hashes, radius=NEAR_DUPLICATE_DISTANCE, bits=HASH_BITS):
+        self.hashes = list(hashes)
+        self.radius = radius
+        chunks = radius + 2
+        self.slices = []
+        shift = 0
+        for i in range(chunks):
+            width = bits // chunks + (1 if i < bits % chunks else 0)
+            self.slices.append((shift, (1 << width) - 1, width))
+            shift += width
+        # Each slice of every hash, extracted once and shared by all indexes
+        self.values = [[(v >> shift) & mask for v in self.hashes] for shift, mask, _ in self.slices]
+
+    def keys(self, first, second):
+        """Index keys made of two slices for every hash"""
+        width = self.slices[second][2]
+        return [a << width | b for a, b in zip(self.values[first], self.values[second])]
+
+    def near_pairs(self):
+        """Yield (index, index) pairs within the radius; a pair may repeat"""
+        hashes = self.hashes
+        for first, second in combinations(range(len(self.slices)), 2):
+            keys = self.keys(first, second)
+            # Counting in C first skips the Python work for unique keys
+            shared = {key for key, count in Counter(keys).items() if count > 1}
+            if not shared:
+                continue
+            buckets = defaultdict(list)
+            for item in compress(range(len(keys)), map(shared.__contains__, keys)):
+                buckets[keys[item]].append(item)
+            for members in buckets.values():
+                for a, item in enumerate(members):
+                    value = hashes[item]
+                    for other in members[a + 1:]:
+                        if popcount(value ^ hashes[other]) <= self.radius:
+                            yield item, other
+
+
+def cluster_near_duplicates(hashes, radius=NEAR_DUPLICATE_DISTANCE):
+    """Group keys whose hashes are within `radius` bits, transitively
+
+    `hashes` maps any key to a dHash. Returns clusters of two or more keys.
+    """
+    # Identical hashes are indexed once
+    by_value = defaultdict(list)
+    for key, value in hashes.items():
+        by_value[value].append(key)
+
+    index = MultiIndexHash(by_value, radius)
+
+    parent = list(range(len(index.hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    linked = set()
+    for a, b in index.near_pairs():
+        linked.update((a, b))
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_a] = root_b
+
+    clusters = defaultdict(list)
+    for item in linked:
+        clusters[find(item)].extend(by_value[index.hashes[item]])
+    result = list(clusters.values())
+    result.extend(
+        keys for item, keys in enumerate(by_value.values())
+        if len(keys) > 1 and item not in linked
+    )
+    logger.info(f"Grouped {sum(len(c) for c in result)} images into {len(result)} similar clusters")
+    return result
@@ -0,0 +1,193 @@
+import os
+import io
+import sys
+import json
+import logging
+import threading
+from time import perf_counter
+from datetime import datetime
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ["cprofile", "sample"]
+SAMPLE_INTERVAL = 0.005  # 200 samples a second
+
+# Shared do-nothing context so disabled spans cost one global lookup
+NULL_SPAN = nullcontext()
+
+# The tracer of the running profile session, if any
+_active_tracer = None
+
+
+class Tracer:
+    """Record stage spans as Chrome trace events (chrome://tracing, Perfetto)"""
+
+    def __init__(self):
+        self.origin = perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **args):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            end = perf_counter()
+            event = {
+                "name": name,
+                "cat": "stage",
+                "ph": "X",
+                "ts": round((start - self.origin) * 1e6, 3),
+                "dur": round((end - start) * 1e6, 3),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+            if args:
+                event["args"] = args
+            with self.lock:
+                self.events.append(event)
+
+    def save(self, path):
+        with self.lock:
+            events = list(self.events)
+        # Name the tracks after their threads
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for tid in {e["tid"] for e in events}:
+            events.append({
+                "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                "args": {"name": names.get(tid, str(tid))}
+            })
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def span(name, **args):
+    """Time a stage into the active trace; a no-op when nothing is profiling"""
+    tracer = _active_tracer
+    if tracer is None:
+        return NULL_SPAN
+    return tracer.span(name, **args)
+
+
+class SamplingProfiler:
+    """Sample every thread's stack on a timer and count collapsed stacks
+
+    The output is the "collapsed" format read by flamegraph.pl and
+    speedscope. Unlike cProfile it also sees the worker pools, and its cost
+    does not grow with the number of function calls.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileSession:
+    """Profile one scan or recovery and write the results to a folder
+
+    cProfile mode covers the thread that enters the session and writes a
+    .prof file (pstats, snakeviz) plus a text summary; sample mode writes
+    collapsed stacks for every thread. Both write a .trace.json timeline
+    of the stage spans recorded while the session was open.
+    """
+
+    def __init__(self, output_dir, name, mode="cprofile", interval=SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.name = name
+        self.mode = mode
+        self.interval = interval
+        self.tracer = Tracer()
+        self.profiler = None
+        self.paths = []
+
+    def __enter__(self):
+        global _active_tracer
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.previous_tracer = _active_tracer
+        _active_tracer = self.tracer
+
+        if self.mode == "sample":
+            self.profiler = SamplingProfiler(self.interval)
+            self.profiler.start()
+        else:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.span = self.tracer.span(self.name)
+        self.span.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active_tracer
+        self.span.__exit__(exc_type, exc, tb)
+        _active_tracer = self.previous_tracer
+        base = os.path.join(self.output_dir, f"{self.name}-{self.stamp}")
+
+        try:
+            if self.mode == "sample":
+                self.profiler.stop()
+                self.write(f"{base}.collapsed.txt", self.profiler.save)
+            else:
+                self.profiler.disable()
+                self.write(f"{base}.prof", self.profiler.dump_stats)
+                self.write(f"{base}.txt", self.save_summary)
+            self.write(f"{base}.trace.json", self.tracer.save)
+        except Exception as e:
+            logger.error(f"Failed to write profile for {self.name}: {str(e)}")
+        else:
+            logger.info(f"Profile of {self.name} written to {self.output_dir}")
+        return False
+
+    def write(self, path, writer):
+        writer(path)
+        self.paths.append(path)
+
+    def save_summary(self, path):
+        """The 40 most expensive calls by cumulative time, as plain text"""
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(40)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+
+
+def profile_session(name, output_dir=None, mode="cprofile"):
+    """A ProfileSession when `output_dir` is set, otherwise a no-op context"""
+    if not output_dir:
+        return NULL_SPAN
+    return ProfileSession(output_dir, name, mode)
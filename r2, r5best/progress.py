@@ -0,0 +1,131 @@
+import os
+import math
+import time
+
+# Weight of the newest rate sample in the moving average
+RATE_SMOOTHING = 0.2
+
+# Rate samples closer together than this are merged to keep them stable
+MIN_SAMPLE_INTERVAL = 0.5
+
+# The bar never reaches 100% before the work reports itself finished
+MAX_RUNNING_FRACTION = 0.99
+
+
+def volume_usage(path):
+    """Used inodes and used bytes of the volume holding `path`
+
+    Either value is None when the platform or filesystem cannot say;
+    FAT and NTFS report no inode counts, and Windows has no statvfs.
+    """
+    used_inodes = used_bytes = None
+    try:
+        st = os.statvfs(path)
+        if st.f_files:
+            used_inodes = st.f_files - st.f_ffree
+        used_bytes = (st.f_blocks - st.f_bfree) * st.f_frsize
+    except (AttributeError, OSError):
+        pass
+
+    if used_bytes is None:
+        try:
+            import psutil
+            used_bytes = psutil.disk_usage(path).used
+        except Exception:
+            pass
+    return used_inodes, used_bytes
+
+
+class ProgressEstimator:
+    """Turn completed work into a fraction done and an ETA with bounds
+
+    The total comes from what is known up front: used inodes or used
+    bytes of a volume, or the size of a device being carved. Progress is
+    measured in whichever unit has a total (inodes are preferred, since a
+    walk touches every entry but reads no file data), and the rate is an
+    exponentially weighted average with its own variance. The ETA bounds
+    are the time left at that rate plus and minus two deviations.
+    """
+
+    def __init__(self, total_items=None, total_bytes=None):
+        self.total_items = total_items
+        self.total_bytes = total_bytes
+        self.started = time.monotonic()
+        self.items = 0
+        self.bytes = 0
+        self.last_time = self.started
+        self.last_done = 0.0
+        self.rate = None
+        self.variance = 0.0
+
+    @classmethod
+    def for_volume(cls, path):
+        """Seed from the volume under `path`; a subfolder scan finishes early"""
+        used_inodes, used_bytes = volume_usage(path)
+        return cls(total_items=used_inodes, total_bytes=used_bytes)
+
+    @classmethod
+    def for_bytes(cls, total_bytes):
+        return cls(total_bytes=total_bytes)
+
+    def done(self):
+        """Completed work in the unit that has a known total"""
+        return self.items if self.total_items else self.bytes
+
+    def total(self):
+        return self.total_items or self.total_bytes
+
+    def update(self, items=None, bytes_done=None):
+        """Record cumulative progress and fold the latest rate into the average"""
+        if items is not None:
+            self.items = items
+        if bytes_done is not None:
+            self.bytes = bytes_done
+
+        now = time.monotonic()
+        elapsed = now - self.last_time
+        if elapsed < MIN_SAMPLE_INTERVAL:
+            return
+        done = self.done()
+        sample = (done - self.last_done) / elapsed
+        self.last_time = now
+        self.last_done = done
+
+        if self.rate is None:
+            self.rate = sample
+            return
+        delta = sample - self.rate
+        self.rate += RATE_SMOOTHING * delta
+        self.variance = (1 - RATE_SMOOTHING) * (self.variance + RATE_SMOOTHING * delta * delta)
+
+    def fraction(self):
+        total = self.total()
+        if not total:
+            return None
+        return min(MAX_RUNNING_FRACTION, self.done() / total)
+
+    def estimate(self):
+        """Fraction done, ETA and its low/high bounds in seconds (None when unknown)"""
+        fraction = self.fraction()
+        result = {
+            "fraction": fraction,
+            "rate": self.rate,
+            "eta": None,
+            "eta_low": None,
+            "eta_high": None,
+        }
+        total = self.total()
+        if fraction is None or not self.rate or self.rate <= 0:
+            return result
+
+        # Work past the seeded total means the seed was low; assume a little remains
+        remaining = max(total - self.done(), total * (1 - MAX_RUNNING_FRACTION))
+        spread = 2 * math.sqrt(self.variance)
+        result["eta"] = remaining / self.rate
+        result["eta_low"] = remaining / (self.rate + spread)
+        slowest = self.rate - spread
+        result["eta_high"] = remaining / slowest if slowest > 0 else None
+        return result
+
+    def elapsed(self):
+        return time.monotonic() - self.started
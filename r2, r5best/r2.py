@@ -6,13 +6,14 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import psutil
 from datetime import datetime
 from PIL import Image, ImageTk
-import magic  # For file type detection
 import hashlib
 import logging
 import webbrowser
 from collections import defaultdict
 import pickle
 import time
+from scan_engine import Scanner, FILE_SIGNATURES, file_types_for
+from progress import ProgressEstimator
 
 class ProfessionalRecoveryApp:
     def __init__(self, root):
@@ -435,70 +436,43 @@ class ProfessionalRecoveryApp:
             self.is_scanning = True
             self.stop_scan = False
             
-            # Initialize scan statistics
-            self.scan_stats = {"total_files": 0, "recoverable": 0, "damaged": 0}
+            # Used inodes of the volume say how much there is to walk
+            estimator = ProgressEstimator.for_volume(drive)
+            directories = 0
             
-            # Get file type filters
-            file_types = self.get_file_types()
-            
-            # Walk through directory structure
-            for root, dirs, files in os.walk(drive):
-                if self.stop_scan:
-                    break
-                
+            def on_directory(root, walked):
+                nonlocal directories
+                directories += 1
                 # Update status
                 self.scan_status.set(f"Scanning: {root}")
+                estimator.update(items=walked + directories)
+                if estimator.fraction() is not None:
+                    self.scan_progress.set(estimator.fraction() * 100)
+            
+            def on_result(file_info):
+                self.files.append(file_info)
                 
-                for filename in files:
-                    if self.stop_scan:
-                        break
-                    
-                    filepath = os.path.join(root, filename)
-                    
-                    try:
-                        # Get file info
-                        file_stat = os.stat(filepath)
-                        file_size = file_stat.st_size
-                        modified = datetime.fromtimestamp(file_stat.st_mtime)
-                        
-                        # Check if file matches selected types
-                        file_ext = os.path.splitext(filename)[1].lower()
-                        if file_types and file_ext not in file_types:
-                            continue
-                        
-                        # Check file integrity
-                        status = self.check_file_integrity(filepath, file_ext)
-                        
-                        # Add to file list
-                        file_type = magic.from_file(filepath, mime=True)
-                        
-                        self.files.append({
-                            "name": filename,
-                            "path": filepath,
-                            "size": file_size,
-                            "status": status,
-                            "type": file_type,
-                            "modified": modified,
-                            "folder": root
-                        })
-                        
-                        # Update statistics
-                        self.scan_stats["total_files"] += 1
-                        if status == "Good":
-                            self.scan_stats["recoverable"] += 1
-                        else:
-                            self.scan_stats["damaged"] += 1
-                        
-                        # Update UI periodically
-                        if self.scan_stats["total_files"] % 100 == 0:
-                            self.update_scan_ui()
-                    
-                    except Exception as e:
-                        self.logger.error(f"Error scanning {filepath}: {str(e)}")
-                        continue
+                # Update UI periodically
+                if self.scan_stats["total_files"] % 100 == 0:
+                    self.update_scan_ui()
+            
+            # Walk through directory structure
+            scanner = Scanner(
+                drive,
+                file_types=self.get_file_types(),
+                max_file_size=None,
+                check_integrity=self.check_file_integrity,
+                perceptual_hash=False,
+                stop=lambda: self.stop_scan,
+                on_directory=on_directory,
+                on_result=on_result
+            )
+            self.scan_stats = scanner.stats
+            scanner.run()
             
             # Final UI update
             self.update_scan_ui()
+            self.scan_progress.set(100)
             self.scan_status.set("Scan completed")
             self.status_label.config(text=f"Scan completed. Found {self.scan_stats['total_files']} files")
             
@@ -513,9 +487,6 @@ class ProfessionalRecoveryApp:
             self.stop_btn.config(state="disabled")
     
     def update_scan_ui(self):
-        # Update progress bar
-        self.scan_progress.set((self.scan_stats["total_files"] % 1000) / 10)
-        
         # Update statistics label
         self.stats_label.config(
             text=f"Files: {self.scan_stats['total_files']} | "
@@ -554,42 +525,28 @@ class ProfessionalRecoveryApp:
         self.file_table.tag_configure("Corrupted", foreground="orange")
     
     def check_file_integrity(self, filepath, file_ext):
+        # r2 calls unreadable files Damaged and undecodable images Corrupted
         try:
-            # Check basic readability
             with open(filepath, 'rb') as f:
                 header = f.read(512)
-                
-                # Check against known file signatures
-                if file_ext in self.file_signatures:
-                    expected_sig = self.file_signatures[file_ext]
-                    if not header.startswith(expected_sig):
-                        return "Damaged"
-                
-                # Additional checks based on file type
-                if file_ext in ['.jpg', '.jpeg', '.png']:
-                    try:
-                        Image.open(filepath).verify()
-                    except:
-                        return "Corrupted"
-                
-                return "Good"
-        except:
+            
+            # Check against known file signatures
+            if file_ext in FILE_SIGNATURES and not header.startswith(FILE_SIGNATURES[file_ext]):
+                return "Damaged"
+            
+            if file_ext in ['.jpg', '.jpeg', '.png']:
+                try:
+                    with Image.open(filepath) as img:
+                        img.verify()
+                except Exception:
+                    return "Corrupted"
+            
+            return "Good"
+        except Exception:
             return "Damaged"
     
     def get_file_types(self):
-        file_type_map = {
-            "[All Files]": None,
-            "[Pictures]": ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'],
-            "[Documents]": ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt', '.rtf'],
-            "[Audio]": ['.mp3', '.wav', '.aac', '.flac', '.ogg', '.wma'],
-            "[Video]": ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv'],
-            "[Archives]": ['.zip', '.rar', '.7z', '.tar', '.gz'],
-            "[Database]": ['.db', '.sqlite', '.mdb', '.accdb'],
-            "[Executables]": ['.exe', '.dll', '.msi', '.bat']
-        }
-        
-        selected = self.selected_category.get()
-        return file_type_map.get(selected, None)
+        return file_types_for(self.selected_category.get())
     
     def format_size(self, size):
         for unit in ['B', 'KB', 'MB', 'GB']:
@@ -924,19 +881,8 @@ class ProfessionalRecoveryApp:
     
     def load_file_signatures(self):
         # Common file signatures (magic numbers)
-        self.file_signatures = {
-            '.pdf': b'%PDF-',
-            '.jpg': b'\xFF\xD8\xFF',
-            '.png': b'\x89PNG',
-            '.gif': b'GIF89a',
-            '.zip': b'PK\x03\x04',
-            '.exe': b'MZ',
-            '.mp3': b'ID3',
-            '.mp4': b'\x00\x00\x00\x18ftyp',
-            '.doc': b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1',
-            '.docx': b'PK\x03\x04'
-        }
-    
+        self.file_signatures = dict(FILE_SIGNATURES)
+
     def show_help(self, event=None):
         help_dialog = tk.Toplevel(self.root)
         help_dialog.title("Help - Keyboard Shortcuts")
@@ -6,7 +6,6 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import psutil
 from datetime import datetime
 from PIL import Image, ImageTk
-import magic
 import hashlib
 import logging
 import webbrowser
@@ -14,6 +13,8 @@ import pickle
 import time
 import platform
 import subprocess
+from scan_engine import Scanner, FILE_SIGNATURES, file_types_for, check_file_integrity
+from progress import ProgressEstimator
 
 class DataRescuePro:
     def __init__(self, root):
@@ -707,98 +708,46 @@ class DataRescuePro:
         """Perform the actual file scanning"""
         try:
             self.logger.info(f"Starting scan of {drive_path}")
-            self.scan_stats["start_time"] = datetime.now()
-            self.scan_stats["total_files"] = 0
-            self.scan_stats["recoverable"] = 0
-            self.scan_stats["damaged"] = 0
-            self.scan_stats["scanned_bytes"] = 0
             self.files = []
-            
-            # Get file type filters
-            file_types = self.get_file_types()
-            
-            # Initialize counters
-            file_count = 0
             last_ui_update = time.time()
             
-            # Walk through the directory structure
-            for root, dirs, files in os.walk(drive_path):
-                if self.stop_scan:
-                    self.logger.info("Scan stopped by user")
-                    break
-                    
+            # Used inodes of the volume say how much there is to walk
+            estimator = ProgressEstimator.for_volume(drive_path)
+            directories = 0
+            
+            def on_directory(root, walked):
+                nonlocal last_ui_update, directories
+                directories += 1
+                estimator.update(items=walked + directories)
                 current_time = time.time()
                 
                 # Update UI every 2 seconds or every 500 files
-                if current_time - last_ui_update > 2 or file_count % 500 == 0:
+                if current_time - last_ui_update > 2 or walked % 500 == 0:
                     self.scan_status.set(f"Scanning: {root}")
-                    self.status_text.set(f"Found {file_count} files...")
-                    self.scan_progress.set(min(99, (file_count % 1000) / 10))  # Cap at 99% until complete
+                    self.status_text.set(f"Found {walked} files...")
+                    if estimator.fraction() is not None:
+                        self.scan_progress.set(estimator.fraction() * 100)
                     last_ui_update = current_time
                     self.root.update_idletasks()
-                
-                for filename in files:
-                    if self.stop_scan:
-                        break
-                        
-                    filepath = os.path.join(root, filename)
-                    file_count += 1
-                    
-                    try:
-                        # Get file info
-                        file_stat = os.stat(filepath)
-                        file_size = file_stat.st_size
-                        modified = datetime.fromtimestamp(file_stat.st_mtime)
-                        
-                        # Skip files larger than max size
-                        if file_size > self.settings["max_file_size"]:
-                            continue
-                        
-                        # Check if file matches selected types
-                        file_ext = os.path.splitext(filename)[1].lower()
-                        if file_types and file_ext not in file_types:
-                            continue
-                        
-                        # Check file integrity
-                        status = self.check_file_integrity(filepath, file_ext)
-                        
-                        # Get file type
-                        try:
-                            file_type = magic.from_file(filepath, mime=True)
-                        except:
-                            file_type = "unknown"
-                        
-                        # Add to file list
-                        self.files.append({
-                            "name": filename,
-                            "path": filepath,
-                            "size": file_size,
-                            "status": status,
-                            "type": file_type,
-                            "modified": modified,
-                            "folder": root
-                        })
-                        
-                        # Update statistics
-                        self.scan_stats["total_files"] += 1
-                        self.scan_stats["scanned_bytes"] += file_size
-                        
-                        if status == "Good":
-                            self.scan_stats["recoverable"] += 1
-                        else:
-                            self.scan_stats["damaged"] += 1
-                        
-                    except Exception as e:
-                        self.logger.error(f"Error scanning {filepath}: {str(e)}")
-                        continue
+            
+            # Walk through the directory structure
+            scanner = Scanner(
+                drive_path,
+                file_types=self.get_file_types(),
+                max_file_size=self.settings["max_file_size"],
+                perceptual_hash=False,
+                stop=lambda: self.stop_scan,
+                on_directory=on_directory
+            )
+            self.scan_stats = scanner.stats
+            self.files = scanner.run()
             
             # Final update
-            self.scan_stats["end_time"] = datetime.now()
             scan_duration = (self.scan_stats["end_time"] - self.scan_stats["start_time"]).total_seconds()
             
             self.scan_status.set("Scan completed")
             self.status_text.set(
-                f"Scan completed. Found {file_count} files in {scan_duration:.1f} seconds"
+                f"Scan completed. Found {len(self.files)} files in {scan_duration:.1f} seconds"
             )
             self.scan_progress.set(100)
             self.update_file_table()
@@ -852,45 +801,11 @@ class DataRescuePro:
 
     def check_file_integrity(self, filepath, file_ext):
         """Check the integrity of a file"""
-        try:
-            # Basic file check
-            if not os.path.isfile(filepath):
-                return "Corrupted"
-            
-            # Check file signatures if available
-            if file_ext in self.file_signatures:
-                with open(filepath, 'rb') as f:
-                    header = f.read(len(self.file_signatures[file_ext]))
-                    if not header.startswith(self.file_signatures[file_ext]):
-                        return "Damaged"
-            
-            # Additional checks based on file type
-            if file_ext in ['.jpg', '.jpeg', '.png']:
-                try:
-                    with Image.open(filepath) as img:
-                        img.verify()
-                except:
-                    return "Damaged"
-            
-            return "Good"
-        except:
-            return "Corrupted"
+        return check_file_integrity(filepath, file_ext, perceptual_hash=False)
 
     def get_file_types(self):
         """Get the file extensions to scan based on selected category"""
-        file_type_map = {
-            "[All Files]": None,
-            "[Pictures]": ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'],
-            "[Documents]": ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt', '.rtf'],
-            "[Audio]": ['.mp3', '.wav', '.aac', '.flac', '.ogg', '.wma'],
-            "[Video]": ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv'],
-            "[Archives]": ['.zip', '.rar', '.7z', '.tar', '.gz'],
-            "[Database]": ['.db', '.sqlite', '.mdb', '.accdb'],
-            "[Executables]": ['.exe', '.dll', '.msi', '.bat']
-        }
-        
-        selected = self.selected_category.get()
-        return file_type_map.get(selected, None)
+        return file_types_for(self.selected_category.get())
 
     def on_file_select(self, event):
         """Handle file selection event"""
@@ -1510,31 +1425,7 @@ class DataRescuePro:
 
     def load_file_signatures(self):
         """Load known file signatures (magic numbers)"""
-        self.file_signatures = {
-            '.pdf': b'%PDF-',
-            '.jpg': b'\xFF\xD8\xFF',
-            '.jpeg': b'\xFF\xD8\xFF',
-            '.png': b'\x89PNG',
-            '.gif': b'GIF89a',
-            '.zip': b'PK\x03\x04',
-            '.exe': b'MZ',
-            '.mp3': b'ID3',
-            '.mp4': b'\x00\x00\x00\x18ftyp',
-            '.doc': b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1',
-            '.docx': b'PK\x03\x04',
-            '.xlsx': b'PK\x03\x04',
-            '.pptx': b'PK\x03\x04',
-            '.rar': b'Rar!\x1A\x07\x00',
-            '.7z': b'7z\xBC\xAF\x27\x1C',
-            '.gz': b'\x1F\x8B\x08',
-            '.tar': b'ustar',
-            '.bmp': b'BM',
-            '.tiff': b'II*\x00' if platform.system() == 'Windows' else b'MM\x00*',
-            '.wav': b'RIFF',
-            '.avi': b'RIFF',
-            '.mdb': b'\x00\x01\x00\x00Standard Jet DB',
-            '.sqlite': b'SQLite format 3'
-        }
+        self.file_signatures = dict(FILE_SIGNATURES)
 
     def on_file_double_click(self, event):
         """Handle double-click on a file"""
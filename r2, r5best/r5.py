@@ -1,21 +1,27 @@
 import os
-import shutil
 import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import psutil
 from datetime import datetime
-from PIL import Image, ImageTk
-import magic
-import hashlib
 import logging
-import webbrowser
-import pickle
 import time
 import platform
-import subprocess
-import humanize
 from tkinter.font import Font
+from recovery_io import available_hash_algorithms, ARCHIVE_FORMATS
+from scan_engine import (
+    Scanner, FILE_SIGNATURES, TIMED_OUT, file_types_for,
+    new_scan_stats, save_results, load_results
+)
+from recovery_engine import RECOVERY_MODES, recover_files
+from thumbnails import ThumbnailService, PreviewPrefetcher, preview_kind
+from digests import DigestService
+from duplicates import find_duplicates, STATUS_PREFERENCE
+from phash import cluster_near_duplicates
+from metrics import ScanMetrics
+from profiling import profile_session
+from progress import ProgressEstimator
+from cancellation import CancelToken
+from drives import DriveMonitor
 
 class DataRescueProX:
     def __init__(self, root):
@@ -36,6 +42,7 @@ class DataRescueProX:
         
         # Load resources
         self.load_file_signatures()
+        self.drive_monitor = None
         self.populate_drives()
         
         # Set initial state
@@ -45,23 +52,25 @@ class DataRescueProX:
         """Set window icon with fallback"""
         try:
             self.root.iconbitmap("icon.ico")
-        except:
+        except Exception:
+            # A blank in-memory image replaces the default icon without touching the disk
             try:
-                img = Image.new('RGB', (1, 1))
-                img.save('temp.ico')
-                self.root.iconbitmap('temp.ico')
-                os.remove('temp.ico')
-            except:
+                self.window_icon = tk.PhotoImage(width=1, height=1)
+                self.root.iconphoto(True, self.window_icon)
+            except Exception:
                 pass
 
     def initialize_state(self):
         """Initialize all application state variables"""
         # UI state
         self.is_scanning = False
-        self.stop_scan = False
+        self.is_recovering = False
         self.scan_thread = None
         self.current_scan_path = ""
-        self.scan_paused = False
+        
+        # Pause and cancel signals for the running scan and recovery
+        self.scan_token = CancelToken()
+        self.recovery_token = CancelToken()
         
         # Settings
         self.settings = {
@@ -70,34 +79,65 @@ class DataRescueProX:
             "scan_depth": 2,
             "max_file_size": 1024 * 1024 * 500,  # 500MB
             "recovery_folder": os.path.expanduser("~/Documents/Recovered_Files"),
+            "hash_algorithm": "sha256",
+            "verify_recovery": False,
+            "archive_format": "tar.gz",
+            "compression_threads": os.cpu_count() or 1,
+            "thumbnail_cache_size": 64 * 1024 * 1024,  # 64MB
+            "thumbnail_cache_dir": "",  # Empty keeps thumbnails in memory only
+            "preview_prefetch": 3,  # Rows warmed on each side of the selection
+            "skip_duplicates": False,
+            "perceptual_hash": True,  # dHash images while validating them
+            "metrics_export": "",  # .prom or .json file written after every scan
+            "profile_dir": os.path.expanduser("~/Documents/DataRescue_Profiles"),
+            "profile_mode": "cprofile",  # or "sample" for the stack-sampling profiler
             "developer": "Risha Tech Solutions",
             "version": "3.1 Enhanced"
         }
         
         # Data collections
         self.drive_map = {}
+        self.device_map = {}
+        self.drive_labels = {}
+        self.drive_states = {}
         self.files = []
         self.file_signatures = {}
         self.recovery_history = []
+        self.duplicate_of = {}
+        self.preview_record = None
+        self.details_record = None
+        self.details_values = None
+        if getattr(self, "thumbnails", None):
+            self.prefetcher.shutdown()
+            self.thumbnails.shutdown()
+            self.digests.shutdown()
+        self.thumbnails = ThumbnailService(
+            max_bytes=self.settings["thumbnail_cache_size"],
+            disk_cache_dir=self.settings["thumbnail_cache_dir"] or None
+        )
+        self.prefetcher = PreviewPrefetcher(self.thumbnails)
+        self.digests = DigestService()
         
         # Statistics
-        self.scan_stats = {
-            "total_files": 0,
-            "recoverable": 0,
-            "damaged": 0,
-            "scanned_bytes": 0,
-            "start_time": None,
-            "end_time": None
-        }
+        self.scan_stats = new_scan_stats()
+        self.scan_metrics = ScanMetrics()
+        self.diagnostics_text = None
         
         # UI variables
         self.selected_drive = tk.StringVar()
         self.selected_category = tk.StringVar(value="[All Files]")
         self.recover_mode = tk.StringVar(value="Standard Recovery")
+        self.hash_algorithm = tk.StringVar(value=self.settings["hash_algorithm"])
+        self.verify_recovery = tk.BooleanVar(value=self.settings["verify_recovery"])
+        self.archive_format = tk.StringVar(value=self.settings["archive_format"])
+        self.skip_duplicates = tk.BooleanVar(value=self.settings["skip_duplicates"])
         self.deep_scan = tk.BooleanVar(value=True)
         self.full_scan = tk.BooleanVar()
         self.find_lost = tk.BooleanVar(value=True)
         self.show_preview_var = tk.BooleanVar(value=self.settings["show_preview"])
+        self.group_similar = tk.BooleanVar()
+        self.profiling = tk.BooleanVar()
+        self.profile_mode = tk.StringVar(value=self.settings["profile_mode"])
         self.select_all_var = tk.BooleanVar()
         self.theme_var = tk.StringVar(value=self.settings["theme"])
         
@@ -283,6 +323,7 @@ class DataRescueProX:
         file_menu.add_command(label="New Recovery", command=self.reset_app)
         file_menu.add_command(label="Save Scan Results", command=self.save_scan_results)
         file_menu.add_command(label="Load Scan Results", command=self.load_scan_results)
+        file_menu.add_command(label="Scan Disk Image...", command=self.start_image_scan)
         file_menu.add_separator()
         file_menu.add_command(label="Preferences", command=self.show_preferences)
         file_menu.add_separator()
@@ -294,6 +335,7 @@ class DataRescueProX:
         edit_menu.add_command(label="Select All", command=self.select_all_files)
         edit_menu.add_command(label="Clear Selection", command=self.clear_selection)
         edit_menu.add_separator()
+        edit_menu.add_command(label="Find Duplicates", command=self.start_duplicate_search)
         edit_menu.add_command(label="Advanced Filters", command=self.show_filter_dialog)
         menubar.add_cascade(label="Edit", menu=edit_menu)
         
@@ -305,8 +347,23 @@ class DataRescueProX:
                                  value="dark", command=self.toggle_theme)
         view_menu.add_checkbutton(label="Show Preview", variable=self.show_preview_var,
                                 command=self.toggle_preview)
+        view_menu.add_checkbutton(label="Group Similar Images", variable=self.group_similar,
+                                command=self.update_file_table)
+        view_menu.add_separator()
+        view_menu.add_command(label="Diagnostics", command=self.show_diagnostics)
         menubar.add_cascade(label="View", menu=view_menu)
         
+        # Tools menu
+        tools_menu = tk.Menu(menubar, tearoff=0)
+        tools_menu.add_checkbutton(label="Profile Scans and Recovery", variable=self.profiling)
+        tools_menu.add_radiobutton(label="cProfile (Deterministic)", variable=self.profile_mode,
+                                  value="cprofile")
+        tools_menu.add_radiobutton(label="Sampling Profiler", variable=self.profile_mode,
+                                  value="sample")
+        tools_menu.add_separator()
+        tools_menu.add_command(label="Open Profile Folder", command=self.open_profile_folder)
+        menubar.add_cascade(label="Tools", menu=tools_menu)
+        
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
         help_menu.add_command(label="User Guide", command=self.show_user_guide)
@@ -467,6 +524,9 @@ class DataRescueProX:
         self.file_table.tag_configure("Good", foreground="green")
         self.file_table.tag_configure("Damaged", foreground="orange")
         self.file_table.tag_configure("Corrupted", foreground="red")
+        self.file_table.tag_configure("Deleted", foreground="blue")
+        self.file_table.tag_configure(TIMED_OUT, foreground="purple")
+        self.file_table.tag_configure("Duplicate", foreground="gray")
         
         # Add checkboxes to the first column
         self.file_table.heading("Selected", text="", anchor="center")
@@ -573,12 +633,7 @@ class DataRescueProX:
         recovery_modes = ttk.Combobox(
             recovery_frame,
             textvariable=self.recover_mode,
-            values=[
-                "Standard Recovery",
-                "Recover with Folder Structure",
-                "Recover with Metadata",
-                "Raw Recovery (Advanced)"
-            ],
+            values=RECOVERY_MODES,
             state="readonly",
             width=25
         )
@@ -604,6 +659,46 @@ class DataRescueProX:
         )
         file_types.grid(row=1, column=1, sticky="ew", pady=5)
         
+        ttk.Checkbutton(
+            recovery_frame,
+            text="Deep scan (carve free space)",
+            variable=self.deep_scan
+        ).grid(row=1, column=2, sticky="w", padx=10)
+        
+        # Checksum options
+        ttk.Label(recovery_frame, text="Checksum:").grid(row=2, column=0, sticky="w")
+        hash_algorithms = ttk.Combobox(
+            recovery_frame,
+            textvariable=self.hash_algorithm,
+            values=available_hash_algorithms(),
+            state="readonly",
+            width=25
+        )
+        hash_algorithms.grid(row=2, column=1, sticky="ew", pady=5)
+        
+        ttk.Checkbutton(
+            recovery_frame,
+            text="Verify after copy",
+            variable=self.verify_recovery
+        ).grid(row=2, column=2, sticky="w", padx=10)
+        
+        # Archive format used by "Recover to Archive"
+        ttk.Label(recovery_frame, text="Archive Format:").grid(row=3, column=0, sticky="w")
+        archive_formats = ttk.Combobox(
+            recovery_frame,
+            textvariable=self.archive_format,
+            values=ARCHIVE_FORMATS,
+            state="readonly",
+            width=25
+        )
+        archive_formats.grid(row=3, column=1, sticky="ew", pady=5)
+        
+        ttk.Checkbutton(
+            recovery_frame,
+            text="Skip duplicates",
+            variable=self.skip_duplicates
+        ).grid(row=3, column=2, sticky="w", padx=10)
+        
         # Action buttons
         action_frame = ttk.Frame(sidebar)
         action_frame.pack(fill="x", pady=(10, 0))
@@ -686,41 +781,69 @@ class DataRescueProX:
         dev_label.pack(side="right", padx=10)
 
     def populate_drives(self):
-        """Populate the drive selection combobox with available drives"""
-        try:
-            drives = []
-            self.drive_map = {}
-            
-            for part in psutil.disk_partitions():
-                try:
-                    if 'cdrom' in part.opts or part.fstype == '':
-                        continue
-                        
-                    try:
-                        usage = psutil.disk_usage(part.mountpoint)
-                        free_gb = usage.free / (1024**3)
-                        drive_info = f"{part.device} ({free_gb:.1f}GB free)"
-                    except:
-                        drive_info = f"{part.device} (Unknown free space)"
-                    
-                    drives.append(drive_info)
-                    self.drive_map[drive_info] = part.mountpoint
-                    
-                except Exception as e:
-                    self.logger.error(f"Error processing drive {part.device}: {str(e)}")
-                    continue
-            
-            self.drive_combobox['values'] = drives
-            
-            if drives:
-                self.drive_combobox.current(0)
-                self.selected_drive.set(drives[0])
-            else:
-                messagebox.showwarning("No Drives", "No usable drives found")
-                
-        except Exception as e:
-            self.logger.error(f"Error in populate_drives: {str(e)}")
-            messagebox.showerror("Error", f"Failed to list drives: {str(e)}")
+        """List drives in the background; each entry appears as soon as it answers"""
+        self.drive_map = {}
+        self.device_map = {}
+        self.drive_labels = {}
+        self.drive_states = {}
+        self.drive_combobox['values'] = []
+        self.selected_drive.set("")
+        
+        # A hung network mount must never hold up the window
+        if self.drive_monitor is None:
+            self.drive_monitor = DriveMonitor(
+                on_drive=lambda drive: self.root.after(0, self.show_drive, drive),
+                on_removed=lambda mountpoint: self.root.after(0, self.forget_drive, mountpoint),
+                on_listed=lambda mountpoints: self.root.after(0, self.drives_listed, mountpoints)
+            ).start()
+        else:
+            self.drive_monitor.refresh()
+
+    def show_drive(self, drive):
+        """Add a drive to the selection combobox, or update its entry"""
+        mountpoint = drive["mountpoint"]
+        if drive["state"] == "ready":
+            free_gb = drive["free"] / (1024**3)
+            label = f"{drive['device']} ({free_gb:.1f}GB free)"
+        elif drive["state"] == "checking":
+            label = f"{drive['device']} (checking free space...)"
+        elif drive["state"] == "not responding":
+            label = f"{drive['device']} (not responding)"
+        else:
+            label = f"{drive['device']} (Unknown free space)"
+        
+        old_label = self.drive_labels.get(mountpoint)
+        if old_label is not None:
+            self.drive_map.pop(old_label, None)
+            self.device_map.pop(old_label, None)
+        self.drive_labels[mountpoint] = label
+        self.drive_states[mountpoint] = drive["state"]
+        self.drive_map[label] = mountpoint
+        self.device_map[label] = drive["device"]
+        self.drive_combobox['values'] = list(self.drive_labels.values())
+        
+        # Keep the selection on the same drive as its label changes
+        selected = self.selected_drive.get()
+        if not selected or selected == old_label:
+            self.selected_drive.set(label)
+
+    def forget_drive(self, mountpoint):
+        """Drop a drive that was unmounted or unplugged"""
+        label = self.drive_labels.pop(mountpoint, None)
+        self.drive_states.pop(mountpoint, None)
+        if label is None:
+            return
+        self.drive_map.pop(label, None)
+        device = self.device_map.pop(label, None)
+        self.drive_combobox['values'] = list(self.drive_labels.values())
+        if self.selected_drive.get() == label:
+            self.selected_drive.set("")
+        self.status_text.set(f"{device} was removed")
+
+    def drives_listed(self, mountpoints):
+        """Note when the mount table holds nothing that can be scanned"""
+        if not mountpoints:
+            self.status_text.set("No usable drives found")
 
     def start_scan(self):
         """Start the file scanning process"""
@@ -735,6 +858,11 @@ class DataRescueProX:
             messagebox.showerror("Error", "Invalid drive selection")
             return
         
+        # Even checking that a dead mount exists would freeze the window
+        if self.drive_states.get(drive_path) == "not responding":
+            messagebox.showerror("Error", f"Drive {drive_path} is not responding")
+            return
+        
         if not os.path.exists(drive_path):
             messagebox.showerror("Error", f"Drive path {drive_path} does not exist")
             return
@@ -753,18 +881,17 @@ class DataRescueProX:
         try:
             # Start scan in background thread
             self.scan_thread = threading.Thread(
-                target=self.perform_scan,
-                args=(drive_path,),
+                target=self.run_profiled,
+                args=("scan", self.perform_scan, drive_path),
                 daemon=True
             )
+            self.scan_token = CancelToken()
             self.is_scanning = True
-            self.stop_scan = False
-            self.scan_paused = False
             self.scan_thread.start()
             
             # Update button states
             self.scan_btn.config(state="disabled")
-            self.stop_btn.config(state="normal")
+            self.stop_btn.config(state="normal", text="Stop Scan")
             self.pause_btn.config(state="normal")
             
             # Start monitoring thread
@@ -775,23 +902,58 @@ class DataRescueProX:
             messagebox.showerror("Error", f"Failed to start scan: {str(e)}")
             self.reset_scan_ui()
 
+    def run_profiled(self, name, worker, *args):
+        """Run a worker thread body, under the profiler if it is switched on"""
+        output_dir = self.settings["profile_dir"] if self.profiling.get() else None
+        self.settings["profile_mode"] = self.profile_mode.get()
+        with profile_session(name, output_dir, self.settings["profile_mode"]):
+            worker(*args)
+        if output_dir:
+            self.status_text.set(f"Profile of {name} saved to {output_dir}")
+
+    def open_profile_folder(self):
+        """Open the folder profiles and traces are written to"""
+        import subprocess
+        folder = self.settings["profile_dir"]
+        try:
+            os.makedirs(folder, exist_ok=True)
+            if platform.system() == 'Windows':
+                os.startfile(folder)
+            elif platform.system() == 'Darwin':
+                subprocess.run(['open', folder])
+            else:
+                subprocess.run(['xdg-open', folder])
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open {folder}: {str(e)}")
+
     def toggle_pause_scan(self):
-        """Toggle pause/resume for the current scan"""
-        if not self.is_scanning:
+        """Toggle pause/resume for the current scan or recovery"""
+        token = self.current_job_token()
+        if token is None:
             return
-            
-        self.scan_paused = not self.scan_paused
-        if self.scan_paused:
-            self.pause_btn.config(text="Resume")
-            self.scan_status.set("Scan paused")
-            self.status_text.set("Scan paused - click Resume to continue")
-        else:
+        
+        job = "scan" if self.is_scanning else "recovery"
+        if token.is_paused():
+            token.resume()
             self.pause_btn.config(text="Pause")
-            self.scan_status.set("Resuming scan...")
-            self.status_text.set(f"Resuming scan of {self.current_scan_path}...")
+            self.scan_status.set(f"Resuming {job}...")
+            self.status_text.set(f"Resuming {job} of {self.current_scan_path}...")
+        else:
+            token.pause()
+            self.pause_btn.config(text="Resume")
+            self.scan_status.set(f"{job.capitalize()} paused")
+            self.status_text.set(f"{job.capitalize()} paused - click Resume to continue")
         
         self.root.update_idletasks()
 
+    def current_job_token(self):
+        """Token of the job the Stop and Pause buttons control, if one is running"""
+        if self.is_scanning:
+            return self.scan_token
+        if self.is_recovering:
+            return self.recovery_token
+        return None
+
     def monitor_scan_thread(self):
         """Monitor the scan thread and update UI accordingly"""
         if self.is_scanning and self.scan_thread.is_alive():
@@ -807,103 +969,62 @@ class DataRescueProX:
 
     def perform_scan(self, drive_path):
         """Perform the actual file scanning"""
+        import humanize
         try:
             self.logger.info(f"Starting scan of {drive_path}")
-            self.scan_stats["start_time"] = datetime.now()
-            self.scan_stats["total_files"] = 0
-            self.scan_stats["recoverable"] = 0
-            self.scan_stats["damaged"] = 0
-            self.scan_stats["scanned_bytes"] = 0
             self.files = []
+            scan_started = last_ui_update = time.time()
+            directories = 0
             
-            file_types = self.get_file_types()
-            file_count = 0
-            last_ui_update = time.time()
+            # Used inodes and bytes of the volume say how much there is to walk
+            estimator = ProgressEstimator.for_volume(drive_path)
             
-            for root, dirs, files in os.walk(drive_path):
-                if self.stop_scan:
-                    self.logger.info("Scan stopped by user")
-                    break
-                    
-                # Handle pause state
-                while self.scan_paused and not self.stop_scan:
-                    time.sleep(0.5)
-                    continue
-                    
+            def on_directory(root, walked):
+                nonlocal last_ui_update, directories
+                directories += 1
+                estimator.update(items=walked + directories, bytes_done=self.scan_stats["scanned_bytes"])
                 current_time = time.time()
                 
                 # Update UI periodically
-                if current_time - last_ui_update > 2 or file_count % 500 == 0:
+                if current_time - last_ui_update > 2 or walked % 500 == 0:
+                    rate = walked / max(current_time - scan_started, 0.001)
+                    estimate = estimator.estimate()
                     self.scan_status.set(f"Scanning: {root}")
-                    self.status_text.set(f"Found {file_count} files...")
-                    self.scan_progress.set(min(99, (file_count % 1000) / 10))
+                    self.status_text.set(
+                        f"Found {walked} files ({rate:.0f} files/s){self.describe_eta(estimate)}..."
+                    )
+                    if estimate["fraction"] is not None:
+                        self.scan_progress.set(estimate["fraction"] * 100)
                     last_ui_update = current_time
                     self.root.update_idletasks()
-                
-                for filename in files:
-                    if self.stop_scan:
-                        break
-                        
-                    # Handle pause state
-                    while self.scan_paused and not self.stop_scan:
-                        time.sleep(0.5)
-                        continue
-                        
-                    filepath = os.path.join(root, filename)
-                    file_count += 1
-                    
-                    try:
-                        file_stat = os.stat(filepath)
-                        file_size = file_stat.st_size
-                        modified = datetime.fromtimestamp(file_stat.st_mtime)
-                        
-                        if file_size > self.settings["max_file_size"]:
-                            continue
-                        
-                        file_ext = os.path.splitext(filename)[1].lower()
-                        if file_types and file_ext not in file_types:
-                            continue
-                        
-                        status = self.check_file_integrity(filepath, file_ext)
-                        
-                        try:
-                            file_type = magic.from_file(filepath, mime=True)
-                        except:
-                            file_type = "unknown"
-                        
-                        self.files.append({
-                            "name": filename,
-                            "path": filepath,
-                            "size": file_size,
-                            "status": status,
-                            "type": file_type,
-                            "modified": modified,
-                            "folder": root
-                        })
-                        
-                        self.scan_stats["total_files"] += 1
-                        self.scan_stats["scanned_bytes"] += file_size
-                        
-                        if status == "Good":
-                            self.scan_stats["recoverable"] += 1
-                        else:
-                            self.scan_stats["damaged"] += 1
-                        
-                    except Exception as e:
-                        self.logger.error(f"Error scanning {filepath}: {str(e)}")
-                        continue
+            
+            # Deleted files are found by parsing the volume underneath the mount
+            device = self.device_map.get(self.selected_drive.get())
+            scanner = self.create_scanner(
+                drive_path,
+                file_types=self.get_file_types(),
+                max_file_size=self.settings["max_file_size"],
+                perceptual_hash=self.settings["perceptual_hash"],
+                find_lost=bool(self.find_lost.get() and device),
+                device=device,
+                on_directory=on_directory
+            )
+            self.scan_stats = scanner.stats
+            self.files = scanner.run()
             
             # Final update
-            self.scan_stats["end_time"] = datetime.now()
             scan_duration = (self.scan_stats["end_time"] - self.scan_stats["start_time"]).total_seconds()
             
             self.scan_status.set("Scan completed")
+            timed_out = sum(1 for f in self.files if f["status"] == TIMED_OUT)
             self.status_text.set(
-                f"Scan completed. Found {file_count} files in {humanize.naturaldelta(scan_duration)}"
+                f"Scan completed. Found {len(self.files)} files in {humanize.naturaldelta(scan_duration)}"
+                + (f" ({timed_out} timed out)" if timed_out else "")
             )
             self.scan_progress.set(100)
             self.update_file_table()
             self.update_stats_display()
+            self.export_scan_metrics()
             
         except Exception as e:
             self.logger.error(f"Scan error: {str(e)}")
@@ -911,18 +1032,131 @@ class DataRescueProX:
             self.status_text.set(f"Scan failed: {str(e)}")
         finally:
             self.is_scanning = False
-            self.stop_scan = False
             self.scan_btn.config(state="normal")
             self.stop_btn.config(state="disabled")
             self.pause_btn.config(state="disabled")
 
+    def create_scanner(self, path, **options):
+        """Build a scan engine wired to this window's stop, pause and status display"""
+        import humanize
+        def on_stage(stage, device):
+            self.scan_status.set(f"Searching {device} for lost files...")
+        
+        carve_estimator = None
+        
+        def on_carve(done, total):
+            nonlocal carve_estimator
+            # Carving progress is bytes read against the size of the free space
+            if carve_estimator is None or carve_estimator.total_bytes != total:
+                carve_estimator = ProgressEstimator.for_bytes(total)
+            carve_estimator.update(bytes_done=done)
+            self.scan_status.set(
+                f"Carving free space: {humanize.naturalsize(done)} of {humanize.naturalsize(total)}"
+                f"{self.describe_eta(carve_estimator.estimate())}"
+            )
+            self.scan_progress.set(min(99, done * 100 / max(total, 1)))
+        
+        options.setdefault("deep_scan", self.deep_scan.get())
+        self.scan_metrics.reset()
+        return Scanner(
+            path,
+            stop=self.scan_token,
+            on_stage=on_stage,
+            on_carve=on_carve,
+            metrics=self.scan_metrics,
+            **options
+        )
+
+    def describe_eta(self, estimate):
+        """Readable time left with its likely range, or nothing while unknown"""
+        import humanize
+        if estimate["eta"] is None:
+            return ""
+        text = f", about {humanize.naturaldelta(estimate['eta'])} left"
+        if estimate["eta_high"] is not None:
+            text += (
+                f" ({humanize.naturaldelta(estimate['eta_low'])}"
+                f" to {humanize.naturaldelta(estimate['eta_high'])})"
+            )
+        return text
+
+    def export_scan_metrics(self):
+        """Write the metrics of the last scan to the configured textfile, if any"""
+        if not self.settings["metrics_export"]:
+            return
+        try:
+            self.scan_metrics.export(self.settings["metrics_export"])
+        except Exception as e:
+            self.logger.error(f"Failed to export scan metrics: {str(e)}")
+
+    def start_image_scan(self):
+        """Scan a disk image file for deleted files"""
+        if self.is_scanning:
+            messagebox.showwarning("Warning", "Scan already in progress")
+            return
+        
+        image_path = filedialog.askopenfilename(
+            title="Select Disk Image",
+            filetypes=[("Disk Images", "*.img *.dd *.raw *.bin"), ("All Files", "*.*")]
+        )
+        if not image_path:
+            return
+        
+        self.reset_scan_ui()
+        self.current_scan_path = image_path
+        self.scan_thread = threading.Thread(
+            target=self.run_profiled,
+            args=("image-scan", self.perform_image_scan, image_path),
+            daemon=True
+        )
+        self.scan_token = CancelToken()
+        self.is_scanning = True
+        self.scan_thread.start()
+        
+        self.scan_btn.config(state="disabled")
+        self.stop_btn.config(state="normal", text="Stop Scan")
+        self.pause_btn.config(state="normal")
+        self.monitor_scan_thread()
+
+    def perform_image_scan(self, image_path):
+        """Look for deleted files inside a disk image"""
+        try:
+            scanner = self.create_scanner(image_path, walk_tree=False, find_lost=True, device=image_path)
+            self.scan_stats = scanner.stats
+            self.files = scanner.run()
+            
+            self.scan_status.set("Scan completed")
+            self.status_text.set(f"Scan completed. Found {len(self.files)} lost files in {image_path}")
+            self.scan_progress.set(100)
+            self.update_file_table()
+            self.export_scan_metrics()
+        except Exception as e:
+            self.logger.error(f"Image scan error: {str(e)}")
+            self.scan_status.set("Scan failed")
+            self.status_text.set(f"Scan of {image_path} failed: {str(e)}")
+        finally:
+            self.is_scanning = False
+            self.scan_btn.config(state="normal")
+            self.stop_btn.config(state="disabled")
+            self.pause_btn.config(state="disabled")
+            self.pause_btn.config(text="Pause")
+
     def update_file_table(self):
         """Update the file table with the scanned files"""
         self.file_table.delete(*self.file_table.get_children())
+        self.duplicate_of = {}
+        
+        # Collapse near-duplicate images into their best copy
+        hidden, similar = self.similar_image_groups() if self.group_similar.get() else (set(), {})
         
         for idx, file_info in enumerate(self.files, 1):
+            if idx - 1 in hidden:
+                continue
             status = file_info["status"]
             size_mb = file_info["size"] / (1024 * 1024)
+            name = file_info["name"]
+            if idx - 1 in similar:
+                name = f"{name} (+{similar[idx - 1]} similar)"
             
             self.file_table.insert(
                 "",
@@ -930,7 +1164,7 @@ class DataRescueProX:
                 iid=str(idx),
                 values=(
                     "☐",  # Checkbox state
-                    file_info["name"],
+                    name,
                     file_info["path"],
                     f"{size_mb:.2f} MB",
                     status,
@@ -942,15 +1176,36 @@ class DataRescueProX:
         
         self.update_stats_display()
 
+    def similar_image_groups(self):
+        """Return (hidden indexes, {shown index: similar count}) for image clusters"""
+        hashes = {
+            idx: info["phash"] for idx, info in enumerate(self.files)
+            if info.get("phash") is not None
+        }
+        hidden = set()
+        similar = {}
+        for cluster in cluster_near_duplicates(hashes):
+            # Keep the healthiest, then the largest copy visible
+            best = min(cluster, key=lambda i: (
+                STATUS_PREFERENCE.get(self.files[i]["status"], 4), -self.files[i]["size"], i
+            ))
+            similar[best] = len(cluster) - 1
+            hidden.update(i for i in cluster if i != best)
+        return hidden, similar
+
     def cancel_scan(self):
-        """Cancel the current scan operation"""
+        """Cancel the current scan or recovery"""
+        token = self.current_job_token()
+        if token is None:
+            return
+        token.cancel()
+        job = "scan" if self.is_scanning else "recovery"
+        self.scan_status.set(f"Cancelling {job}...")
+        self.status_text.set(f"Waiting for {job} to stop...")
+        self.stop_btn.config(state="disabled")
+        self.pause_btn.config(state="disabled")
         if self.is_scanning:
-            self.stop_scan = True
-            self.scan_status.set("Cancelling scan...")
-            self.status_text.set("Waiting for scan to stop...")
             self.scan_btn.config(state="disabled")
-            self.stop_btn.config(state="disabled")
-            self.pause_btn.config(state="disabled")
 
     def recover_selected_files(self):
         """Recover files selected with checkboxes"""
@@ -981,87 +1236,149 @@ class DataRescueProX:
         
         self.settings["recovery_folder"] = dest_folder
         
+        if self.is_recovering:
+            messagebox.showwarning("Warning", "Recovery already in progress")
+            return
+        self.recovery_token = CancelToken()
+        self.is_recovering = True
+        if not self.is_scanning:
+            # The Stop and Pause buttons control the recovery while no scan runs
+            self.stop_btn.config(state="normal", text="Stop Recovery")
+            self.pause_btn.config(state="normal")
+        
         recovery_thread = threading.Thread(
-            target=self.perform_recovery,
-            args=(selected_items, dest_folder),
+            target=self.run_profiled,
+            args=("recovery", self.perform_recovery, selected_items, dest_folder),
             daemon=True
         )
         recovery_thread.start()
 
     def perform_recovery(self, selected_items, dest_folder):
         """Perform the actual file recovery"""
-        total = len(selected_items)
-        success = 0
-        errors = 0
+        mode = self.recover_mode.get()
+        records = [self.files[int(item_id) - 1] for item_id in selected_items]
+        
+        self.settings["hash_algorithm"] = self.hash_algorithm.get()
+        self.settings["verify_recovery"] = self.verify_recovery.get()
+        self.settings["archive_format"] = self.archive_format.get()
+        self.settings["skip_duplicates"] = self.skip_duplicates.get()
         
         self.scan_status.set("Recovering files...")
-        self.status_text.set(f"Recovering {total} files...")
+        self.status_text.set(f"Recovering {len(records)} files...")
         self.scan_progress.set(0)
         self.root.update_idletasks()
         
-        for i, item_id in enumerate(selected_items, 1):
-            item = self.file_table.item(item_id)
-            filepath = item['values'][2]  # Path is in third column
-            filename = item['values'][1]
-            status = item['values'][4]
-            
-            try:
-                if status != "Good":
-                    if not messagebox.askyesno(
-                        "Warning",
-                        f"File {filename} appears to be {status.lower()}. Attempt recovery anyway?"
-                    ):
-                        errors += 1
-                        continue
-                
-                recovery_mode = self.recover_mode.get()
-                
-                if recovery_mode == "Standard Recovery":
-                    dest_path = os.path.join(dest_folder, filename)
-                    dest_path = self.get_unique_filename(dest_path)
-                    shutil.copy2(filepath, dest_path)
-                
-                elif recovery_mode == "Recover with Folder Structure":
-                    rel_path = os.path.relpath(filepath, self.current_scan_path)
-                    dest_path = os.path.join(dest_folder, rel_path)
-                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                    dest_path = self.get_unique_filename(dest_path)
-                    shutil.copy2(filepath, dest_path)
-                
-                success += 1
-                self.logger.info(f"Recovered {filepath} to {dest_path}")
-            
-            except Exception as e:
-                errors += 1
-                self.logger.error(f"Failed to recover {filepath}: {str(e)}")
-            
-            # Update progress
-            self.scan_progress.set((i / total) * 100)
-            self.scan_status.set(f"Recovered {i} of {total} files")
+        def update_progress(done, total, message):
+            self.scan_progress.set((done / max(total, 1)) * 100)
+            self.scan_status.set(message)
             self.root.update_idletasks()
         
+        try:
+            summary = recover_files(
+                records,
+                dest_folder,
+                mode=mode,
+                scan_root=self.current_scan_path,
+                algorithm=self.settings["hash_algorithm"],
+                verify=self.settings["verify_recovery"],
+                archive_format=self.settings["archive_format"],
+                compression_threads=self.settings["compression_threads"],
+                skip_duplicates=self.settings["skip_duplicates"],
+                confirm=self.confirm_damaged_recovery,
+                progress=update_progress,
+                stop=self.recovery_token
+            )
+        except Exception as e:
+            self.logger.error(f"Recovery failed: {str(e)}")
+            self.scan_status.set("Recovery failed")
+            messagebox.showerror("Error", f"Recovery failed: {str(e)}")
+            return
+        finally:
+            self.finish_recovery()
+        
         # Show completion message
+        success, errors = summary["success"], summary["errors"]
+        if self.recovery_token.is_cancelled():
+            self.scan_status.set("Recovery cancelled")
+            self.status_text.set(f"Recovery cancelled: {success} succeeded, {errors} failed")
+            return
         self.scan_status.set("Recovery completed")
+        if mode == "Recover to Archive":
+            self.status_text.set(f"Archive completed: {success} succeeded, {errors} failed")
+            messagebox.showinfo(
+                "Recovery Complete",
+                f"Archived {success} files to {summary['archive']}\n{errors} files could not be recovered"
+            )
+            return
+        
         self.status_text.set(
-            f"Recovery completed: {success} succeeded, {errors} failed"
+            f"Recovery completed: {success} recovered, {summary['skipped']} already done, {errors} failed"
         )
         messagebox.showinfo(
             "Recovery Complete",
             f"Successfully recovered {success} files\n{errors} files could not be recovered"
+            + (f"\n{summary['skipped']} files were already recovered" if summary["skipped"] else "")
+            + (f"\n{summary['mismatches']} files failed verification" if summary["mismatches"] else "")
+        )
+
+    def finish_recovery(self):
+        """Hand the Stop and Pause buttons back once a recovery ends"""
+        self.is_recovering = False
+        if not self.is_scanning:
+            self.stop_btn.config(state="disabled", text="Stop Scan")
+            self.pause_btn.config(state="disabled", text="Pause")
+
+    def confirm_damaged_recovery(self, file_info):
+        """Ask before recovering a file that failed its integrity check"""
+        return messagebox.askyesno(
+            "Warning",
+            f"File {file_info['name']} appears to be {file_info['status'].lower()}. Attempt recovery anyway?"
+        )
+
+    def start_duplicate_search(self):
+        """Find byte-identical files among the scan results"""
+        if not self.files:
+            messagebox.showinfo("Info", "No scan results to search")
+            return
+        
+        self.status_text.set("Searching for duplicates...")
+        threading.Thread(target=self.perform_duplicate_search, daemon=True).start()
+
+    def perform_duplicate_search(self):
+        """Group duplicates in the background, then mark them in the table"""
+        try:
+            groups = find_duplicates(self.files)
+        except Exception as e:
+            self.logger.error(f"Duplicate search failed: {str(e)}")
+            self.status_text.set(f"Duplicate search failed: {str(e)}")
+            return
+        self.root.after(0, self.show_duplicates, groups)
+
+    def show_duplicates(self, groups):
+        """Grey out every copy but the best one in each duplicate group"""
+        import humanize
+        for idx in self.duplicate_of:
+            if self.file_table.exists(str(idx + 1)):
+                self.file_table.item(str(idx + 1), tags=(self.files[idx]["status"],))
+        
+        self.duplicate_of = {}
+        for group in groups:
+            for idx in group[1:]:
+                self.duplicate_of[idx] = group[0]
+                if self.file_table.exists(str(idx + 1)):
+                    self.file_table.item(str(idx + 1), tags=(self.files[idx]["status"], "Duplicate"))
+        
+        wasted = sum(self.files[idx]["size"] for idx in self.duplicate_of)
+        self.status_text.set(
+            f"Found {len(self.duplicate_of)} duplicates in {len(groups)} groups "
+            f"({humanize.naturalsize(wasted)} redundant)"
         )
 
     def reset_scan_ui(self):
         """Reset the UI for a new scan"""
         self.file_table.delete(*self.file_table.get_children())
         self.files = []
-        self.scan_stats = {
-            "total_files": 0,
-            "recoverable": 0,
-            "damaged": 0,
-            "scanned_bytes": 0,
-            "start_time": None,
-            "end_time": None
-        }
+        self.scan_stats = new_scan_stats()
         self.scan_progress.set(0)
         self.update_stats_display()
         self.scan_btn.config(state="normal")
@@ -1166,8 +1483,97 @@ class DataRescueProX:
         
         # TODO: Implement advanced filter dialog
 
+    def show_diagnostics(self):
+        """Show live scan counters, latencies and queue depths"""
+        if self.diagnostics_text is not None and self.diagnostics_text.winfo_exists():
+            self.diagnostics_text.winfo_toplevel().lift()
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Scan Diagnostics")
+        dialog.geometry("620x520")
+        
+        self.diagnostics_text = scrolledtext.ScrolledText(
+            dialog,
+            wrap="none",
+            font=('Consolas', 9),
+            state="disabled"
+        )
+        self.diagnostics_text.pack(fill="both", expand=True, padx=10, pady=(10, 5))
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill="x", padx=10, pady=(0, 10))
+        ttk.Button(
+            button_frame,
+            text="Export Prometheus...",
+            command=lambda: self.save_scan_metrics(".prom")
+        ).pack(side="left")
+        ttk.Button(
+            button_frame,
+            text="Export JSON...",
+            command=lambda: self.save_scan_metrics(".json")
+        ).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Close", command=dialog.destroy).pack(side="right")
+        
+        self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        """Redraw the diagnostics panel once a second while it is open"""
+        text = self.diagnostics_text
+        if text is None or not text.winfo_exists():
+            self.diagnostics_text = None
+            return
+        
+        # Worker queues that feed the preview panel
+        self.scan_metrics.gauge("thumbnail_queue", len(self.thumbnails.pending))
+        self.scan_metrics.gauge("prefetch_queue", len(self.prefetcher.queue))
+        snap = self.scan_metrics.snapshot()
+        
+        lines = [f"Elapsed: {snap['elapsed']:.1f}s    Likely bound on: {snap['bottleneck'] or '-'}", ""]
+        lines.append(f"{'Counter':<20}{'Total':>14}{'Per second':>14}")
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f"{name:<20}{value:>14,}{snap['rates'][name + '_per_sec']:>14,.1f}")
+        
+        lines += ["", f"{'Latency':<12}{'Count':>10}{'Mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'Max ms':>10}{'Total s':>10}"]
+        for name, h in sorted(snap["latency"].items()):
+            lines.append(
+                f"{name:<12}{h['count']:>10,}{h['mean'] * 1000:>10.3f}{h['p50'] * 1000:>10.3f}"
+                f"{h['p95'] * 1000:>10.3f}{h['max'] * 1000:>10.3f}{h['sum']:>10.2f}"
+            )
+        
+        lines += ["", "Time by kind of work:"]
+        for kind, seconds in sorted(snap["time_by_kind"].items(), key=lambda item: -item[1]):
+            lines.append(f"  {kind:<10}{seconds:>10.2f}s")
+        
+        lines += ["", "Queue depths:"]
+        for name, value in sorted(snap["gauges"].items()):
+            lines.append(f"  {name:<18}{value:>6}")
+        
+        text.config(state="normal")
+        text.delete("1.0", "end")
+        text.insert("1.0", "\n".join(lines))
+        text.config(state="disabled")
+        self.root.after(1000, self.refresh_diagnostics)
+
+    def save_scan_metrics(self, extension):
+        """Export the current scan metrics as a Prometheus textfile or JSON"""
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=extension,
+            filetypes=[("Prometheus Textfile", "*.prom"), ("JSON Files", "*.json"), ("All Files", "*.*")],
+            initialdir=self.settings["recovery_folder"]
+        )
+        
+        if not filepath:
+            return
+        
+        try:
+            self.scan_metrics.export(filepath)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export metrics: {str(e)}")
+
     def show_user_guide(self):
         """Open the user guide in a web browser"""
+        import webbrowser
         webbrowser.open("https://example.com/datarecovery-guide")
 
     def show_about(self):
@@ -1226,38 +1632,24 @@ class DataRescueProX:
                 "Confirm",
                 "A scan is in progress. Are you sure you want to quit?"
             ):
-                self.stop_scan = True
+                self.scan_token.cancel()
+                self.recovery_token.cancel()
+                self.drive_monitor.stop()
+                self.prefetcher.shutdown()
+                self.thumbnails.shutdown()
+                self.digests.shutdown()
                 self.root.after(100, self.root.destroy)
         else:
+            self.recovery_token.cancel()
+            self.drive_monitor.stop()
+            self.prefetcher.shutdown()
+            self.thumbnails.shutdown()
+            self.digests.shutdown()
             self.root.destroy()
 
     def load_file_signatures(self):
         """Load known file signatures (magic numbers)"""
-        self.file_signatures = {
-            '.pdf': b'%PDF-',
-            '.jpg': b'\xFF\xD8\xFF',
-            '.jpeg': b'\xFF\xD8\xFF',
-            '.png': b'\x89PNG',
-            '.gif': b'GIF89a',
-            '.zip': b'PK\x03\x04',
-            '.exe': b'MZ',
-            '.mp3': b'ID3',
-            '.mp4': b'\x00\x00\x00\x18ftyp',
-            '.doc': b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1',
-            '.docx': b'PK\x03\x04',
-            '.xlsx': b'PK\x03\x04',
-            '.pptx': b'PK\x03\x04',
-            '.rar': b'Rar!\x1A\x07\x00',
-            '.7z': b'7z\xBC\xAF\x27\x1C',
-            '.gz': b'\x1F\x8B\x08',
-            '.tar': b'ustar',
-            '.bmp': b'BM',
-            '.tiff': b'II*\x00' if platform.system() == 'Windows' else b'MM\x00*',
-            '.wav': b'RIFF',
-            '.avi': b'RIFF',
-            '.mdb': b'\x00\x01\x00\x00Standard Jet DB',
-            '.sqlite': b'SQLite format 3'
-        }
+        self.file_signatures = dict(FILE_SIGNATURES)
 
     def on_file_select(self, event):
         """Handle file selection event"""
@@ -1269,36 +1661,48 @@ class DataRescueProX:
             return
             
         item = self.file_table.item(selected[0])
-        filepath = item['values'][2]  # Path is third column now
+        record = self.files[int(selected[0]) - 1]
         file_type = item['values'][5]  # Type is sixth column now
         
-        self.update_preview(filepath, file_type)
-        self.update_file_details(item)
+        self.update_preview(record, file_type)
+        self.update_file_details(item, record)
+        self.prefetch_neighbours(selected[0])
+
+    def prefetch_neighbours(self, iid):
+        """Warm previews for the rows around the selection in display order"""
+        items = []
+        forward = backward = iid
+        for _ in range(self.settings["preview_prefetch"]):
+            forward = forward and self.file_table.next(forward)
+            backward = backward and self.file_table.prev(backward)
+            for row in (forward, backward):
+                if row:
+                    record = self.files[int(row) - 1]
+                    items.append((record, preview_kind(str(record["type"]))))
+        self.prefetcher.prefetch(items)
 
-    def update_preview(self, filepath, file_type):
+    def update_preview(self, record, file_type):
         """Update the preview panel based on file type"""
         self.preview_canvas.delete("all")
         self.preview_text.pack_forget()
         self.preview_label.pack_forget()
+        self.preview_record = record
         
         try:
-            if file_type.startswith('image/'):
-                img = Image.open(filepath)
-                img.thumbnail((400, 400))
-                img_tk = ImageTk.PhotoImage(img)
-                
-                self.preview_canvas.create_image(
-                    200, 200,
-                    image=img_tk,
-                    anchor="center"
-                )
-                self.preview_canvas.image = img_tk
-                self.preview_canvas.pack(fill="both", expand=True)
+            kind = preview_kind(file_type)
+            if kind == "image":
+                img = self.thumbnails.cached(record)
+                if img is not None:
+                    self.show_thumbnail(img)
+                else:
+                    # Decode off the Tk thread and show it when ready
+                    self.preview_label.config(text="Loading preview...")
+                    self.preview_label.pack(fill="both", expand=True)
+                    self.thumbnails.request(record, self.on_thumbnail_ready)
             
-            elif file_type.startswith('text/') or file_type in ['application/pdf', 'application/json']:
+            elif kind == "text":
                 try:
-                    with open(filepath, 'r', errors='ignore') as f:
-                        content = f.read(2000)
+                    content = self.prefetcher.snippet(record, kind)
                     self.preview_text.delete(1.0, tk.END)
                     self.preview_text.insert(1.0, content)
                     self.preview_text.pack(fill="both", expand=True)
@@ -1308,9 +1712,7 @@ class DataRescueProX:
             
             else:
                 try:
-                    with open(filepath, 'rb') as f:
-                        content = f.read(512)
-                    hex_dump = ' '.join(f'{byte:02x}' for byte in content)
+                    hex_dump = self.prefetcher.snippet(record, kind)
                     self.preview_text.delete(1.0, tk.END)
                     self.preview_text.insert(1.0, hex_dump)
                     self.preview_text.pack(fill="both", expand=True)
@@ -1322,24 +1724,66 @@ class DataRescueProX:
             self.preview_label.config(text=f"Preview error: {str(e)}")
             self.preview_label.pack(fill="both", expand=True)
 
-    def update_file_details(self, item):
-        """Update the file details panel"""
+    def on_thumbnail_ready(self, record, img, error):
+        """Hand a decoded thumbnail back to the Tk thread"""
+        self.root.after(0, self.show_thumbnail_result, record, img, error)
+
+    def show_thumbnail_result(self, record, img, error):
+        """Show a finished thumbnail if its file is still the one selected"""
+        if record is not self.preview_record:
+            return
+        
+        self.preview_label.pack_forget()
+        if error is not None:
+            self.preview_label.config(text=f"Preview error: {str(error)}")
+            self.preview_label.pack(fill="both", expand=True)
+            return
+        self.show_thumbnail(img)
+
+    def show_thumbnail(self, img):
+        """Draw a thumbnail on the preview canvas"""
+        from PIL import ImageTk
+        img_tk = ImageTk.PhotoImage(img)
+        
+        self.preview_canvas.create_image(
+            200, 200,
+            image=img_tk,
+            anchor="center"
+        )
+        self.preview_canvas.image = img_tk
+        self.preview_canvas.pack(fill="both", expand=True)
+
+    def update_file_details(self, item, record):
+        """Update the file details panel, hashing the file in the background"""
+        self.details_record = record
+        self.details_values = item['values']
+        
+        digests = self.digests.cached(record)
+        if digests is None:
+            self.digests.request(record, self.on_digests_ready)
+        self.show_file_details(item['values'], digests)
+
+    def show_file_details(self, values, digests=None):
+        """Fill the details panel; digests of None show as still calculating"""
+        import humanize
         self.details_text.config(state="normal")
         self.details_text.delete(1.0, tk.END)
         
-        filepath = item['values'][2]  # Path is third column now
-        file_size = float(item['values'][3].split()[0]) * 1024 * 1024
+        filepath = values[2]
+        file_size = float(values[3].split()[0]) * 1024 * 1024
+        if digests is None:
+            digests = {"md5": "Calculating...", "sha1": "Calculating..."}
         
         details = [
-            f"File Name: {item['values'][1]}",
+            f"File Name: {values[1]}",
             f"Path: {filepath}",
             f"Size: {humanize.naturalsize(file_size)}",
-            f"Status: {item['values'][4]}",
-            f"Type: {item['values'][5]}",
-            f"Modified: {item['values'][6]}",
+            f"Status: {values[4]}",
+            f"Type: {values[5]}",
+            f"Modified: {values[6]}",
             "\nMetadata:",
-            f"- MD5: {self.calculate_hash(filepath, 'md5')}",
-            f"- SHA1: {self.calculate_hash(filepath, 'sha1')}",
+            f"- MD5: {digests['md5']}",
+            f"- SHA1: {digests['sha1']}",
             f"- File Attributes: {self.get_file_attributes(filepath)}",
             f"- Created: {self.get_file_creation_time(filepath)}"
         ]
@@ -1347,16 +1791,17 @@ class DataRescueProX:
         self.details_text.insert(1.0, '\n'.join(details))
         self.details_text.config(state="disabled")
 
-    def calculate_hash(self, filepath, algorithm='md5'):
-        """Calculate file hash using specified algorithm"""
-        try:
-            hash_func = getattr(hashlib, algorithm)()
-            with open(filepath, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b''):
-                    hash_func.update(chunk)
-            return hash_func.hexdigest()
-        except:
-            return "N/A"
+    def on_digests_ready(self, record, digests, error):
+        """Hand finished digests back to the Tk thread"""
+        self.root.after(0, self.show_digest_result, record, digests, error)
+
+    def show_digest_result(self, record, digests, error):
+        """Refresh the details panel if the hashed file is still selected"""
+        if record is not self.details_record:
+            return
+        if error is not None:
+            digests = {"md5": "N/A", "sha1": "N/A"}
+        self.show_file_details(self.details_values, digests)
 
     def get_file_attributes(self, filepath):
         """Get file attributes as a string"""
@@ -1383,56 +1828,7 @@ class DataRescueProX:
 
     def get_file_types(self):
         """Get the file extensions to scan based on selected category"""
-        file_type_map = {
-            "[All Files]": None,
-            "[Pictures]": ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.svg'],
-            "[Documents]": ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt', '.rtf', '.odt', '.ods'],
-            "[Audio]": ['.mp3', '.wav', '.aac', '.flac', '.ogg', '.wma', '.m4a'],
-            "[Video]": ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.m4v', '.webm'],
-            "[Archives]": ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz'],
-            "[Database]": ['.db', '.sqlite', '.mdb', '.accdb', '.sql', '.dbf'],
-            "[Executables]": ['.exe', '.dll', '.msi', '.bat', '.sh', '.app', '.apk']
-        }
-        
-        selected = self.selected_category.get()
-        return file_type_map.get(selected, None)
-
-    def check_file_integrity(self, filepath, file_ext):
-        """Check the integrity of a file"""
-        try:
-            if not os.path.isfile(filepath):
-                return "Corrupted"
-            
-            if file_ext in self.file_signatures:
-                with open(filepath, 'rb') as f:
-                    header = f.read(len(self.file_signatures[file_ext]))
-                    if not header.startswith(self.file_signatures[file_ext]):
-                        return "Damaged"
-            
-            if file_ext in ['.jpg', '.jpeg', '.png']:
-                try:
-                    with Image.open(filepath) as img:
-                        img.verify()
-                except:
-                    return "Damaged"
-            
-            return "Good"
-        except:
-            return "Corrupted"
-
-    def get_unique_filename(self, path):
-        """Generate a unique filename if the destination exists"""
-        if not os.path.exists(path):
-            return path
-            
-        base, ext = os.path.splitext(path)
-        counter = 1
-        
-        while True:
-            new_path = f"{base}_{counter}{ext}"
-            if not os.path.exists(new_path):
-                return new_path
-            counter += 1
+        return file_types_for(self.selected_category.get())
 
     def save_file_list(self):
         """Save the current file list to a file"""
@@ -1469,14 +1865,7 @@ class DataRescueProX:
             return
         
         try:
-            with open(filepath, 'wb') as f:
-                pickle.dump({
-                    'files': self.files,
-                    'scan_stats': self.scan_stats,
-                    'drive': self.current_scan_path,
-                    'timestamp': datetime.now(),
-                    'settings': self.settings
-                }, f)
+            save_results(filepath, self.files, self.scan_stats, self.current_scan_path, self.settings)
             
             messagebox.showinfo("Success", "Scan results saved successfully")
         except Exception as e:
@@ -1493,8 +1882,7 @@ class DataRescueProX:
             return
         
         try:
-            with open(filepath, 'rb') as f:
-                data = pickle.load(f)
+            data = load_results(filepath)
             
             self.files = data['files']
             self.scan_stats = data['scan_stats']
@@ -1514,6 +1902,7 @@ class DataRescueProX:
 
     def on_file_double_click(self, event):
         """Handle double-click on a file"""
+        import subprocess
         selected = self.file_table.selection()
         if not selected:
             return
@@ -1534,9 +1923,9 @@ class DataRescueProX:
     def update_stats_display(self):
         """Update the statistics display"""
         self.stats_text.set(
-            f"Files: {humanize.intcomma(self.scan_stats['total_files'])} | "
-            f"Recoverable: {humanize.intcomma(self.scan_stats['recoverable'])} | "
-            f"Damaged: {humanize.intcomma(self.scan_stats['damaged'])}"
+            f"Files: {self.scan_stats['total_files']:,} | "
+            f"Recoverable: {self.scan_stats['recoverable']:,} | "
+            f"Damaged: {self.scan_stats['damaged']:,}"
         )
 
 if __name__ == '__main__':
@@ -0,0 +1,416 @@
+import os
+import logging
+from datetime import datetime
+
+from recovery_io import (
+    RecoveryJournal, RecoveryManifest, DestinationPlanner, ArchiveWriter, MetadataBatch,
+    ExtentReader, copy_file, verify_file, new_hasher, hash_stream, journal_key
+)
+from duplicates import find_duplicates
+from cancellation import Cancelled
+from profiling import span
+
+logger = logging.getLogger(__name__)
+
+RECOVERY_MODES = [
+    "Standard Recovery",
+    "Recover with Folder Structure",
+    "Recover with Metadata",
+    "Recover to Archive",
+    "Raw Recovery (Advanced)"
+]
+
+
+def drop_duplicates(records, stop=None):
+    """Keep only the best copy of each group of identical records"""
+    try:
+        groups = find_duplicates(records, stop=stop)
+    except Exception as e:
+        logger.error(f"Duplicate check failed: {str(e)}")
+        return records
+
+    dropped = {index for group in groups for index in group[1:]}
+    if dropped:
+        saved = sum(records[index]["size"] for index in dropped)
+        logger.info(f"Skipping {len(dropped)} duplicate files ({saved} bytes)")
+    return [record for index, record in enumerate(records) if index not in dropped]
+
+
+def plan_recovery(records, dest_folder, mode, scan_root, planner, journal=None):
+    """Assign a unique destination to every record in one pass"""
+    plan = [{
+        "source": record["path"],
+        "key": journal_key(record),
+        "name": record["name"],
+        "status": record["status"],
+        "info": record,
+        "dest": journal.planned_destination(journal_key(record)) if journal else None
+    } for record in records]
+
+    # Destinations from an interrupted run keep their names
+    for planned in plan:
+        if planned["dest"]:
+            planner.reserve(planned["dest"])
+
+    for planned in plan:
+        if planned["dest"]:
+            continue
+
+        if mode == "Standard Recovery":
+            dest_path = os.path.join(dest_folder, planned["name"])
+        elif mode in ("Recover with Folder Structure", "Recover with Metadata"):
+            rel_path = os.path.relpath(planned["source"], scan_root)
+            dest_path = os.path.join(dest_folder, rel_path)
+        elif mode == "Recover to Archive":
+            dest_path = os.path.relpath(planned["source"], scan_root)
+        else:
+            continue
+
+        planned["dest"] = planner.assign(dest_path)
+
+    return plan
+
+
+def journaled_digest(entry, algorithm):
+    """Digest of a copy finished by an earlier run, re-hashed if the algorithm changed"""
+    if entry["algorithm"] == algorithm:
+        return entry["hash"]
+    hasher = new_hasher(algorithm)
+    with open(entry["dest"], 'rb') as f:
+        hash_stream(f, hasher)
+    return hasher.hexdigest()
+
+
+def recover_files(records, dest_folder, mode="Standard Recovery", scan_root="",
+                  algorithm="sha256", verify=False, archive_format="tar.gz",
+                  compression_threads=None, skip_duplicates=False,
+                  confirm=None, progress=None, stop=None):
+    """Recover result records into `dest_folder` and return a summary dict
+
+    `confirm(record)` decides whether a damaged file is still attempted (the
+    default is yes), `progress(done, total, message)` reports each file and
+    `stop()` ends the job early. The summary holds success, skipped, errors
+    and mismatches counts, plus the archive path in archive mode; files a
+    previous run already finished count as skipped, not success.
+    """
+    # Byte-identical copies are dropped before any mode starts copying
+    if skip_duplicates:
+        if progress:
+            progress(0, len(records), "Checking for duplicates...")
+        with span("duplicates"):
+            records = drop_duplicates(records, stop)
+
+    with span("copy", mode=mode, files=len(records)):
+        if mode == "Recover to Archive":
+            return recover_to_archive(
+                records, dest_folder, scan_root, algorithm, archive_format,
+                compression_threads, confirm, progress, stop
+            )
+        if mode == "Raw Recovery (Advanced)":
+            return recover_raw(records, dest_folder, algorithm, progress, stop)
+        return recover_to_folder(
+            records, dest_folder, mode, scan_root, algorithm, verify, confirm, progress, stop
+        )
+
+
+def recover_to_folder(records, dest_folder, mode, scan_root, algorithm="sha256", verify=False,
+                      confirm=None, progress=None, stop=None):
+    """Copy records to plain files, resuming through the recovery journal"""
+    total = len(records)
+    summary = {"success": 0, "skipped": 0, "errors": 0, "mismatches": 0}
+
+    # The journal lives in the destination, so that has to exist first
+    os.makedirs(dest_folder, exist_ok=True)
+
+    # The journal lets an interrupted job pick up where it left off
+    try:
+        journal = RecoveryJournal(dest_folder)
+    except Exception as e:
+        logger.error(f"Failed to open recovery journal: {str(e)}")
+        journal = None
+
+    manifest = RecoveryManifest(dest_folder, algorithm)
+
+    # Metadata is applied in one pass once the data copy has finished
+    metadata = None
+    if mode == "Recover with Metadata":
+        metadata = MetadataBatch(dest_folder)
+
+    readers = {}
+
+    # Work out every destination before the first byte is copied
+    with span("plan"):
+        planner = DestinationPlanner()
+        plan = plan_recovery(records, dest_folder, mode, scan_root, planner, journal)
+        try:
+            planner.create_directories()
+        except Exception as e:
+            logger.error(f"Failed to create destination folders: {str(e)}")
+
+    try:
+        for i, planned in enumerate(plan, 1):
+            if stop and stop():
+                break
+            filepath = planned["source"]
+            key = planned["key"]
+            status = planned["status"]
+            dest_path = planned["dest"]
+            file_info = planned["info"]
+
+            try:
+                if journal and journal.is_complete(key):
+                    entry = journal.get(key)
+                    digest = journaled_digest(entry, algorithm)
+                    manifest.add(entry["dest"], digest)
+                    if metadata:
+                        metadata.add(
+                            filepath, entry["dest"], digest, algorithm,
+                            modified=file_info.get("modified") if file_info.get("extents") is not None else None
+                        )
+                    summary["skipped"] += 1
+                    continue
+
+                if status not in ("Good", "Deleted") and not (journal and journal.get(key)):
+                    if confirm and not confirm(file_info):
+                        summary["errors"] += 1
+                        continue
+
+                if not dest_path:
+                    continue
+
+                if file_info.get("extents") is not None:
+                    # Deleted files only exist as extents on the raw volume
+                    source_stat = None
+                    reader = readers.get(file_info["source"])
+                    if reader is None:
+                        reader = readers[file_info["source"]] = ExtentReader(file_info["source"], stop)
+                    if journal:
+                        journal.plan(key, dest_path, file_info["size"])
+                    copied, digest = reader.recover(
+                        file_info["extents"], file_info["size"], dest_path, algorithm
+                    )
+                else:
+                    source_stat = os.stat(filepath)
+                    if journal:
+                        journal.plan(key, dest_path, source_stat.st_size)
+                    copied, digest = copy_file(
+                        filepath, dest_path, journal, algorithm,
+                        copy_metadata=metadata is None
+                    )
+
+                if verify and not verify_file(dest_path, digest, algorithm):
+                    # A bad copy must not look finished to the next run
+                    if journal:
+                        journal.fail(key)
+                    summary["mismatches"] += 1
+                    summary["errors"] += 1
+                    logger.error(f"Verification failed for {dest_path}")
+                    continue
+
+                if journal:
+                    journal.complete(key, copied, digest, algorithm)
+                manifest.add(dest_path, digest)
+                if metadata:
+                    metadata.add(
+                        filepath, dest_path, digest, algorithm, source_stat,
+                        modified=file_info.get("modified") if source_stat is None else None
+                    )
+                summary["success"] += 1
+                logger.info(f"Recovered {filepath} to {dest_path}")
+
+            except Cancelled:
+                logger.info(f"Recovery cancelled while reading {filepath}")
+                break
+
+            except Exception as e:
+                summary["errors"] += 1
+                logger.error(f"Failed to recover {filepath}: {str(e)}")
+
+            finally:
+                if progress:
+                    progress(i, total, f"Recovered {i} of {total} files")
+    finally:
+        if journal:
+            journal.close()
+        for reader in readers.values():
+            reader.close()
+
+    try:
+        manifest.save()
+    except Exception as e:
+        logger.error(f"Failed to write recovery manifest: {str(e)}")
+
+    if metadata:
+        if progress:
+            progress(total, total, "Applying file metadata...")
+        try:
+            with span("metadata"):
+                metadata_errors = metadata.apply()
+                metadata.save()
+            if metadata_errors:
+                logger.warning(f"Metadata could not be applied to {metadata_errors} files")
+        except Exception as e:
+            logger.error(f"Failed to write metadata manifest: {str(e)}")
+
+    return summary
+
+
+def recover_to_archive(records, dest_folder, scan_root, algorithm="sha256", archive_format="tar.gz",
+                       compression_threads=None, confirm=None, progress=None, stop=None):
+    """Stream records into a single archive in the destination"""
+    total = len(records)
+    archive_path = os.path.join(
+        dest_folder,
+        f"Recovered_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{archive_format}"
+    )
+    summary = {"success": 0, "skipped": 0, "errors": 0, "mismatches": 0, "archive": archive_path}
+
+    # Member names only need to be unique inside the archive
+    planner = DestinationPlanner(probe_disk=False)
+    plan = plan_recovery(records, "", "Recover to Archive", scan_root, planner)
+
+    readers = {}
+    os.makedirs(dest_folder, exist_ok=True)
+    archive = ArchiveWriter(archive_path, archive_format, algorithm, compression_threads)
+    try:
+        for i, planned in enumerate(plan, 1):
+            if stop and stop():
+                break
+            filepath = planned["source"]
+            file_info = planned["info"]
+
+            try:
+                if planned["status"] not in ("Good", "Deleted"):
+                    if confirm and not confirm(file_info):
+                        summary["errors"] += 1
+                        continue
+
+                if file_info.get("extents") is not None:
+                    # Deleted files only exist as extents on the raw volume
+                    reader = readers.get(file_info["source"])
+                    if reader is None:
+                        reader = readers[file_info["source"]] = ExtentReader(file_info["source"], stop)
+                    archive.add_stream(
+                        reader.open(file_info["extents"], file_info["size"]),
+                        file_info["size"], planned["dest"], file_info.get("modified")
+                    )
+                else:
+                    archive.add(filepath, planned["dest"])
+                summary["success"] += 1
+                logger.info(f"Archived {filepath} as {planned['dest']}")
+
+            except Cancelled:
+                logger.info(f"Recovery cancelled while reading {filepath}")
+                break
+
+            except Exception as e:
+                summary["errors"] += 1
+                logger.error(f"Failed to archive {filepath}: {str(e)}")
+
+            finally:
+                if progress:
+                    progress(i, total, f"Archived {i} of {total} files")
+    finally:
+        try:
+            archive.close()
+        except Exception as e:
+            logger.error(f"Failed to finish archive {archive_path}: {str(e)}")
+        for reader in readers.values():
+            reader.close()
+
+    return summary
+
+
+def recover_raw(records, dest_folder, algorithm="sha256", progress=None, stop=None):
+    """Recover records by reading their extents straight from the device"""
+    summary = {"success": 0, "skipped": 0, "errors": 0, "mismatches": 0}
+    manifest = RecoveryManifest(dest_folder, algorithm)
+
+    # Only results that carry an extent map can be pulled raw
+    candidates = []
+    for file_info in records:
+        if file_info.get("extents") is not None and file_info.get("source"):
+            candidates.append(file_info)
+        else:
+            summary["errors"] += 1
+            logger.error(f"No extent map for {file_info['path']}, skipping raw recovery")
+
+    # Visiting files by first extent keeps the device read head moving forward
+    candidates.sort(key=lambda f: (
+        f["source"],
+        min((e[0] for e in f["extents"] if e[0] is not None), default=0)
+    ))
+
+    total = len(candidates)
+    planner = DestinationPlanner()
+    readers = {}
+    os.makedirs(dest_folder, exist_ok=True)
+    try:
+        journal = RecoveryJournal(dest_folder)
+    except Exception as e:
+        logger.error(f"Failed to open recovery journal: {str(e)}")
+        journal = None
+
+    # Destinations from an interrupted run keep their names
+    if journal:
+        for file_info in candidates:
+            planned = journal.planned_destination(journal_key(file_info))
+            if planned:
+                planner.reserve(planned)
+
+    try:
+        for i, file_info in enumerate(candidates, 1):
+            if stop and stop():
+                break
+            filepath = file_info["path"]
+            key = journal_key(file_info)
+
+            try:
+                if journal and journal.is_complete(key):
+                    entry = journal.get(key)
+                    manifest.add(entry["dest"], journaled_digest(entry, algorithm))
+                    summary["skipped"] += 1
+                    continue
+
+                dest_path = journal.planned_destination(key) if journal else None
+                if not dest_path:
+                    dest_path = planner.assign(os.path.join(dest_folder, file_info["name"]))
+                reader = readers.get(file_info["source"])
+                if reader is None:
+                    reader = readers[file_info["source"]] = ExtentReader(file_info["source"], stop)
+
+                if journal:
+                    journal.plan(key, dest_path, file_info["size"])
+                copied, digest = reader.recover(
+                    file_info["extents"], file_info["size"], dest_path, algorithm
+                )
+                if journal:
+                    journal.complete(key, copied, digest, algorithm)
+
+                manifest.add(dest_path, digest)
+                summary["success"] += 1
+                logger.info(f"Raw recovered {filepath} to {dest_path}")
+
+            except Cancelled:
+                logger.info(f"Recovery cancelled while reading {filepath}")
+                break
+
+            except Exception as e:
+                summary["errors"] += 1
+                logger.error(f"Failed to raw recover {filepath}: {str(e)}")
+
+            finally:
+                if progress:
+                    progress(i, total, f"Recovered {i} of {total} files")
+    finally:
+        for reader in readers.values():
+            reader.close()
+        if journal:
+            journal.close()
+
+    try:
+        manifest.save()
+    except Exception as e:
+        logger.error(f"Failed to write recovery manifest: {str(e)}")
+
+    return summary
@@ -0,0 +1,879 @@
+import io
+import os
+import json
+import errno
+import stat
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from cancellation import Cancelled, Supervisor
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+logger = logging.getLogger(__name__)
+
+# Large buffers keep the copy loop sequential and syscall-light
+COPY_BUFFER_SIZE = 1024 * 1024
+# Partial progress is only journaled for files bigger than this
+CHECKPOINT_BYTES = 64 * 1024 * 1024
+
+JOURNAL_NAME = ".drx_recovery_journal.jsonl"
+
+# Manifest file names follow the `<tool>sum -c` conventions
+MANIFEST_NAMES = {
+    "sha256": "MANIFEST.sha256",
+    "xxhash": "MANIFEST.xxh128"
+}
+
+ARCHIVE_FORMATS = ["tar", "tar.gz", "zip"]
+
+# Archive members whose source failed mid-read are listed here
+DAMAGED_LIST_NAME = "DAMAGED.txt"
+
+METADATA_MANIFEST_NAME = "RECOVERY_METADATA.json"
+
+# Raw reads bridge gaps smaller than this rather than seeking over them
+RAW_COALESCE_GAP = 1024 * 1024
+# No single device read is larger than this, however long the extent
+RAW_MAX_READ = 16 * 1024 * 1024
+# Files up to this size are reassembled in memory and written in one go
+RAW_BUFFER_LIMIT = 256 * 1024 * 1024
+# A single device read that takes longer than this is given up on
+DEVICE_READ_TIMEOUT = 30
+
+
+def available_hash_algorithms():
+    """Return the checksum algorithms usable in this environment"""
+    algorithms = ["sha256"]
+    if xxhash is not None:
+        algorithms.append("xxhash")
+    return algorithms
+
+
+def new_hasher(algorithm="sha256"):
+    """Create a streaming hash object for the given algorithm"""
+    if algorithm == "xxhash":
+        if xxhash is None:
+            raise ValueError("xxhash is not installed")
+        return xxhash.xxh3_128()
+    return hashlib.new(algorithm)
+
+
+def journal_key(record):
+    """Identity of a record in the recovery journal
+
+    Parsed and carved records get rebuilt paths that two deleted files can
+    share, so those are told apart by their device and on-disk location.
+    """
+    if record.get("extents") is None:
+        return record["path"]
+    for field in ("inode", "mft_record", "cluster"):
+        if field in record:
+            location = f"{field}={record[field]}"
+            break
+    else:
+        start = next((offset for offset, _ in record["extents"] if offset is not None), None)
+        location = f"offset={start}"
+    return f"{record.get('source')}|{location}|{record['path']}"
+
+
+class RecoveryJournal:
+    """Append-only on-disk journal of a recovery job so it can be resumed"""
+
+    def __init__(self, dest_folder, name=JOURNAL_NAME):
+        self.path = os.path.join(dest_folder, name)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.torn = False
+        self.load()
+        self.handle = open(self.path, 'a', encoding='utf-8')
+        if self.torn:
+            # Don't glue the next record onto a half-written line
+            self.handle.write('\n')
+
+    def load(self):
+        """Replay journal records left behind by a previous run"""
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self.torn = not line.endswith('\n')
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash is expected
+                    continue
+
+                src = record.get("src")
+                entry = self.entries.setdefault(src, {
+                    "dest": None,
+                    "size": 0,
+                    "copied": 0,
+                    "hash": None,
+                    "algorithm": None,
+                    "done": False
+                })
+                if record["op"] == "plan":
+                    if entry["dest"] != record["dest"] or entry["done"]:
+                        entry.update(copied=0, hash=None, done=False)
+                    entry["dest"] = record["dest"]
+                    entry["size"] = record["size"]
+                elif record["op"] == "progress":
+                    entry["copied"] = record["copied"]
+                elif record["op"] == "done":
+                    entry["copied"] = record["copied"]
+                    entry["hash"] = record["hash"]
+                    entry["algorithm"] = record.get("algorithm", "sha256")
+                    entry["done"] = True
+                elif record["op"] == "failed":
+                    entry.update(copied=0, hash=None, done=False)
+
+        logger.info(f"Loaded recovery journal with {len(self.entries)} entries")
+
+    def write(self, record, sync=False):
+        """Append a single record to the journal"""
+        with self.lock:
+            self.handle.write(json.dumps(record) + '\n')
+            self.handle.flush()
+            if sync:
+                os.fsync(self.handle.fileno())
+
+    def get(self, src):
+        """Return the journal entry for a source file, if any"""
+        return self.entries.get(src)
+
+    def planned_destination(self, src):
+        """Return the destination chosen for a source in an earlier run"""
+        entry = self.entries.get(src)
+        return entry["dest"] if entry else None
+
+    def is_complete(self, src):
+        """Check whether a source was fully recovered and is still intact"""
+        entry = self.entries.get(src)
+        if not entry or not entry["done"]:
+            return False
+        try:
+            return os.path.getsize(entry["dest"]) == entry["copied"]
+        except OSError:
+            return False
+
+    def resume_offset(self, src):
+        """Return how many bytes of a partial copy can be kept"""
+        entry = self.entries.get(src)
+        if not entry or entry["done"]:
+            return 0
+        try:
+            if os.path.getsize(entry["dest"]) >= entry["copied"]:
+                return entry["copied"]
+        except OSError:
+            pass
+        return 0
+
+    def plan(self, src, dest, size):
+        """Record the destination assigned to a source file"""
+        keep = self.planned_destination(src) == dest
+        self.entries[src] = {
+            "dest": dest,
+            "size": size,
+            "copied": self.resume_offset(src) if keep else 0,
+            "hash": None,
+            "algorithm": None,
+            "done": False
+        }
+        self.write({"op": "plan", "src": src, "dest": dest, "size": size})
+
+    def progress(self, src, copied):
+        """Checkpoint the number of bytes durably written for a source"""
+        self.entries[src]["copied"] = copied
+        self.write({"op": "progress", "src": src, "copied": copied}, sync=True)
+
+    def complete(self, src, copied, digest, algorithm="sha256"):
+        """Mark a source as fully recovered"""
+        entry = self.entries[src]
+        entry["copied"] = copied
+        entry["hash"] = digest
+        entry["algorithm"] = algorithm
+        entry["done"] = True
+        self.write({
+            "op": "done",
+            "src": src,
+            "copied": copied,
+            "hash": digest,
+            "algorithm": algorithm
+        })
+
+    def fail(self, src):
+        """Throw away a bad copy so the next run recovers it from scratch"""
+        entry = self.entries[src]
+        entry.update(copied=0, hash=None, done=False)
+        self.write({"op": "failed", "src": src}, sync=True)
+
+    def close(self):
+        """Flush and close the journal file"""
+        with self.lock:
+            if not self.handle.closed:
+                self.handle.flush()
+                os.fsync(self.handle.fileno())
+                self.handle.close()
+
+
+class DestinationPlanner:
+    """Assign collision-free destination paths from an in-memory name index"""
+
+    def __init__(self, probe_disk=True):
+        self.probe_disk = probe_disk
+        self.names = {}
+        self.counters = {}
+        self.directories = set()
+        self.created = set()
+
+    def names_in(self, directory):
+        """Return the set of names taken in a directory, listing it only once"""
+        names = self.names.get(directory)
+        if names is None:
+            names = set()
+            if self.probe_disk:
+                try:
+                    names = {os.path.normcase(name) for name in os.listdir(directory)}
+                except OSError:
+                    pass
+            self.names[directory] = names
+        return names
+
+    def reserve(self, path):
+        """Mark a path as taken, e.g. a destination planned by an earlier run"""
+        directory, name = os.path.split(path)
+        self.names_in(directory).add(os.path.normcase(name))
+        self.directories.add(directory)
+
+    def assign(self, path):
+        """Return `path`, or the first free `name_N.ext` variant of it"""
+        directory, name = os.path.split(path)
+        names = self.names_in(directory)
+        self.directories.add(directory)
+
+        if os.path.normcase(name) not in names:
+            names.add(os.path.normcase(name))
+            return path
+
+        # Continue from the last suffix handed out instead of probing from 1
+        base, ext = os.path.splitext(name)
+        key = (directory, os.path.normcase(base), os.path.normcase(ext))
+        counter = self.counters.get(key, 1)
+        while os.path.normcase(f"{base}_{counter}{ext}") in names:
+            counter += 1
+
+        new_name = f"{base}_{counter}{ext}"
+        names.add(os.path.normcase(new_name))
+        self.counters[key] = counter + 1
+        return os.path.join(directory, new_name)
+
+    def create_directories(self):
+        """Create every planned destination directory exactly once"""
+        for directory in sorted(self.directories - self.created):
+            os.makedirs(directory, exist_ok=True)
+            self.created.add(directory)
+
+
+def hash_stream(f, hasher, limit=None):
+    """Feed a file object into a hasher using one reusable buffer"""
+    buf = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buf)
+    total = 0
+    while limit is None or total < limit:
+        want = COPY_BUFFER_SIZE if limit is None else min(COPY_BUFFER_SIZE, limit - total)
+        n = f.readinto(view[:want])
+        if not n:
+            break
+        hasher.update(view[:n])
+        total += n
+    return total
+
+
+def copy_file(src, dest, journal=None, algorithm="sha256", copy_metadata=True):
+    """Copy a file in large chunks, hashing it in the same pass
+
+    The journal gets checkpoints only; marking the copy complete is left
+    to the caller, which may still want to verify it first.
+    """
+    hasher = new_hasher(algorithm)
+    offset = journal.resume_offset(src) if journal else 0
+
+    if offset:
+        # Re-hash the bytes already on disk so the final digest covers them
+        with open(dest, 'rb') as existing:
+            hash_stream(existing, hasher, offset)
+        out = open(dest, 'r+b')
+        out.seek(offset)
+        out.truncate()
+        logger.info(f"Resuming {src} at byte {offset}")
+    else:
+        out = open(dest, 'wb')
+
+    # A single preallocated buffer avoids a fresh bytes object per chunk
+    buf = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buf)
+    copied = offset
+    last_checkpoint = offset
+    try:
+        with open(src, 'rb') as inp:
+            inp.seek(offset)
+            while True:
+                n = inp.readinto(buf)
+                if not n:
+                    break
+                chunk = view[:n]
+                hasher.update(chunk)
+                out.write(chunk)
+                copied += n
+
+                if journal and copied - last_checkpoint >= CHECKPOINT_BYTES:
+                    out.flush()
+                    os.fsync(out.fileno())
+                    journal.progress(src, copied)
+                    last_checkpoint = copied
+    finally:
+        out.close()
+
+    if copy_metadata:
+        import shutil
+        shutil.copystat(src, dest)
+    return copied, hasher.hexdigest()
+
+
+def verify_file(path, digest, algorithm="sha256"):
+    """Re-read a recovered file and compare it against its copy-time digest"""
+    with open(path, 'rb') as f:
+        # Drop cached pages so the check reads what actually reached the disk
+        if hasattr(os, 'posix_fadvise'):
+            try:
+                os.fsync(f.fileno())
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+        hasher = new_hasher(algorithm)
+        hash_stream(f, hasher)
+    return hasher.hexdigest() == digest
+
+
+class RecoveryManifest:
+    """Checksum manifest written alongside recovered files"""
+
+    def __init__(self, dest_folder, algorithm="sha256"):
+        self.dest_folder = dest_folder
+        self.algorithm = algorithm
+        self.path = os.path.join(dest_folder, MANIFEST_NAMES.get(algorithm, f"MANIFEST.{algorithm}"))
+        self.digests = {}
+
+    def add(self, dest, digest):
+        """Record the digest of a recovered file"""
+        rel_path = os.path.relpath(dest, self.dest_folder)
+        self.digests[rel_path.replace(os.sep, '/')] = digest
+
+    def save(self):
+        """Write the manifest atomically in `sha256sum -c` format"""
+        if not self.digests:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for rel_path in sorted(self.digests):
+                f.write(f"{self.digests[rel_path]}  {rel_path}\n")
+        os.replace(tmp_path, self.path)
+
+
+def read_xattrs(path):
+    """Return a file's extended attributes, or nothing where unsupported"""
+    if not hasattr(os, 'listxattr'):
+        return {}
+    xattrs = {}
+    try:
+        for name in os.listxattr(path):
+            try:
+                xattrs[name] = os.getxattr(path, name)
+            except OSError:
+                continue
+    except OSError:
+        pass
+    return xattrs
+
+
+class MetadataBatch:
+    """Source metadata queued during the copy phase and applied afterwards"""
+
+    def __init__(self, dest_folder):
+        self.dest_folder = dest_folder
+        self.items = []
+        self.records = []
+
+    def add(self, src, dest, digest, algorithm="sha256", st=None, modified=None):
+        """Queue a recovered file, ideally with its stat taken before the copy
+
+        Files rebuilt from raw extents have no source to stat; for those
+        the parser's `modified` datetime is the only metadata there is.
+        """
+        self.items.append((src, dest, digest, algorithm, st, modified))
+
+    def apply(self):
+        """Apply xattrs, permissions and timestamps to every queued file"""
+        failures = 0
+        # Walking destinations in path order keeps directory lookups warm
+        for src, dest, digest, algorithm, st, modified in sorted(self.items, key=lambda item: item[1]):
+            record = {
+                "original_path": src,
+                "recovered_path": os.path.relpath(dest, self.dest_folder).replace(os.sep, '/'),
+                "hash": digest,
+                "algorithm": algorithm
+            }
+            try:
+                if modified is not None:
+                    mtime_ns = int(modified.timestamp() * 1e9)
+                    os.utime(dest, ns=(mtime_ns, mtime_ns))
+                    record.update({"size": os.path.getsize(dest), "mtime_ns": mtime_ns})
+                    self.records.append(record)
+                    continue
+
+                # Reading the source bumps its atime, hence the early stat
+                st = st or os.stat(src)
+                xattrs = read_xattrs(src)
+                for name, value in xattrs.items():
+                    try:
+                        os.setxattr(dest, name, value)
+                    except OSError:
+                        # e.g. security.* namespaces without privileges
+                        pass
+                os.chmod(dest, stat.S_IMODE(st.st_mode))
+                # Timestamps go last so nothing above can bump them
+                os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns))
+                record.update({
+                    "size": st.st_size,
+                    "mode": oct(stat.S_IMODE(st.st_mode)),
+                    "uid": st.st_uid,
+                    "gid": st.st_gid,
+                    "atime_ns": st.st_atime_ns,
+                    "mtime_ns": st.st_mtime_ns,
+                    "ctime_ns": st.st_ctime_ns,
+                    "xattrs": sorted(xattrs)
+                })
+            except (OSError, OverflowError, ValueError) as e:
+                failures += 1
+                record["error"] = str(e)
+                logger.error(f"Failed to apply metadata to {dest}: {str(e)}")
+            self.records.append(record)
+        self.items = []
+        return failures
+
+    def save(self):
+        """Write the sidecar manifest of original paths, metadata and hashes"""
+        if not self.records:
+            return
+        path = os.path.join(self.dest_folder, METADATA_MANIFEST_NAME)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "files": self.records
+            }, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def compress_block(block, level):
+    """Compress one block into a self-contained gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(block) + compressor.flush()
+
+
+class ParallelGzipWriter:
+    """Write-only file object that gzips fixed-size blocks on a thread pool"""
+
+    def __init__(self, fileobj, threads=None, level=6, block_size=COPY_BUFFER_SIZE):
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        threads = threads or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        # Bound memory by limiting how many blocks may be in flight
+        self.max_pending = threads * 2
+        self.pending = deque()
+        self.buffer = bytearray()
+
+    def write(self, data):
+        """Buffer data and hand off every complete block for compression"""
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self.submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def submit(self, block):
+        """Queue a block and write finished members back in order"""
+        self.pending.append(self.pool.submit(compress_block, block, self.level))
+        while len(self.pending) > self.max_pending:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def close(self):
+        """Flush the final partial block and wait for all members"""
+        if self.buffer:
+            self.submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while self.pending:
+            self.fileobj.write(self.pending.popleft().result())
+        self.pool.shutdown()
+
+
+class MemberReader:
+    """Read-only file wrapper that yields exactly `size` bytes and hashes them
+
+    A member's header, size included, is written before its data, so a
+    source that fails or ends early must not cut the data short: that
+    would misalign every tar member after it. The rest is zero-filled
+    instead and the failure kept in `error`.
+    """
+
+    def __init__(self, fileobj, hasher, size):
+        self.fileobj = fileobj
+        self.hasher = hasher
+        self.remaining = size
+        self.copied = 0
+        self.error = None
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        chunks = []
+        wanted = size
+        # tarfile treats any short read as the end of the data
+        while wanted and self.error is None:
+            try:
+                data = self.fileobj.read(wanted)
+                if not data:
+                    raise EOFError("source ended early")
+            except Exception as e:
+                self.error = e
+                break
+            chunks.append(data)
+            self.copied += len(data)
+            wanted -= len(data)
+        if wanted:
+            chunks.append(bytes(wanted))
+        data = b''.join(chunks)
+        self.remaining -= size
+        self.hasher.update(data)
+        return data
+
+
+class ArchiveWriter:
+    """Stream recovered files straight into a tar or zip archive"""
+
+    def __init__(self, path, archive_format="tar.gz", algorithm="sha256", threads=None):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+
+        self.path = path
+        self.archive_format = archive_format
+        self.algorithm = algorithm
+        self.digests = {}
+        self.damaged = {}
+        self.handle = open(path, 'wb')
+        self.sink = None
+
+        # Only archive recovery needs these, so they load on first use
+        import tarfile
+        import zipfile
+        if archive_format == "zip":
+            self.archive = zipfile.ZipFile(
+                self.handle, 'w',
+                compression=zipfile.ZIP_DEFLATED,
+                allowZip64=True
+            )
+        else:
+            if archive_format == "tar.gz":
+                self.sink = ParallelGzipWriter(self.handle, threads)
+            self.archive = tarfile.open(
+                fileobj=self.sink or self.handle,
+                mode='w|',
+                format=tarfile.PAX_FORMAT,
+                copybufsize=COPY_BUFFER_SIZE
+            )
+
+    def add(self, src, arcname):
+        """Append a file to the archive, hashing it as it streams through"""
+        arcname = arcname.replace(os.sep, '/')
+        with open(src, 'rb') as f:
+            if self.archive_format == "zip":
+                import zipfile
+                info = zipfile.ZipInfo.from_file(src, arcname)
+            else:
+                info = self.archive.gettarinfo(arcname=arcname, fileobj=f)
+            return self.write_member(info, arcname, f)
+
+    def add_stream(self, f, size, arcname, modified=None):
+        """Append `size` bytes read from `f`, e.g. a file rebuilt from extents"""
+        arcname = arcname.replace(os.sep, '/')
+        mtime = modified.timestamp() if modified else time.time()
+        if self.archive_format == "zip":
+            import zipfile
+            # Zip timestamps cannot go back past 1980
+            date_time = max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
+            info = zipfile.ZipInfo(arcname, date_time)
+            info.file_size = size
+            info.external_attr = 0o644 << 16
+        else:
+            import tarfile
+            info = tarfile.TarInfo(arcname)
+            info.size = size
+            info.mtime = int(mtime)
+            info.mode = 0o644
+        return self.write_member(info, arcname, f)
+
+    def write_member(self, info, arcname, f):
+        """Write one member; a failed read leaves it zero-filled and listed as damaged"""
+        hasher = new_hasher(self.algorithm)
+        if self.archive_format == "zip":
+            import zipfile
+            info.compress_type = zipfile.ZIP_DEFLATED
+            reader = MemberReader(f, hasher, info.file_size)
+            with self.archive.open(info, 'w', force_zip64=True) as out:
+                for chunk in iter(lambda: reader.read(COPY_BUFFER_SIZE), b''):
+                    out.write(chunk)
+            size = info.file_size
+        else:
+            reader = MemberReader(f, hasher, info.size)
+            self.archive.addfile(info, reader)
+            size = info.size
+
+        if reader.error is not None:
+            if isinstance(reader.error, Cancelled):
+                raise reader.error
+            self.damaged[arcname] = f"read failed after {reader.copied} of {size} bytes: {reader.error}"
+            raise OSError(errno.EIO, f"{arcname} is damaged, {self.damaged[arcname]}")
+
+        digest = hasher.hexdigest()
+        self.digests[arcname] = digest
+        return size, digest
+
+    def close(self):
+        """Append the checksum manifest and finish the archive"""
+        try:
+            if self.digests:
+                manifest = ''.join(
+                    f"{self.digests[name]}  {name}\n" for name in sorted(self.digests)
+                ).encode('utf-8')
+                name = MANIFEST_NAMES.get(self.algorithm, f"MANIFEST.{self.algorithm}")
+
+                if self.archive_format == "zip":
+                    self.archive.writestr(name, manifest)
+                else:
+                    import tarfile
+                    info = tarfile.TarInfo(name)
+                    info.size = len(manifest)
+                    info.mtime = int(time.time())
+                    self.archive.addfile(info, io.BytesIO(manifest))
+            if self.damaged:
+                listing = ''.join(
+                    f"{name}: {self.damaged[name]}\n" for name in sorted(self.damaged)
+                ).encode('utf-8')
+                if self.archive_format == "zip":
+                    self.archive.writestr(DAMAGED_LIST_NAME, listing)
+                else:
+                    import tarfile
+                    info = tarfile.TarInfo(DAMAGED_LIST_NAME)
+                    info.size = len(listing)
+                    info.mtime = int(time.time())
+                    self.archive.addfile(info, io.BytesIO(listing))
+            self.archive.close()
+            if self.sink:
+                self.sink.close()
+        finally:
+            self.handle.close()
+
+
+def coalesce_extents(extents, gap=RAW_COALESCE_GAP, max_read=RAW_MAX_READ):
+    """Merge (disk_offset, length) extents into large sequential disk reads
+
+    Returns a list of (start, end, pieces) runs sorted by disk offset, where
+    each piece is (file_offset, disk_offset, length). Extents longer than
+    `max_read` are split first, so no run is longer than that. Extents with
+    a disk offset of None are sparse holes and are left out.
+    """
+    pieces = []
+    file_offset = 0
+    for disk_offset, length in extents:
+        if disk_offset is not None:
+            for skip in range(0, length, max_read):
+                pieces.append((file_offset + skip, disk_offset + skip, min(max_read, length - skip)))
+        file_offset += length
+
+    runs = []
+    for piece in sorted(pieces, key=lambda p: p[1]):
+        start = piece[1]
+        end = start + piece[2]
+        if runs and start - runs[-1][1] <= gap and end - runs[-1][0] <= max_read:
+            runs[-1][1] = max(runs[-1][1], end)
+            runs[-1][2].append(piece)
+        else:
+            runs.append([start, end, [piece]])
+    return [tuple(run) for run in runs]
+
+
+class ExtentReader:
+    """Read file data straight from a raw device or image by byte extents
+
+    A reader belonging to a stoppable job (one given `stop`) reads on a
+    supervised worker thread: each read gives up with OperationTimeout
+    after `timeout` seconds, and with Cancelled as soon as a CancelToken
+    passed as `stop` is cancelled, rather than hanging on a dying disk.
+    """
+
+    def __init__(self, device_path, stop=None, timeout=DEVICE_READ_TIMEOUT):
+        self.device_path = device_path
+        self.fd = os.open(device_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self.stop = stop
+        self.timeout = timeout
+        self.supervisor = Supervisor(name="device-read") if stop is not None else None
+
+    def pread(self, length, offset):
+        """Read exactly `length` bytes at `offset`, zero-padding past the end"""
+        if self.supervisor is not None:
+            return self.supervisor.call(
+                self.read_at, length, offset, timeout=self.timeout, stop=self.stop
+            )
+        return self.read_at(length, offset)
+
+    def read_at(self, length, offset):
+        chunks = []
+        done = 0
+        # A read may legitimately return less than asked; keep going
+        while done < length:
+            if hasattr(os, 'pread'):
+                data = os.pread(self.fd, length - done, offset + done)
+            else:
+                os.lseek(self.fd, offset + done, os.SEEK_SET)
+                data = os.read(self.fd, length - done)
+            if not data:
+                break
+            chunks.append(data)
+            done += len(data)
+        if done < length:
+            # Only the end of the device may read back short
+            if offset + done < self.size():
+                raise OSError(errno.EIO, f"Short read at byte {offset + done} of {self.device_path}")
+            chunks.append(bytes(length - done))
+        return b''.join(chunks)
+
+    def size(self):
+        """Size of the device or image in bytes"""
+        return os.lseek(self.fd, 0, os.SEEK_END)
+
+    def open(self, extents, size):
+        """A file object reading the file's extents front to back"""
+        return ExtentStream(self, extents, size)
+
+    def read_pieces(self, extents):
+        """Yield (file_offset, data) for every extent, in disk order"""
+        for start, end, pieces in coalesce_extents(extents):
+            run = memoryview(self.pread(end - start, start))
+            for file_offset, disk_offset, length in pieces:
+                yield file_offset, run[disk_offset - start:disk_offset - start + length]
+
+    def recover(self, extents, size, dest, algorithm="sha256"):
+        """Reassemble a file from its extents and write it to `dest`"""
+        if size <= RAW_BUFFER_LIMIT:
+            # Gather in disk order, then write the file once front to back
+            buf = bytearray(size)
+            for file_offset, data in self.read_pieces(extents):
+                end = min(size, file_offset + len(data))
+                if file_offset < end:
+                    buf[file_offset:end] = data[:end - file_offset]
+            hasher = new_hasher(algorithm)
+            hasher.update(buf)
+            with open(dest, 'wb') as out:
+                out.write(buf)
+            return size, hasher.hexdigest()
+
+        # Too big to buffer: place pieces by offset, then hash the result
+        with open(dest, 'wb') as out:
+            out.truncate(size)
+            for file_offset, data in self.read_pieces(extents):
+                if file_offset >= size:
+                    continue
+                out.seek(file_offset)
+                out.write(data[:size - file_offset])
+        hasher = new_hasher(algorithm)
+        with open(dest, 'rb') as f:
+            hash_stream(f, hasher)
+        return size, hasher.hexdigest()
+
+    def close(self):
+        """Close the underlying device handle"""
+        if self.supervisor is not None:
+            self.supervisor.shutdown()
+        os.close(self.fd)
+
+
+class ExtentStream:
+    """Read-only file object over a file's extents, in file order
+
+    Sparse holes and anything past the last extent read back as zeros,
+    matching what ExtentReader.recover() writes.
+    """
+
+    def __init__(self, reader, extents, size):
+        self.reader = reader
+        self.extents = deque(extents)
+        self.remaining = size
+        self.disk_offset = None
+        self.left = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.remaining
+        size = min(size, self.remaining)
+        chunks = []
+        while size > 0:
+            if not self.left:
+                if not self.extents:
+                    chunks.append(bytes(size))
+                    self.remaining -= size
+                    break
+                self.disk_offset, self.left = self.extents.popleft()
+                continue
+            n = min(size, self.left, COPY_BUFFER_SIZE)
+            if self.disk_offset is None:
+                chunks.append(bytes(n))
+            else:
+                chunks.append(self.reader.pread(n, self.disk_offset))
+                self.disk_offset += n
+            self.left -= n
+            self.remaining -= n
+            size -= n
+        return b''.join(chunks)
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+@contextmanager
+def open_record(record):
+    """Open a scanned file for reading, from its extents if it was lost"""
+    if record.get("extents") is None:
+        with open(record["path"], 'rb') as f:
+            yield f
+        return
+
+    reader = ExtentReader(record["source"])
+    try:
+        yield reader.open(record["extents"], record["size"])
+    finally:
+        reader.close()
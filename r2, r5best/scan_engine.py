@@ -0,0 +1,576 @@
+import os
+import logging
+import platform
+from time import perf_counter
+from datetime import datetime
+
+from recovery_io import ExtentReader
+from cancellation import CancelToken, Cancelled, OperationTimeout, Supervisor
+import fs_ext4
+import fs_fat
+import fs_ntfs
+import carving
+from profiling import span
+
+logger = logging.getLogger(__name__)
+
+# Parsers tried in turn when looking for deleted files on a raw volume
+LOST_FILE_PARSERS = [fs_ext4, fs_fat, fs_ntfs]
+
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024 * 500  # 500MB
+
+# Deadline for each integrity check or type detection of a walked file, and
+# the longer one it gets in the retry pass at the end of the walk
+FILE_IO_TIMEOUT = 10
+RETRY_IO_TIMEOUT = 120
+
+# Status of a file whose reads never finished, even when retried
+TIMED_OUT = "Timed out"
+
+# Leading bytes of a lost file read to identify its type
+TYPE_SNIFF_BYTES = 2048
+
+FILE_SIGNATURES = {
+    '.pdf': b'%PDF-',
+    '.jpg': b'\xFF\xD8\xFF',
+    '.jpeg': b'\xFF\xD8\xFF',
+    '.png': b'\x89PNG',
+    '.gif': b'GIF89a',
+    '.zip': b'PK\x03\x04',
+    '.exe': b'MZ',
+    '.mp3': b'ID3',
+    '.mp4': b'\x00\x00\x00\x18ftyp',
+    '.doc': b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1',
+    '.docx': b'PK\x03\x04',
+    '.xlsx': b'PK\x03\x04',
+    '.pptx': b'PK\x03\x04',
+    '.rar': b'Rar!\x1A\x07\x00',
+    '.7z': b'7z\xBC\xAF\x27\x1C',
+    '.gz': b'\x1F\x8B\x08',
+    '.tar': b'ustar',
+    '.bmp': b'BM',
+    '.tiff': b'II*\x00' if platform.system() == 'Windows' else b'MM\x00*',
+    '.wav': b'RIFF',
+    '.avi': b'RIFF',
+    '.mdb': b'\x00\x01\x00\x00Standard Jet DB',
+    '.sqlite': b'SQLite format 3'
+}
+
+FILE_CATEGORIES = {
+    "[All Files]": None,
+    "[Pictures]": ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.svg'],
+    "[Documents]": ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt', '.rtf', '.odt', '.ods'],
+    "[Audio]": ['.mp3', '.wav', '.aac', '.flac', '.ogg', '.wma', '.m4a'],
+    "[Video]": ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.m4v', '.webm'],
+    "[Archives]": ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz'],
+    "[Database]": ['.db', '.sqlite', '.mdb', '.accdb', '.sql', '.dbf'],
+    "[Executables]": ['.exe', '.dll', '.msi', '.bat', '.sh', '.app', '.apk']
+}
+
+
+def file_types_for(category):
+    """Return the extensions a category scans for, or None for all files"""
+    return FILE_CATEGORIES.get(category, None)
+
+
+def detect_type(filepath=None, head=None):
+    """MIME type from libmagic, from a path or from leading bytes"""
+    try:
+        import magic
+        if head is not None:
+            return magic.from_buffer(head, mime=True)
+        return magic.from_file(filepath, mime=True)
+    except Exception:
+        return "unknown"
+
+
+def check_file_integrity(filepath, file_ext, image_info=None, perceptual_hash=True, metrics=None):
+    """Check the integrity of a file, hashing images into image_info
+
+    With a ScanMetrics in `metrics`, the header read, image verify and
+    perceptual hash are each timed into their own histogram.
+    """
+    try:
+        if not os.path.isfile(filepath):
+            return "Corrupted"
+
+        if file_ext in FILE_SIGNATURES:
+            started = perf_counter()
+            with open(filepath, 'rb') as f:
+                header = f.read(len(FILE_SIGNATURES[file_ext]))
+            if metrics:
+                metrics.observe("header", perf_counter() - started)
+            if not header.startswith(FILE_SIGNATURES[file_ext]):
+                return "Damaged"
+
+        if file_ext in ['.jpg', '.jpeg', '.png']:
+            try:
+                from PIL import Image
+                from phash import image_dhash
+                started = perf_counter()
+                with Image.open(filepath) as img:
+                    img.verify()
+                if metrics:
+                    metrics.observe("verify", perf_counter() - started)
+                # verify() leaves the image unusable, so reopen it to hash
+                if image_info is not None and perceptual_hash:
+                    started = perf_counter()
+                    image_info["phash"] = image_dhash(filepath)
+                    if metrics:
+                        metrics.observe("phash", perf_counter() - started)
+            except Exception:
+                return "Damaged"
+
+        return "Good"
+    except Exception:
+        return "Corrupted"
+
+
+class ScanResult(dict):
+    """One file found by a scan
+
+    Results are plain dicts underneath, so they pickle into .dsr files and
+    every front-end can keep using result["path"]; the standard keys are
+    also readable as attributes. Every result has name, path, size, status,
+    type, modified and folder. Walked files add phash, and lost or carved
+    files add source and extents (plus the parser's own location key).
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+
+class Scanner:
+    """Find recoverable files without any UI
+
+    Iterate a scanner to get ScanResult objects as they are found, or call
+    run() to collect them all into `results`:
+
+        scanner = Scanner("/mnt/usb", file_types_for("[Pictures]"))
+        for result in scanner:
+            print(result.path, result.status)
+
+    The walk of `root_path` comes first. With `find_lost`, the device under
+    it (`device`, or the one it is mounted from) is then parsed for deleted
+    files, and `deep_scan` carves its free space as well.
+
+    Callbacks, all optional and called on the scanning thread:
+    on_directory(path, files_walked) as each directory is entered,
+    on_result(result) for every result, on_stage(stage, target) when the
+    "lost" search starts, and on_carve(bytes_done, bytes_total) while
+    carving. `stop()` is polled between files and may block to pause the
+    scan; stop() on the scanner itself also ends it, from any thread. A
+    cancellation.CancelToken as `stop` also abandons device reads stuck on
+    failing media, and bounds each one by a timeout.
+
+    `check_integrity` may also be a function(filepath, file_ext) returning
+    the status, for front-ends that label damage their own way.
+
+    Files that cannot even be stat()ed are skipped, unless `keep_unreadable`
+    is set; then they are reported as "Corrupted" with a size of 0.
+
+    Pass a metrics.ScanMetrics as `metrics` to count directories, files and
+    bytes and to time directory listing, stat, header reads, libmagic,
+    image verification and hashing. Without one nothing is timed. The
+    supervised reads also report io_queue_depth, io_in_flight and
+    io_workers gauges; reads still in flight between files are ones the
+    walk gave up on and left stuck on the disk.
+
+    The integrity check and type detection of each walked file run as one
+    operation on a supervised worker under an `io_timeout` deadline, so one file on a
+    failing disk cannot stall the walk. Files that miss it are set aside
+    and retried with `retry_timeout` once the walk is done; any that time
+    out again are reported with the "Timed out" status. An io_timeout of
+    None reads on the scanning thread with no deadline.
+    """
+
+    def __init__(self, root_path, file_types=None, max_file_size=DEFAULT_MAX_FILE_SIZE,
+                 check_integrity=True, detect_types=True, perceptual_hash=True,
+                 walk_tree=True, find_lost=False, device=None, deep_scan=False, stop=None,
+                 on_directory=None, on_result=None, on_stage=None, on_carve=None, metrics=None,
+                 io_timeout=FILE_IO_TIMEOUT, retry_timeout=RETRY_IO_TIMEOUT, keep_unreadable=False):
+        self.root_path = root_path
+        self.file_types = file_types
+        self.max_file_size = max_file_size
+        self.check_integrity = check_integrity
+        self.detect_types = detect_types
+        self.perceptual_hash = perceptual_hash
+        self.walk_tree = walk_tree
+        self.find_lost = find_lost
+        self.device = device
+        self.deep_scan = deep_scan
+        self.external_stop = stop
+        self.on_directory = on_directory
+        self.on_result = on_result
+        self.on_stage = on_stage
+        self.on_carve = on_carve
+        self.metrics = metrics
+        self.io_timeout = io_timeout
+        self.retry_timeout = retry_timeout
+        self.keep_unreadable = keep_unreadable
+        self.supervisor = None
+        self.timed_out = []
+        self.stopped = False
+        self.results = []
+        self.stats = new_scan_stats()
+
+    @classmethod
+    def for_image(cls, image_path, deep_scan=False, **kwargs):
+        """A scanner that only searches a disk image or raw device for lost files"""
+        # Lost-file records keep this as their source, so it must not be relative
+        image_path = os.path.abspath(image_path)
+        return cls(image_path, walk_tree=False, find_lost=True, device=image_path,
+                   deep_scan=deep_scan, **kwargs)
+
+    def stop(self):
+        self.stopped = True
+        # Also wakes device reads waiting on the caller's token
+        if isinstance(self.external_stop, CancelToken):
+            self.external_stop.cancel()
+
+    def should_stop(self):
+        if self.external_stop and self.external_stop():
+            self.stopped = True
+        return self.stopped
+
+    def run(self):
+        """Scan to the end (or until stopped) and return the results"""
+        self.results = []
+        for result in self:
+            self.results.append(result)
+        return self.results
+
+    def __iter__(self):
+        # Reset in place so callers holding `stats` see the live totals
+        self.stats.update(new_scan_stats())
+        self.stats["start_time"] = datetime.now()
+        self.timed_out = []
+        if self.walk_tree and self.io_timeout is not None:
+            self.supervisor = Supervisor(name="file-io")
+        try:
+            stages = []
+            if self.walk_tree:
+                stages.append(("walk", self.walk()))
+                stages.append(("retry", self.retry_timed_out()))
+            if self.find_lost:
+                stages.append(("lost", self.lost_files()))
+            for name, stage in stages:
+                with span(name):
+                    for result in stage:
+                        count_result(self.stats, result)
+                        if self.metrics:
+                            self.metrics.count("results")
+                            self.metrics.count("result_bytes", result["size"])
+                        if self.on_result:
+                            self.on_result(result)
+                        yield result
+        finally:
+            if self.supervisor is not None:
+                self.supervisor.shutdown()
+                self.supervisor = None
+            self.stats["end_time"] = datetime.now()
+
+    def walk(self):
+        """Yield a result for every matching file under the root path"""
+        file_count = 0
+        metrics = self.metrics
+        walker = os.walk(self.root_path)
+        while True:
+            # Listing a directory happens inside os.walk's next step
+            started = perf_counter()
+            try:
+                root, dirs, files = next(walker)
+            except StopIteration:
+                return
+            if metrics:
+                metrics.observe("listdir", perf_counter() - started)
+                metrics.count("directories")
+                metrics.count("files", len(files))
+
+            if self.should_stop():
+                logger.info("Scan stopped by user")
+                return
+            if self.on_directory:
+                self.on_directory(root, file_count)
+
+            for filename in files:
+                if self.should_stop():
+                    return
+
+                filepath = os.path.join(root, filename)
+                file_count += 1
+
+                try:
+                    result = self.scan_file(filepath, filename, root)
+                except Cancelled:
+                    return
+                except Exception as e:
+                    logger.error(f"Error scanning {filepath}: {str(e)}")
+                    continue
+                if result is None:
+                    continue
+                if result["status"] == TIMED_OUT:
+                    # Slow files wait for the retry pass so the walk keeps its pace
+                    logger.warning(f"Reading {filepath} timed out; retrying it after the walk")
+                    self.timed_out.append(result)
+                    if metrics:
+                        metrics.count("timeouts")
+                    continue
+                yield result
+
+    def retry_timed_out(self):
+        """Give files whose reads timed out one slower try once the walk is done"""
+        pending, self.timed_out = self.timed_out, []
+        if pending:
+            logger.info(f"Retrying {len(pending)} files that timed out")
+        for result in pending:
+            # After a stop they are reported as they stand
+            if not self.should_stop():
+                try:
+                    retried = self.scan_file(
+                        result["path"], result["name"], result["folder"], self.retry_timeout
+                    )
+                except Cancelled:
+                    retried = None
+                except Exception as e:
+                    logger.error(f"Error scanning {result['path']}: {str(e)}")
+                    retried = None
+                if retried is not None:
+                    result = retried
+                if result["status"] == TIMED_OUT:
+                    logger.error(f"Reading {result['path']} timed out again; marking it {TIMED_OUT}")
+            yield result
+
+    def scan_file(self, filepath, filename, folder, timeout=None):
+        """Build the result for one walked file, or None if it is filtered out
+
+        Reads that miss their deadline (`timeout`, by default io_timeout)
+        give the result the "Timed out" status.
+        """
+        file_ext = os.path.splitext(filename)[1].lower()
+        if self.file_types and file_ext not in self.file_types:
+            return None
+
+        metrics = self.metrics
+        started = perf_counter()
+        try:
+            file_stat = os.stat(filepath)
+        except OSError as e:
+            if not self.keep_unreadable:
+                raise
+            logger.error(f"Could not stat {filepath}: {str(e)}")
+            return ScanResult(
+                name=filename,
+                path=filepath,
+                size=0,
+                status="Corrupted",
+                type="unknown",
+                modified=datetime.fromtimestamp(0),
+                folder=folder,
+                phash=None
+            )
+        if metrics:
+            metrics.observe("stat", perf_counter() - started)
+        if self.max_file_size is not None and file_stat.st_size > self.max_file_size:
+            return None
+
+        image_info = {}
+        status = "Good"
+        file_type = "unknown"
+        if self.check_integrity or self.detect_types:
+            try:
+                status, file_type = self.supervised(
+                    timeout or self.io_timeout, self.inspect_file, filepath, file_ext, image_info
+                )
+            except OperationTimeout:
+                status = TIMED_OUT
+
+        return ScanResult(
+            name=filename,
+            path=filepath,
+            size=file_stat.st_size,
+            status=status,
+            type=file_type,
+            modified=datetime.fromtimestamp(file_stat.st_mtime),
+            folder=folder,
+            phash=image_info.get("phash")
+        )
+
+    def inspect_file(self, filepath, file_ext, image_info):
+        """Status and MIME type of a walked file; the reads that may hang on bad media"""
+        metrics = self.metrics
+        status = "Good"
+        if callable(self.check_integrity):
+            status = self.check_integrity(filepath, file_ext)
+        elif self.check_integrity:
+            status = check_file_integrity(filepath, file_ext, image_info, self.perceptual_hash, metrics)
+
+        file_type = "unknown"
+        if self.detect_types:
+            started = perf_counter()
+            file_type = detect_type(filepath)
+            if metrics:
+                metrics.observe("magic", perf_counter() - started)
+        return status, file_type
+
+    def supervised(self, timeout, func, *args):
+        """Run one read of a walked file under its deadline, when reads are supervised"""
+        if self.supervisor is None:
+            return func(*args)
+        try:
+            return self.supervisor.call(func, *args, timeout=timeout, stop=self.external_stop)
+        finally:
+            if self.metrics:
+                stats = self.supervisor.stats()
+                self.metrics.gauge("io_queue_depth", stats["queued"])
+                self.metrics.gauge("io_in_flight", stats["in_flight"])
+                self.metrics.gauge("io_workers", stats["workers"])
+
+    def lost_files(self):
+        """Yield deleted (and with deep_scan, carved) files from the device"""
+        if self.should_stop():
+            return
+        device = self.device or device_for_path(self.root_path)
+        if not device:
+            logger.warning(f"No device found under {self.root_path}; skipping lost file search")
+            return
+        if self.on_stage:
+            self.on_stage("lost", device)
+
+        # Only a CancelToken lets a cancel abandon a device read that is stuck
+        stop = self.external_stop if isinstance(self.external_stop, CancelToken) else self.should_stop
+        try:
+            records = scan_lost_files(device, self.root_path, self.deep_scan, stop, self.on_carve)
+        except Cancelled:
+            self.stopped = True
+            logger.info("Lost file search cancelled")
+            return
+        except Exception as e:
+            logger.error(f"Lost file search on {device} failed: {str(e)}")
+            return
+        for record in records:
+            yield ScanResult(record)
+
+
+def find_parser(reader):
+    """Return the filesystem parser module that recognises a volume, if any"""
+    return next((p for p in LOST_FILE_PARSERS if p.probe(reader)), None)
+
+
+def scan_lost_files(device_path, mount_root, deep_scan=False, stop=None, carve_progress=None):
+    """Parse a raw volume for deleted files, optionally carving free space too"""
+    reader = ExtentReader(device_path, stop)
+    try:
+        parser = find_parser(reader)
+        records = []
+        if parser is None:
+            logger.info(f"No supported filesystem found on {device_path}")
+        else:
+            with span("parse", parser=parser.__name__):
+                records = parser.scan_deleted(device_path, mount_root, stop=stop)
+
+        # Carve only the space no live file owns; without a parser carve everything
+        if deep_scan and not (stop and stop()):
+            with span("carve"):
+                records += carve_free_space(device_path, mount_root, parser, records, stop, carve_progress)
+
+        for record in records:
+            if record["type"] is None:
+                # Identify content from its first bytes, wherever they live
+                head = b''
+                start = next(((offset, length) for offset, length in record["extents"]
+                              if offset is not None), None)
+                if start and not (stop and stop()):
+                    try:
+                        head = reader.pread(min(TYPE_SNIFF_BYTES, start[1]), start[0])
+                    except OperationTimeout:
+                        logger.warning(f"Reading the start of {record['path']} timed out")
+                record["type"] = detect_type(head=head)
+
+        logger.info(f"Found {len(records)} lost files on {device_path}")
+        return records
+    finally:
+        reader.close()
+
+
+def carve_free_space(device_path, mount_root, parser, known, stop=None, progress=None):
+    """Carve unallocated space for files that no directory entry points to"""
+    allocation = None
+    if parser is not None:
+        try:
+            allocation = parser.allocation_map(device_path, stop)
+        except Cancelled:
+            return []
+        except Exception as e:
+            logger.error(f"Cannot read allocation bitmap of {device_path}: {str(e)}")
+
+    if allocation is not None:
+        logger.info(f"Carving {allocation.free_bytes()} bytes of free space on {device_path}")
+
+    carved = carving.carve(device_path, allocation, mount_root, stop=stop, progress=progress)
+
+    # Deleted files the parser already found are free space too
+    known_starts = {r["extents"][0][0] for r in known if r.get("extents")}
+    return [r for r in carved if r["extents"][0][0] not in known_starts]
+
+
+def device_for_path(path):
+    """Find the block device mounted at or above `path` (needs psutil)"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    path = os.path.realpath(path)
+    best = None
+    for part in psutil.disk_partitions(all=False):
+        mount = os.path.realpath(part.mountpoint)
+        if path == mount or path.startswith(mount.rstrip(os.sep) + os.sep):
+            if best is None or len(mount) > len(best[0]):
+                best = (mount, part.device)
+    return best[1] if best else None
+
+
+def new_scan_stats():
+    """Empty running totals, in the shape every front-end displays"""
+    return {
+        "total_files": 0,
+        "recoverable": 0,
+        "damaged": 0,
+        "scanned_bytes": 0,
+        "start_time": None,
+        "end_time": None
+    }
+
+
+def count_result(scan_stats, record):
+    """Add one result record to the running scan statistics"""
+    scan_stats["total_files"] += 1
+    scan_stats["scanned_bytes"] += record["size"]
+    if record["status"] in ("Good", "Deleted"):
+        scan_stats["recoverable"] += 1
+    else:
+        scan_stats["damaged"] += 1
+
+
+def save_results(filepath, files, scan_stats, drive, settings=None):
+    """Write scan results in the .dsr format the GUI loads"""
+    import pickle
+    with open(filepath, 'wb') as f:
+        pickle.dump({
+            'files': files,
+            'scan_stats': scan_stats,
+            'drive': drive,
+            'timestamp': datetime.now(),
+            'settings': settings or {}
+        }, f)
+
+
+def load_results(filepath):
+    import pickle
+    with open(filepath, 'rb') as f:
+        return pickle.load(f)
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from carving import AllocationMap
+
+
+def reference_runs(flags):
+    runs = []
+    for unit, flag in enumerate(flags):
+        if flag:
+            continue
+        if runs and runs[-1][1] == unit:
+            runs[-1][1] = unit + 1
+        else:
+            runs.append([unit, unit + 1])
+    return [tuple(run) for run in runs]
+
+
+def test_from_flags_packs_bits_lsb_first():
+    flags = [1, 0, 0, 1, 1, 0, 0, 0, 1, 0, 1]
+    amap = AllocationMap.from_flags(4096, flags)
+    assert amap.bitmap == bytes([0b00011001, 0b00000101])
+    assert [amap.allocated(unit) for unit in range(len(flags))] == [bool(f) for f in flags]
+
+
+def test_units_outside_the_volume_count_as_allocated():
+    amap = AllocationMap(512, 10, bytes(2))
+    assert not amap.allocated(0)
+    assert not amap.allocated(9)
+    assert amap.allocated(10)
+    assert amap.allocated(-1)
+
+
+def test_bitmap_is_trimmed_to_count():
+    # Padding bits past `count` must not turn into free space
+    amap = AllocationMap(512, 12, bytes([0xFF, 0x0F, 0x00, 0x00]))
+    assert amap.bitmap == bytes([0xFF, 0x0F])
+    assert list(amap.free_runs()) == []
+
+
+@pytest.mark.parametrize("count", [1, 7, 8, 9, 64, 1000, 4099])
+def test_free_runs_match_a_bit_by_bit_walk(count):
+    rng = random.Random(count)
+    for density in (0.0, 0.1, 0.5, 0.9, 1.0):
+        flags = [rng.random() < density for _ in range(count)]
+        amap = AllocationMap.from_flags(4096, flags)
+        assert list(amap.free_runs()) == reference_runs(flags)
+
+
+def test_unallocated_extents_are_byte_ranges_from_the_base():
+    flags = [1, 1, 0, 0, 0, 1, 0, 1, 1, 0]
+    amap = AllocationMap.from_flags(1024, flags, base_offset=1 << 20)
+    assert amap.unallocated_extents() == [
+        ((1 << 20) + 2 * 1024, 3 * 1024),
+        ((1 << 20) + 6 * 1024, 1024),
+        ((1 << 20) + 9 * 1024, 1024)
+    ]
@@ -0,0 +1,78 @@
+import io
+import tarfile
+import zipfile
+import hashlib
+
+import pytest
+
+from recovery_io import ArchiveWriter, DAMAGED_LIST_NAME
+
+FORMATS = ["tar", "tar.gz", "zip"]
+
+
+class FailingStream:
+    """Hands out `good` bytes, then fails the way a dying disk does"""
+
+    def __init__(self, good):
+        self.data = io.BytesIO(good)
+
+    def read(self, size=-1):
+        data = self.data.read(size)
+        if not data:
+            raise OSError(5, "Input/output error")
+        return data
+
+
+def read_members(path, archive_format):
+    if archive_format == "zip":
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+    with tarfile.open(path) as archive:
+        return {m.name: archive.extractfile(m).read() for m in archive.getmembers()}
+
+
+def manifest_lines(members):
+    name = next(name for name in members if name.startswith("MANIFEST."))
+    return dict(reversed(line.split("  ", 1)) for line in members[name].decode().splitlines())
+
+
+@pytest.mark.parametrize("archive_format", FORMATS)
+def test_round_trip(tmp_path, archive_format):
+    src = tmp_path / "photo.jpg"
+    src.write_bytes(b"\xff\xd8\xff" + bytes(range(256)) * 4000)
+    streamed = b"deleted file contents" * 1000
+
+    path = tmp_path / f"out.{archive_format}"
+    writer = ArchiveWriter(str(path), archive_format)
+    writer.add(str(src), "pictures/photo.jpg")
+    writer.add_stream(io.BytesIO(streamed), len(streamed), "lost/a.txt")
+    writer.close()
+
+    members = read_members(str(path), archive_format)
+    assert members["pictures/photo.jpg"] == src.read_bytes()
+    assert members["lost/a.txt"] == streamed
+    assert DAMAGED_LIST_NAME not in members
+    assert manifest_lines(members) == {
+        "pictures/photo.jpg": hashlib.sha256(src.read_bytes()).hexdigest(),
+        "lost/a.txt": hashlib.sha256(streamed).hexdigest()
+    }
+
+
+@pytest.mark.parametrize("archive_format", FORMATS)
+def test_read_failure_zero_fills_member(tmp_path, archive_format):
+    size = 3 * 1024 * 1024
+    after = b"the member after the damaged one"
+
+    path = tmp_path / f"out.{archive_format}"
+    writer = ArchiveWriter(str(path), archive_format)
+    with pytest.raises(OSError):
+        writer.add_stream(FailingStream(b"x" * 1000), size, "lost/broken.bin")
+    writer.add_stream(io.BytesIO(after), len(after), "lost/after.txt")
+    writer.close()
+
+    members = read_members(str(path), archive_format)
+    # The damaged member keeps its declared size, so nothing after it shifts
+    assert members["lost/broken.bin"] == b"x" * 1000 + bytes(size - 1000)
+    assert members["lost/after.txt"] == after
+    assert "lost/broken.bin" in members[DAMAGED_LIST_NAME].decode()
+    assert set(manifest_lines(members)) == {"lost/after.txt"}
@@ -0,0 +1,99 @@
+import os
+import shutil
+import hashlib
+import subprocess
+
+import pytest
+
+import drx
+from scan_engine import scan_lost_files, load_results
+from recovery_engine import recover_files
+
+# e2fsprogs usually lives in sbin, which is not always on PATH
+TOOL_PATH = os.pathsep.join([os.environ.get("PATH", ""), "/usr/sbin", "/sbin"])
+MKFS = shutil.which("mkfs.ext4", path=TOOL_PATH)
+DEBUGFS = shutil.which("debugfs", path=TOOL_PATH)
+
+pytestmark = pytest.mark.skipif(not (MKFS and DEBUGFS), reason="needs mkfs.ext4 and debugfs")
+
+MOUNT_ROOT = "/mnt/usb"
+
+
+def debugfs(image, command):
+    subprocess.run([DEBUGFS, "-w", str(image), "-R", command], check=True, capture_output=True)
+
+
+@pytest.fixture
+def image(tmp_path):
+    """An 8 MiB ext4 image with a deleted file at the root and one in a folder"""
+    path = tmp_path / "volume.img"
+    with open(path, "wb") as f:
+        f.truncate(8 * 1024 * 1024)
+    subprocess.run([MKFS, "-q", "-F", str(path)], check=True, capture_output=True)
+
+    contents = {
+        "note.txt": b"recover me\n",
+        "docs/report.bin": os.urandom(70000)
+    }
+    debugfs(path, "mkdir docs")
+    for name, data in contents.items():
+        src = tmp_path / os.path.basename(name)
+        src.write_bytes(data)
+        debugfs(path, f"write {src} {name}")
+    for name in contents:
+        debugfs(path, f"rm {name}")
+    return path, contents
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_deleted_files_are_found_with_their_paths(image):
+    path, contents = image
+    records = scan_lost_files(str(path), MOUNT_ROOT)
+
+    found = {os.path.relpath(r["path"], MOUNT_ROOT): r for r in records}
+    assert set(found) == set(contents)
+    for name, record in found.items():
+        assert record["status"] == "Deleted"
+        assert record["size"] == len(contents[name])
+        assert record["source"] == str(path)
+
+
+@pytest.mark.parametrize("mode", ["Standard Recovery", "Recover with Folder Structure", "Raw Recovery (Advanced)"])
+def test_recovered_files_match_the_originals(image, tmp_path, mode):
+    path, contents = image
+    records = scan_lost_files(str(path), MOUNT_ROOT)
+    dest = tmp_path / "recovered"
+
+    summary = recover_files(records, str(dest), mode, MOUNT_ROOT, verify=mode != "Raw Recovery (Advanced)")
+    assert summary["success"] == len(contents)
+    assert summary["errors"] == 0
+
+    for name, data in contents.items():
+        if mode == "Recover with Folder Structure":
+            recovered = dest / name
+        else:
+            recovered = dest / os.path.basename(name)
+        assert sha256(recovered.read_bytes()) == sha256(data)
+
+    manifest = (dest / "MANIFEST.sha256").read_text()
+    assert sorted(line.split("  ")[0] for line in manifest.splitlines()) == \
+        sorted(sha256(data) for data in contents.values())
+
+
+def test_saved_search_results_survive_a_change_of_directory(image, tmp_path, monkeypatch):
+    path, contents = image
+    monkeypatch.chdir(tmp_path)
+    assert drx.main(["search", path.name, "-o", "found.dsr"]) == 0
+
+    data = load_results(str(tmp_path / "found.dsr"))
+    assert data["drive"] == str(path)
+    assert {record["source"] for record in data["files"]} == {str(path)}
+
+    monkeypatch.chdir("/")
+    dest = tmp_path / "recovered"
+    assert drx.main(["recover", str(tmp_path / "found.dsr"), str(dest), "--status", "Deleted"]) == 0
+    assert sorted(os.listdir(dest)) == sorted(["MANIFEST.sha256", ".drx_recovery_journal.jsonl"] +
+                                              [os.path.basename(name) for name in contents])
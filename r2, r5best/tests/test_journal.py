@@ -0,0 +1,114 @@
+import os
+import hashlib
+import logging
+
+from recovery_io import RecoveryJournal, JOURNAL_NAME
+from recovery_engine import recover_files, journal_key
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def plain_record(path):
+    return {
+        "name": os.path.basename(path),
+        "path": str(path),
+        "size": os.path.getsize(path),
+        "status": "Good",
+        "folder": os.path.dirname(path)
+    }
+
+
+def manifest(dest):
+    lines = (dest / "MANIFEST.sha256").read_text().splitlines()
+    return dict(reversed(line.split("  ", 1)) for line in lines)
+
+
+def test_journal_replays_plan_progress_and_done(tmp_path):
+    dest = tmp_path / "a.bin"
+    dest.write_bytes(b"x" * 100)
+
+    journal = RecoveryJournal(str(tmp_path))
+    journal.plan("/src/a.bin", str(dest), 100)
+    journal.progress("/src/a.bin", 60)
+    journal.close()
+
+    journal = RecoveryJournal(str(tmp_path))
+    assert journal.planned_destination("/src/a.bin") == str(dest)
+    assert journal.resume_offset("/src/a.bin") == 60
+    assert not journal.is_complete("/src/a.bin")
+    journal.complete("/src/a.bin", 100, "digest")
+    journal.close()
+
+    # A torn last line from a crash is ignored
+    with open(tmp_path / JOURNAL_NAME, "a") as f:
+        f.write('{"op": "progress", "src": "/src/a.b')
+    journal = RecoveryJournal(str(tmp_path))
+    assert journal.is_complete("/src/a.bin")
+    assert journal.get("/src/a.bin")["hash"] == "digest"
+
+    # A copy that failed verification is copied again from the start
+    journal.fail("/src/a.bin")
+    journal.close()
+    journal = RecoveryJournal(str(tmp_path))
+    assert not journal.is_complete("/src/a.bin")
+    assert journal.resume_offset("/src/a.bin") == 0
+    journal.close()
+
+
+def test_interrupted_copy_resumes_and_reruns_skip(tmp_path, caplog):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    src = tmp_path / "source" / "movie.mp4"
+    src.parent.mkdir()
+    src.write_bytes(data)
+    dest = tmp_path / "recovered"
+    dest.mkdir()
+
+    # What an interrupted run leaves behind: a plan, a checkpoint and a partial copy
+    partial = 1024 * 1024
+    (dest / "movie.mp4").write_bytes(data[:partial])
+    journal = RecoveryJournal(str(dest))
+    journal.plan(str(src), str(dest / "movie.mp4"), len(data))
+    journal.progress(str(src), partial)
+    journal.close()
+
+    with caplog.at_level(logging.INFO, logger="recovery_io"):
+        summary = recover_files([plain_record(src)], str(dest), verify=True)
+    assert summary["success"] == 1
+    assert summary["skipped"] == 0
+    assert f"Resuming {src} at byte {partial}" in caplog.text
+    assert (dest / "movie.mp4").read_bytes() == data
+    assert manifest(dest) == {"movie.mp4": sha256(data)}
+
+    # Nothing is copied twice, nothing counts as recovered twice
+    summary = recover_files([plain_record(src)], str(dest), verify=True)
+    assert summary["success"] == 0
+    assert summary["skipped"] == 1
+    assert manifest(dest) == {"movie.mp4": sha256(data)}
+    assert sorted(os.listdir(dest)) == sorted([JOURNAL_NAME, "MANIFEST.sha256", "movie.mp4"])
+
+
+def test_lost_files_sharing_a_path_are_journaled_apart(tmp_path):
+    first, second = b"first deleted file", b"second one, same rebuilt name"
+    device = tmp_path / "volume.img"
+    device.write_bytes(first + bytes(4096 - len(first)) + second)
+
+    records = [{
+        "name": "a.txt",
+        "path": "/mnt/usb/a.txt",
+        "size": len(data),
+        "status": "Deleted",
+        "folder": "/mnt/usb",
+        "source": str(device),
+        "extents": [(offset, len(data))],
+        "inode": inode
+    } for data, offset, inode in [(first, 0, 12), (second, 4096, 13)]]
+    assert journal_key(records[0]) != journal_key(records[1])
+
+    dest = tmp_path / "recovered"
+    assert recover_files(records, str(dest))["success"] == 2
+    assert manifest(dest) == {"a.txt": sha256(first), "a_1.txt": sha256(second)}
+
+    summary = recover_files(records, str(dest))
+    assert (summary["success"], summary["skipped"]) == (0, 2)
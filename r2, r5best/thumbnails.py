@@ -0,0 +1,315 @@
+import io
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from recovery_io import journal_key, open_record
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (400, 400)
+THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024
+PREVIEW_TEXT_CHARS = 2000
+PREVIEW_HEX_BYTES = 512
+SNIPPET_CACHE_ENTRIES = 256
+# Lost images are buffered in memory to decode, so cap what we pull off the device
+LOST_IMAGE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def preview_kind(file_type):
+    """Map a MIME type to the preview the panel shows for it"""
+    if file_type.startswith('image/'):
+        return "image"
+    if file_type.startswith('text/') or file_type in ('application/pdf', 'application/json'):
+        return "text"
+    return "hex"
+
+
+def cache_identity(record):
+    """Key a scanned file so the cache misses once its contents may have changed"""
+    if record.get("extents") is not None:
+        # Lost files are keyed by where they sit on the device
+        return (journal_key(record), record["size"])
+    st = os.stat(record["path"])
+    return (record["path"], st.st_size, st.st_mtime_ns)
+
+
+def read_snippet(record, kind):
+    """Read the start of a file as text or as a hex dump"""
+    if kind == "text":
+        # A character is at most 4 bytes of UTF-8
+        with open_record(record) as f:
+            content = f.read(PREVIEW_TEXT_CHARS * 4)
+        return content.decode('utf-8', errors='ignore')[:PREVIEW_TEXT_CHARS]
+    with open_record(record) as f:
+        content = f.read(PREVIEW_HEX_BYTES)
+    return ' '.join(f'{byte:02x}' for byte in content)
+
+
+class ThumbnailCache:
+    """In-memory LRU of decoded thumbnails bounded by their pixel bytes"""
+
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def image_bytes(img):
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, img):
+        size = self.image_bytes(img)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[key] = (img, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+class ThumbnailService:
+    """Decode image thumbnails on a worker pool with memory and disk caching
+
+    Requests take scanned records; lost files are read from their extents.
+    Callbacks run on a worker thread with (record, image, error); GUI callers
+    should hand the result back to their own thread before touching widgets.
+    """
+
+    def __init__(self, size=THUMBNAIL_SIZE, max_bytes=THUMBNAIL_CACHE_BYTES,
+                 disk_cache_dir=None, workers=2):
+        self.size = size
+        self.cache = ThumbnailCache(max_bytes)
+        self.disk_cache_dir = disk_cache_dir
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        self.pending = {}
+        self.lock = threading.Lock()
+        # Set whenever no foreground decode is queued or running
+        self.idle = threading.Event()
+        self.idle.set()
+
+        if disk_cache_dir:
+            try:
+                os.makedirs(disk_cache_dir, exist_ok=True)
+            except OSError as e:
+                logger.error(f"Thumbnail disk cache disabled: {str(e)}")
+                self.disk_cache_dir = None
+
+    def cache_key(self, record):
+        """Key thumbnails by file identity and size so edited files are redone"""
+        return cache_identity(record) + (self.size,)
+
+    def cached(self, record):
+        """Return a thumbnail without decoding, or None"""
+        try:
+            return self.cache.get(self.cache_key(record))
+        except OSError:
+            return None
+
+    def request(self, record, callback):
+        """Queue a thumbnail decode, dropping queued decodes that have not started"""
+        key = journal_key(record)
+        with self.lock:
+            superseded = list(self.pending.values())
+            self.pending.clear()
+            future = self.executor.submit(self.load, record, callback)
+            self.pending[key] = future
+            self.idle.clear()
+        # Outside the lock: cancelling runs done callbacks, which take it
+        for old in superseded:
+            old.cancel()
+        future.add_done_callback(lambda f: self.finished(key, f))
+        return future
+
+    def finished(self, key, future):
+        with self.lock:
+            # A newer request for the same file keeps its own entry
+            if self.pending.get(key) is future:
+                del self.pending[key]
+                if not self.pending:
+                    self.idle.set()
+
+    def busy(self):
+        """True while a foreground decode is queued or running"""
+        return not self.idle.is_set()
+
+    def wait_idle(self, timeout=None):
+        """Block until no foreground decode is queued or running"""
+        return self.idle.wait(timeout)
+
+    def load(self, record, callback):
+        try:
+            img = self.thumbnail(record)
+        except Exception as e:
+            callback(record, None, e)
+        else:
+            callback(record, img, None)
+
+    def thumbnail(self, record):
+        """Return a thumbnail for a scanned file from memory, disk or a fresh decode"""
+        key = self.cache_key(record)
+        img = self.cache.get(key)
+        if img is not None:
+            return img
+
+        disk_path = self.disk_path(key)
+        if disk_path and os.path.exists(disk_path):
+            try:
+                from PIL import Image
+                with Image.open(disk_path) as cached:
+                    img = cached.copy()
+            except Exception:
+                img = None
+
+        if img is None:
+            img = self.decode(record)
+            if disk_path:
+                self.save_to_disk(img, disk_path)
+
+        self.cache.put(key, img)
+        return img
+
+    @staticmethod
+    def image_source(record):
+        """Something PIL can open: the file itself, or a lost file read into memory"""
+        if record.get("extents") is None:
+            return record["path"]
+        if record["size"] > LOST_IMAGE_MAX_BYTES:
+            raise ValueError(f"{record['name']} is too large to preview from the device")
+        with open_record(record) as f:
+            return io.BytesIO(f.read())
+
+    def decode(self, record):
+        """Decode at reduced size; JPEGs use DCT scaling via draft()"""
+        from PIL import Image
+        with Image.open(self.image_source(record)) as img:
+            if img.format == 'JPEG':
+                img.draft('RGB' if img.mode not in ('L', 'CMYK') else img.mode, self.size)
+            img.thumbnail(self.size)
+            if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                return img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+            # The decoded pixels must outlive the file handle
+            return img.copy()
+
+    def disk_path(self, key):
+        if not self.disk_cache_dir:
+            return None
+        digest = hashlib.sha1(repr(key).encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.disk_cache_dir, f"{digest}.png")
+
+    def save_to_disk(self, img, disk_path):
+        tmp_path = f"{disk_path}.{threading.get_ident()}.tmp"
+        try:
+            img.save(tmp_path, format='PNG')
+            os.replace(tmp_path, disk_path)
+        except Exception as e:
+            logger.error(f"Could not cache thumbnail: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        with self.lock:
+            superseded = list(self.pending.values())
+            self.pending.clear()
+            self.idle.set()
+        for future in superseded:
+            future.cancel()
+        self.executor.shutdown(wait=False)
+
+
+class PreviewPrefetcher:
+    """Warm previews for rows around the selection on a low-priority thread
+
+    Each prefetch() replaces whatever is still queued, so jumping to another
+    part of the table drops the old neighbourhood. Foreground thumbnail
+    requests always go first.
+    """
+
+    def __init__(self, thumbnails, max_snippets=SNIPPET_CACHE_ENTRIES):
+        self.thumbnails = thumbnails
+        self.max_snippets = max_snippets
+        self.snippets = OrderedDict()
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="preview-prefetch", daemon=True)
+        self.thread.start()
+
+    def snippet(self, record, kind):
+        """Return a text or hex preview, reading it now if it was not prefetched"""
+        key = cache_identity(record) + (kind,)
+        with self.lock:
+            content = self.snippets.get(key)
+            if content is not None:
+                self.snippets.move_to_end(key)
+                return content
+
+        content = read_snippet(record, kind)
+        with self.lock:
+            self.snippets[key] = content
+            while len(self.snippets) > self.max_snippets:
+                self.snippets.popitem(last=False)
+        return content
+
+    def prefetch(self, items):
+        """Queue (record, kind) pairs, nearest first, replacing the previous batch"""
+        with self.condition:
+            self.queue = deque(items)
+            self.condition.notify()
+
+    def cancel(self):
+        with self.condition:
+            self.queue.clear()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                record, kind = self.queue.popleft()
+
+            # Yield to whatever the user is looking at right now
+            self.thumbnails.wait_idle()
+            if not self.running:
+                return
+
+            try:
+                if kind == "image":
+                    self.thumbnails.thumbnail(record)
+                else:
+                    self.snippet(record, kind)
+            except Exception as e:
+                logger.debug(f"Prefetch of {record['path']} failed: {str(e)}")
+
+    def shutdown(self):
+        with self.condition:
+            self.running = False
+            self.queue.clear()
+            self.condition.notify()
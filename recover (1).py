@@ -1,4 +1,5 @@
 import os
+import sys
 import shutil
 import threading
 import tkinter as tk
@@ -6,7 +7,12 @@ from tkinter import ttk, filedialog, messagebox
 import psutil
 from datetime import datetime
 from PIL import Image, ImageTk
-import time
+
+# The scan engine is shared with the front-ends in "r2, r5best", next to
+# the real file even when this script is run through a symlink
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "r2, r5best"))
+from scan_engine import Scanner
+from progress import ProgressEstimator
 
 class RecoveryApp:
     def __init__(self, root):
@@ -167,28 +173,40 @@ class RecoveryApp:
         }
         selected_exts = exts.get(self.selected_category.get(), None)
         self.files = []
-        total_files = 0
-        for root_dir, _, files in os.walk(drive):
-            if self.stop_scan:
-                break
-            folder_node = self.folder_tree.insert("", "end", text=root_dir, values=[root_dir], open=False)
-            total_files += len(files)
-            for idx, file in enumerate(files):
-                if self.stop_scan:
-                    break
-                if selected_exts and not any(file.lower().endswith(ext) for ext in selected_exts):
-                    continue
-                path = os.path.join(root_dir, file)
-                size = self.get_file_size(path)
-                self.files.append((file, path, size, "Good", root_dir))
-                self.file_table.insert("", "end", values=(file, path, size, "Good"))
-
-                # Update progress
-                self.scan_progress.set((idx + 1) / total_files * 100)
-                self.root.update_idletasks()
-                
-            # Simulate delay
-            time.sleep(0.1)
+
+        # Used inodes of the volume say how much there is to walk
+        estimator = ProgressEstimator.for_volume(drive)
+        directories = 0
+
+        def add_folder(root_dir, walked):
+            nonlocal directories
+            directories += 1
+            estimator.update(items=walked + directories)
+            if estimator.fraction() is not None:
+                self.scan_progress.set(estimator.fraction() * 100)
+            self.folder_tree.insert("", "end", text=root_dir, values=[root_dir], open=False)
+
+        def add_file(result):
+            size = self.get_file_size(result.path)
+            self.files.append((result.name, result.path, size, result.status, result.folder))
+            self.file_table.insert("", "end", values=(result.name, result.path, size, result.status))
+            self.root.update_idletasks()
+
+        scanner = Scanner(
+            drive,
+            file_types=selected_exts,
+            max_file_size=None,
+            check_integrity=False,
+            detect_types=False,
+            perceptual_hash=False,
+            keep_unreadable=True,
+            stop=lambda: self.stop_scan,
+            on_directory=add_folder,
+            on_result=add_file
+        )
+        scanner.run()
+        if not self.stop_scan:
+            self.scan_progress.set(100)
 
     def filter_by_folder(self, event):
         selection = self.folder_tree.selection()
@@ -1,4 +1,5 @@
 import os
+import sys
 import shutil
 import threading
 import tkinter as tk
@@ -7,6 +8,11 @@ import psutil
 from datetime import datetime
 from PIL import Image, ImageTk
 
+# The scan engine is shared with the front-ends in "r2, r5best", next to
+# the real file even when this script is run through a symlink
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "r2, r5best"))
+from scan_engine import Scanner
+
 class RecoveryApp:
     def __init__(self, root):
         self.root = root
@@ -146,19 +152,28 @@ class RecoveryApp:
         }
         selected_exts = exts.get(self.selected_category.get(), None)
         self.files = []
-        for root_dir, _, files in os.walk(drive):
-            if self.stop_scan:
-                break
-            folder_node = self.folder_tree.insert("", "end", text=root_dir, values=[root_dir], open=False)
-            for file in files:
-                if self.stop_scan:
-                    break
-                if selected_exts and not any(file.lower().endswith(ext) for ext in selected_exts):
-                    continue
-                path = os.path.join(root_dir, file)
-                size = self.get_file_size(path)
-                self.files.append((file, path, size, "Good", root_dir))
-                self.file_table.insert("", "end", values=(file, path, size, "Good"))
+
+        def add_folder(root_dir, walked):
+            self.folder_tree.insert("", "end", text=root_dir, values=[root_dir], open=False)
+
+        def add_file(result):
+            size = self.get_file_size(result.path)
+            self.files.append((result.name, result.path, size, result.status, result.folder))
+            self.file_table.insert("", "end", values=(result.name, result.path, size, result.status))
+
+        scanner = Scanner(
+            drive,
+            file_types=selected_exts,
+            max_file_size=None,
+            check_integrity=False,
+            detect_types=False,
+            perceptual_hash=False,
+            keep_unreadable=True,
+            stop=lambda: self.stop_scan,
+            on_directory=add_folder,
+            on_result=add_file
+        )
+        scanner.run()
 
     def filter_by_folder(self, event):
         selection = self.folder_tree.selection()